@@ -1,63 +1,279 @@
 import numpy as np
 import random
+from q_table import DenseQTable
 
 class QLearningAgent:
-    def __init__(self, action_space, learning_rate=0.1, discount_factor=0.95, epsilon=0.1):
+    def __init__(self, action_space, learning_rate=0.1, discount_factor=0.95, epsilon=0.1, backend="dict", default_q_value=4,
+                 replay=None, replay_ratio=4, replay_batch_size=64):
+        """
+        :param backend: "dict" keys Q-values by (state, action) tuples; "dense" stores them in a DenseQTable.
+        :param default_q_value: Q-value of state-action pairs that have not been updated yet.
+        :param replay: ReplayBuffer that remember() stores transitions in; needs the dense backend.
+        :param replay_ratio: Replayed transitions per remembered one, applied in batches of replay_batch_size.
+        """
         self.action_space = action_space
         self.learning_rate = learning_rate
         self.discount_factor = discount_factor
         self.epsilon = epsilon
-        self.q_table = {}
+        self.default_q_value = default_q_value
+        self.dense = backend == "dense"
+        self.q_table = DenseQTable(len(action_space), default_q_value) if self.dense else {}
+        if replay is not None and not self.dense:
+            raise ValueError("Experience replay needs the dense Q-table backend")
+        self.replay = replay
+        self.replay_ratio = replay_ratio
+        self.replay_batch_size = replay_batch_size
+        self.replay_credit = 0.0
+
+    def load_q_table(self, q_table):
+        """Adopt a saved table, converting a pickled dict table when the dense backend is in use."""
+        if self.dense and isinstance(q_table, dict):
+            q_table = DenseQTable.from_dict(q_table, len(self.action_space), self.default_q_value)
+        self.q_table = q_table
         
     def get_q_value(self, state, action):
-        return self.q_table.get((state, action), 4)
+        return self.q_table.get((state, action), self.default_q_value)
 
     def choose_action(self, state):
         if random.uniform(0, 1) < self.epsilon:
             return random.choice(self.action_space)
+        elif self.dense:
+            return self.action_space[self.q_table.best_action(state)]
         else:
             q_values = [self.get_q_value(state, action) for action in self.action_space]
             return self.action_space[np.argmax(q_values)]
         
     def update_q_value(self, state, action, reward, next_state):
+        if self.dense:
+            # Actions double as column indices, as they do in the environments
+            table = self.q_table
+            row, next_row = table.state_index(state), table.state_index(next_state)
+            current_q = table.values[row, action]
+            next_max_q = table.values[next_row].max()
+            table.values[row, action] = current_q + self.learning_rate * (reward + self.discount_factor * next_max_q - current_q)
+            table.mark(row)
+            return
         current_q = self.get_q_value(state, action)
         next_max_q = max([self.get_q_value(next_state, a) for a in self.action_space])
         new_q = current_q + self.learning_rate * (reward + self.discount_factor * next_max_q - current_q)
         self.q_table[(state, action)] = new_q
 
+    def remember(self, state, action, reward, next_state, done):
+        """
+        Store a transition in the replay buffer and replay stored ones.
+
+        Every call earns replay_ratio replayed transitions; they are spent as whole
+        batches once the buffer holds at least one batch, each a single vectorised update.
+        """
+        if self.replay is None:
+            return
+        table = self.q_table
+        self.replay.add(table.state_index(state), action, reward, table.state_index(next_state), done)
+        if len(self.replay) < self.replay_batch_size:
+            return
+        self.replay_credit += self.replay_ratio
+        while self.replay_credit >= self.replay_batch_size:
+            self.replay_credit -= self.replay_batch_size
+            slots, states, actions, rewards, next_states, dones, weights = self.replay.sample(self.replay_batch_size)
+            td_errors = table.update(
+                states, actions, rewards, next_states, self.learning_rate, self.discount_factor, dones, weights
+            )
+            self.replay.update_priorities(slots, td_errors)
+
 class ParallelQLearningAgent:
-    def __init__(self, action_space, num_agents, learning_rate=0.1, discount_factor=0.95, epsilon=1.0):
-        self.action_space = action_space
+    """
+    Q-learning for a whole population of cars sharing one base table of Q-values.
+
+    States are registered on first sight and get a row in the base (states x actions)
+    array, which only spans visited states and grows by doubling. Agents read the base
+    through copy-on-write overlays: the first time an agent writes a row, the row is
+    copied into a delta buffer that only this agent sees. clone_best_q_table folds the
+    winner's overlay into the base and drops every overlay, so cloning costs as much as
+    the winner's writes since the last clone, not agents x table size, and population
+    memory is the base plus one episode's worth of deltas. choose_actions and
+    update_q_values are each a handful of vectorised operations over the population.
+    """
+
+    def __init__(self, action_space, num_agents, learning_rate=0.1, discount_factor=0.95, epsilon=1.0,
+                 shared_table=False, initial_capacity=1024, seed=None):
+        """
+        :param shared_table: Give every agent the same table on purpose; all writes then go straight to the base.
+        :param initial_capacity: Number of state rows (and of delta rows) allocated up front.
+        """
+        self.action_space = np.asarray(action_space)
         self.num_agents = num_agents
         self.learning_rate = learning_rate
         self.discount_factor = discount_factor
         self.epsilon = epsilon
-        self.q_tables = [{}] * num_agents
-
-    def choose_actions(self, states):
-        actions = []
-        for state, q_table in zip(states, self.q_tables):
-            if random.random() < self.epsilon:
-                actions.append(random.choice(self.action_space))
-            else:
-                if state in q_table:
-                    actions.append(max(self.action_space, key=lambda a: q_table[state].get(a, 4)))
-                else:
-                    actions.append(random.choice(self.action_space))
-        return actions
-    
-    def update_q_values(self, states, actions, rewards, next_states):
-        for i, (state, action, reward, next_state) in enumerate(zip(states, actions, rewards, next_states)):
-            if state not in self.q_tables[i]:
-                self.q_tables[i][state] = {a: 0 for a in self.action_space}
-            if next_state not in self.q_tables[i]:
-                self.q_tables[i][next_state] = {a: 0 for a in self.action_space}
-            
-            next_max = max(self.q_tables[i][next_state].values())
-            self.q_tables[i][state][action] += self.learning_rate * (
-                reward + self.discount_factor * next_max - self.q_tables[i][state][action]
-            )
+        self.shared_table = shared_table
+        self.rng = np.random.default_rng(seed)
+        self.state_ids = {}
+        self.q_values = np.zeros((initial_capacity, len(action_space)), dtype=np.float32)
+        # Agents act randomly in states their table has never been updated for
+        self.visited = np.zeros(initial_capacity, dtype=bool)
+
+        self.initial_delta_capacity = initial_capacity
+        self.delta_values = np.zeros((initial_capacity, len(action_space)), dtype=np.float32)
+        self.delta_visited = np.zeros(initial_capacity, dtype=bool)
+        self.delta_rows = np.zeros(initial_capacity, dtype=np.int64)
+        self.delta_agents = np.zeros(initial_capacity, dtype=np.int64)
+        self.delta_count = 0
+        # (agent * stride + row) -> delta slot; the stride only has to exceed any row index
+        self.delta_slots = {}
+        self.stride = 1 << 40
+
+    def lookup_states(self, states, register=False):
+        """Row of every state, registering new ones if `register` is set and marking unknown ones -1."""
+        if register:
+            for state in states:
+                if state not in self.state_ids:
+                    self.state_ids[state] = len(self.state_ids)
+            self.reserve(len(self.state_ids))
+        return np.fromiter((self.state_ids.get(state, -1) for state in states), dtype=np.int64, count=len(states))
+
+    def reserve(self, num_states):
+        capacity = self.q_values.shape[0]
+        if num_states <= capacity:
+            return
+        while capacity < num_states:
+            capacity *= 2
+        q_values = np.zeros((capacity, self.q_values.shape[1]), dtype=np.float32)
+        q_values[:self.q_values.shape[0]] = self.q_values
+        visited = np.zeros(capacity, dtype=bool)
+        visited[:self.visited.shape[0]] = self.visited
+        self.q_values, self.visited = q_values, visited
+
+    def read(self, agent_ids, rows):
+        """Q-values and visited flags the given agents see for the given rows."""
+        if self.shared_table:
+            return self.q_values[rows], self.visited[rows]
+        keys = (np.asarray(agent_ids, dtype=np.int64) * self.stride + rows).tolist()
+        slots = np.fromiter((self.delta_slots.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+        own = slots >= 0
+        values = self.q_values[rows]
+        visited = self.visited[rows]
+        values[own] = self.delta_values[slots[own]]
+        visited[own] = self.delta_visited[slots[own]]
+        return values, visited
+
+    def writable(self, agent_ids, rows):
+        """
+        Copy-on-write: give each (agent, row) its own delta slot, copied from the base on first write.
+        :return: (values array, visited array, indices into both) to write through.
+        """
+        if self.shared_table:
+            return self.q_values, self.visited, rows
+        agent_ids = np.asarray(agent_ids, dtype=np.int64)
+        keys = (agent_ids * self.stride + rows).tolist()
+        slots = np.fromiter((self.delta_slots.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+        missing = np.flatnonzero(slots < 0)
+        if len(missing):
+            created = []
+            for i in missing.tolist():
+                # The same (agent, row) can appear twice in a batch, e.g. as state and next state
+                slot = self.delta_slots.get(keys[i])
+                if slot is None:
+                    slot = self.delta_count + len(created)
+                    self.delta_slots[keys[i]] = slot
+                    created.append(i)
+                slots[i] = slot
+            self.add_deltas(agent_ids[created], rows[created])
+        return self.delta_values, self.delta_visited, slots
+
+    def add_deltas(self, agent_ids, rows):
+        """Append copies of the base rows as new deltas of the given agents."""
+        start, end = self.delta_count, self.delta_count + len(rows)
+        capacity = len(self.delta_rows)
+        if end > capacity:
+            while capacity < end:
+                capacity *= 2
+            self.resize_deltas(capacity)
+        self.delta_values[start:end] = self.q_values[rows]
+        self.delta_visited[start:end] = self.visited[rows]
+        self.delta_rows[start:end] = rows
+        self.delta_agents[start:end] = agent_ids
+        self.delta_count = end
+
+    def resize_deltas(self, capacity):
+        used = self.delta_count
+        delta_values = np.zeros((capacity, self.delta_values.shape[1]), dtype=np.float32)
+        delta_visited = np.zeros(capacity, dtype=bool)
+        delta_rows = np.zeros(capacity, dtype=np.int64)
+        delta_agents = np.zeros(capacity, dtype=np.int64)
+        delta_values[:used] = self.delta_values[:used]
+        delta_visited[:used] = self.delta_visited[:used]
+        delta_rows[:used] = self.delta_rows[:used]
+        delta_agents[:used] = self.delta_agents[:used]
+        self.delta_values, self.delta_visited = delta_values, delta_visited
+        self.delta_rows, self.delta_agents = delta_rows, delta_agents
+
+    def choose_actions(self, states, agent_ids=None):
+        """
+        Epsilon-greedy action for every state.
+        :param agent_ids: Agent acting in each state, e.g. env.active_cars; defaults to 0..len(states)-1.
+        """
+        agent_ids = np.arange(len(states)) if agent_ids is None else np.asarray(agent_ids)
+        rows = self.lookup_states(states)
+        known = rows >= 0
+        values, visited = self.read(agent_ids[known], rows[known])
+        greedy = np.zeros(len(states), dtype=bool)
+        greedy[known] = visited
+        greedy &= self.rng.random(len(states)) >= self.epsilon
+
+        choices = self.rng.integers(len(self.action_space), size=len(states))
+        choices[greedy] = values[greedy[known]].argmax(axis=1)
+        return self.action_space[choices].tolist()
+
+    def update_q_values(self, states, actions, rewards, next_states, agent_ids=None):
+        """
+        One-step Q-learning update for every agent's transition at once.
+
+        With a shared table, agents that hit the same (state, action) in one call
+        overwrite each other and the last one wins.
+        """
+        agent_ids = np.arange(len(states)) if agent_ids is None else np.asarray(agent_ids)
+        rows = self.lookup_states(states, register=True)
+        next_rows = self.lookup_states(next_states, register=True)
+        columns = np.searchsorted(self.action_space, actions)
+        # One call for both, since making room for new deltas may reallocate the buffers
+        values, visited, slots = self.writable(np.concatenate([agent_ids, agent_ids]), np.concatenate([rows, next_rows]))
+        row_slots, next_slots = slots[:len(rows)], slots[len(rows):]
+        visited[row_slots] = True
+        visited[next_slots] = True
+
+        next_max = values[next_slots].max(axis=1)
+        current = values[row_slots, columns]
+        target = np.asarray(rewards, dtype=np.float32) + self.discount_factor * next_max
+        values[row_slots, columns] = current + self.learning_rate * (target - current)
+
+    def agent_table(self, agent_id):
+        """Dense copy of one agent's (states x actions) Q-values and visited flags, for inspection."""
+        values, visited = self.q_values.copy(), self.visited.copy()
+        if not self.shared_table:
+            slots = self.agent_deltas(agent_id)
+            values[self.delta_rows[slots]] = self.delta_values[slots]
+            visited[self.delta_rows[slots]] = self.delta_visited[slots]
+        return values[:len(self.state_ids)], visited[:len(self.state_ids)]
+
+    def agent_deltas(self, agent_id):
+        return np.flatnonzero(self.delta_agents[:self.delta_count] == agent_id)
 
     def clone_best_q_table(self, best_index):
-        best_q_table = self.q_tables[best_index]
-        self.q_tables = [best_q_table.copy() for _ in range(self.num_agents)]
\ No newline at end of file
+        """Make every agent a copy of the best one: fold its overlay into the base, then compact."""
+        if self.shared_table:
+            return
+        slots = self.agent_deltas(best_index)
+        self.q_values[self.delta_rows[slots]] = self.delta_values[slots]
+        self.visited[self.delta_rows[slots]] = self.delta_visited[slots]
+        self.compact()
+
+    def compact(self):
+        """
+        Drop every overlay. The delta buffer is kept for the next episode unless it grew
+        to more than four times what the last episode needed, then it shrinks back.
+        """
+        capacity = max(self.initial_delta_capacity, 2 * self.delta_count)
+        self.delta_slots = {}
+        self.delta_count = 0
+        if len(self.delta_rows) > 4 * capacity:
+            self.resize_deltas(capacity)
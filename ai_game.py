@@ -1,172 +1,181 @@
-import pygame
-from pygame.math import Vector2
-import random
 import math
-from game_utils import resize_images_to_largest, scale_image
+from functools import cached_property
+from game_utils import resize_images_to_largest, scale_image, CarSprite, RotationCache
+from sensors import RaySensor, SENSOR_ANGLES
+from sensor_table import load_sensor_table
+from progress_map import load_progress_map
+from track_bundle import load_track
+from collision import CollisionChecker, OrientedBoxCollider
+from physics import CarPhysics, CarState
+import config
+import pygame
+
+TRACK_NAME = "bahrain"
+TRACK_SOURCES = ("assets/grass.jpg", "assets/bahrain_track.png", "assets/bahrain_track_border.png", "assets/finish.png")
+TRACK_METADATA = {"finish_position": (480, 720), "start_position": (520, 740), "start_angle": 270}
+CAR_IMAGE_PATH = "assets/red-car.png"
+
+
+class GameContext:
+    """
+    Track and sprite assets, each built the first time it is used.
+
+    Physics only touches the compiled masks and the car sprite, so environments,
+    workers and tests never decode the background images or need a display.
+    """
+
+    def __init__(self, name=TRACK_NAME, sources=TRACK_SOURCES, metadata=TRACK_METADATA):
+        self.name = name
+        self.sources = sources
+        self.metadata = metadata
+
+    @cached_property
+    def track_bundle(self):
+        # Masks and metadata come from the compiled bundle in cache/, rebuilt whenever a source image changes
+        return load_track(self.name, *self.sources, self.metadata)
+
+    @cached_property
+    def track_border_mask(self):
+        return self.track_bundle.border_mask
+
+    @cached_property
+    def finish_mask(self):
+        return self.track_bundle.finish_mask
+
+    @cached_property
+    def track_mask(self):
+        return self.track_bundle.track_mask
+
+    @cached_property
+    def grass_mask(self):
+        return self.track_bundle.grass_mask
+
+    @cached_property
+    def finish_position(self):
+        return self.track_bundle.finish_position
+
+    @cached_property
+    def start_position(self):
+        return self.track_bundle.start_position
+
+    @cached_property
+    def start_angle(self):
+        return self.track_bundle.start_angle
 
-pygame.init()
+    @cached_property
+    def width(self):
+        return self.track_bundle.width
 
-GRASS, TRACK, TRACK_BORDER = resize_images_to_largest(
-    ["assets/grass.jpg", "assets/bahrain_track.png", "assets/bahrain_track_border.png"]
-)
+    @cached_property
+    def height(self):
+        return self.track_bundle.height
 
-TRACK_BORDER_MASK = pygame.mask.from_surface(TRACK_BORDER)
+    @cached_property
+    def background_images(self):
+        return resize_images_to_largest(list(self.sources[:3]))
 
-FINISH = pygame.image.load("assets/finish.png")
-FINISH_MASK = pygame.mask.from_surface(FINISH)
-FINISH_POSITION = (480, 720)
+    @cached_property
+    def grass(self):
+        return self.background_images[0]
 
-CAR = scale_image(pygame.image.load("assets/red-car.png"), 0.5)
+    @cached_property
+    def track(self):
+        return self.background_images[1]
 
-WIDTH, HEIGHT = TRACK.get_width(), TRACK.get_height()
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("AI Playable Game")
-TRACK_MASK = pygame.mask.from_surface(TRACK)
-GRASS_MASK = pygame.mask.from_surface(GRASS)
+    @cached_property
+    def track_border(self):
+        return self.background_images[2]
 
-for x in range(GRASS_MASK.get_size()[0]):
-    for y in range(GRASS_MASK.get_size()[1]):
-        if TRACK_MASK.get_at((x, y)):
-            GRASS_MASK.set_at((x, y), 0)
+    @cached_property
+    def finish(self):
+        return pygame.image.load(self.sources[3])
 
+    @cached_property
+    def car(self):
+        return scale_image(pygame.image.load(CAR_IMAGE_PATH), 0.5)
 
-class Car:
-    def __init__(self, max_velocity, rotation_velocity):
-        self.original_image = CAR  
+    @cached_property
+    def car_rotations(self):
+        return RotationCache(self.car)
+
+    @cached_property
+    def border_sensor(self):
+        sensor = RaySensor(self.track_border_mask, max(self.width, self.height))
+        if config.USE_SENSOR_TABLE:
+            sensor = load_sensor_table(sensor, self.name)
+        return sensor
+
+    @cached_property
+    def progress_map(self):
+        return load_progress_map(self)
+
+    @cached_property
+    def collision_checker(self):
+        return CollisionChecker(self)
+
+    @cached_property
+    def box_collider(self):
+        return OrientedBoxCollider(self)
+
+
+_context = None
+
+
+def get_context():
+    """The process-wide GameContext, created on first use."""
+    global _context
+    if _context is None:
+        _context = GameContext()
+    return _context
+
+
+def __getattr__(name):
+    """Keep the old module-level constants (TRACK, GRASS_MASK, WIDTH, ...) working by reading them from the context."""
+    if name.isupper() and isinstance(getattr(GameContext, name.lower(), None), cached_property):
+        return getattr(get_context(), name.lower())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class Car(CarSprite):
+    """A car on the context's track, with ray sensors for the AI environments."""
+
+    def __init__(self, max_velocity, rotation_velocity, context=None):
+        self.context = context or get_context()
+        self.original_image = self.context.car
         self.image = self.original_image
-        self.mask = pygame.mask.from_surface(self.image)
-        self.max_velocity = max_velocity
-        self.velocity = 0
-        self.rotation_velocity = rotation_velocity
-        self.initial_angle = 270
-        self.angle = self.initial_angle
-        self.START_POSITION = (520, 740)
-        self.x, self.y = self.START_POSITION
-        self.acceleration = 0.1
-        self.previous_position = self.START_POSITION
-        self.stuck_steps = 0
-        self.rotated_image = pygame.transform.rotate(self.image, self.angle)
-        self.rect = self.rotated_image.get_rect(center=(self.x, self.y))
-        self.min_velocity_for_rotation = 0.1
-        self.distance_traveled = 0
-
-    def rotate(self, left=False, right=False):
-        """Rotate the car image and update the mask."""
-        if abs(self.velocity) >= self.min_velocity_for_rotation:
-            if self.velocity > 0:
-                if left:
-                    self.angle += self.rotation_velocity
-                elif right:
-                    self.angle -= self.rotation_velocity
-            else:
-                if left:
-                    self.angle -= self.rotation_velocity
-                elif right:
-                    self.angle += self.rotation_velocity
-
-            self.rotated_image = pygame.transform.rotate(self.original_image, self.angle)
-            self.rect = self.rotated_image.get_rect(center=(self.x, self.y))
-            self.mask = pygame.mask.from_surface(self.rotated_image)
-
-    def draw(self, win):
-        """Draw the rotated car image onto the window."""
-        win.blit(self.rotated_image, self.rect.topleft)
-
-    def move_forward(self):
-        """Accelerate the car forward."""
-        if self.velocity < 0:
-            self.velocity = min(self.velocity + self.acceleration * 2, 0)
-        else:
-            self.velocity = min(self.velocity + self.acceleration, self.max_velocity)
-        self.move()
-
-    def move_backward(self):
-        """Accelerate the car backward."""
-        if self.velocity > 0:
-            self.velocity = max(self.velocity - self.acceleration * 2, 0)
-        else:
-            self.velocity = max(self.velocity - self.acceleration, -self.max_velocity / 2)
-        self.move()
-
-    def move(self):
-        """Update the car's position based on its velocity and angle."""
-        radians = math.radians(self.angle)
-        vertical_velocity = math.cos(radians) * self.velocity
-        horizontal_velocity = math.sin(radians) * self.velocity
-
-        new_y = self.y - vertical_velocity
-        new_x = self.x - horizontal_velocity
-
-        if self.previous_position == (self.x, self.y):
-            self.stuck_steps += 1 
-        else:
-            self.stuck_steps = 0
-
-        self.previous_position = (self.x, self.y)
-        
-        self.distance_this_frame = math.sqrt((new_x - self.x)**2 + (new_y - self.y)**2)
-        self.distance_traveled += self.distance_this_frame if self.velocity > 0 else -self.distance_this_frame
-
-        self.y = new_y
-        self.x = new_x
-        self.rect.center = (self.x, self.y)
-
-    def reduce_speed(self):
-        """Gradually reduce the car's speed when not accelerating."""
-        if self.velocity > 0:
-            self.velocity = max(self.velocity - self.acceleration / 2, 0)
-        elif self.velocity < 0:
-            self.velocity = min(self.velocity + self.acceleration / 2, 0)
-        self.move()
-
-    def collide(self, mask, x=0, y=0):
-        """
-        Check for collision with another mask.
-        :param mask: The mask to check collision against.
-        :param x: X position of the other mask.
-        :param y: Y position of the other mask.
-        :return: Point of intersection or None.
-        """
-        offset_x = int(self.rect.left - x)
-        offset_y = int(self.rect.top - y)
-        point_of_intersection = mask.overlap(self.mask, (offset_x, offset_y))
-        return point_of_intersection
-
-    def handle_collision(self):
-        """Handle collision by reverting to previous position and adjusting velocity and angle."""
-        self.velocity *= 0.5 
-
-        self.rotated_image = pygame.transform.rotate(self.original_image, self.angle)
-        self.rect = self.rotated_image.get_rect(center=(self.x, self.y))
-        self.mask = pygame.mask.from_surface(self.rotated_image)
-
-    def bounce(self):
-        """Reverse the car's velocity."""
-        self.velocity *= -1
-        self.move()
-
-    def reset(self):
-        """Reset the car to the starting position and state."""
-        self.x, self.y = self.START_POSITION
-        self.angle = 270
-        self.velocity = 0
-        self.stuck_steps = 0
-        self.distance_traveled = 0
-        self.rotated_image = pygame.transform.rotate(self.original_image, self.angle)
-        self.rect = self.rotated_image.get_rect(center=(self.x, self.y))
-        self.mask = pygame.mask.from_surface(self.rotated_image)
+        start_position, start_angle = self.context.start_position, self.context.start_angle
+        super().__init__(
+            CarPhysics(max_velocity, rotation_velocity, min_velocity_for_rotation=0.1),
+            CarState(*start_position, start_angle),
+            self.context.car_rotations,
+            start_position,
+            start_angle,
+        )
+        # Lap progress as of the last progress reward, kept up to date by the environments
+        self.progress = -1.0
+
+    def track_progress(self):
+        """Arc length along the lap at the car's centre, -1 off the track (see progress_map.py)."""
+        return self.context.progress_map.lookup(*self.state.center)
 
     def get_distances_to_border(self, track_border_mask):
+        if track_border_mask is self.context.track_border_mask:
+            return self.context.border_sensor.cast([self.state.center], SENSOR_ANGLES)[0].tolist()
         distances = []
-        for angle in range(0, 360, 45):
+        for angle in SENSOR_ANGLES:
             distance = self.ray_cast(track_border_mask, angle)
             distances.append(distance)
         return distances
 
     def ray_cast(self, mask, angle):
+        if mask is self.context.track_border_mask:
+            return self.context.border_sensor.trace(
+                *self.state.center, math.cos(math.radians(angle)), math.sin(math.radians(angle))
+            )
+
         length = 0
-        max_length = max(TRACK.get_width(), TRACK.get_height())
-        x, y = self.rect.center
+        max_length = max(self.context.width, self.context.height)
+        x, y = self.state.center
 
         while length < max_length:
             length += 1
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pygame
+import config
+from game_utils import init_pygame
+
+ACTION_SPACE = [0, 1, 2, 3, 4]
+POPULATION_SIZES = (10, 100, 1000)
+QUICK_POPULATION_SIZES = (10, 100)
+GROUPS = ("car", "collision", "environment", "agent", "episode")
+
+
+def measure(fn, min_time=0.2, repeat=5):
+    """
+    Time `fn()` and report per-call latency.
+
+    The call count is scaled until one round takes at least `min_time` seconds, then
+    `repeat` rounds are timed; the median round is reported, the fastest kept for reference.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.1))
+
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    per_call = float(np.median(rounds))
+    return {
+        "per_call_us": per_call * 1e6,
+        "best_us": min(rounds) * 1e6,
+        "calls_per_second": 1 / per_call,
+        "calls": number * repeat,
+    }
+
+
+def car_benchmarks(context, min_time, repeat):
+    from ai_game import Car
+
+    car = Car(6, 4, context)
+    car.velocity = 1
+    mask = context.track_border_mask
+    return {
+        "car.ray_cast": measure(lambda: car.ray_cast(mask, 45), min_time, repeat),
+        "car.get_distances_to_border": measure(lambda: car.get_distances_to_border(mask), min_time, repeat),
+        "car.rotate": measure(lambda: car.rotate(left=True), min_time, repeat),
+        "car.collide": measure(lambda: car.collide(mask), min_time, repeat),
+    }
+
+
+def collision_benchmarks(context, sizes, min_time, repeat):
+    """Pixel-exact mask queries against the oriented-box collider, for one car and for whole populations."""
+    from ai_game import Car
+    from collision import CollisionChecker, sample_poses
+
+    checker = CollisionChecker(context, "mask")
+    collider = context.box_collider
+    x, y, angle = sample_poses(context, max(sizes))
+    car = Car(6, 4, context)
+    car.x, car.y, car.angle = float(x[0]), float(y[0]), float(angle[0])
+    results = {
+        "collision.mask": measure(lambda: checker.query_masks(car), min_time, repeat),
+        "collision.box": measure(lambda: collider.collide_one(car.x, car.y, car.angle), min_time, repeat),
+    }
+    for size in sizes:
+        results[f"collision.box.{size}"] = measure(lambda: collider.collide(x[:size], y[:size], angle[:size]), min_time, repeat)
+    return results
+
+
+def environment_benchmarks(context, min_time, repeat):
+    from environment import CarEnvironment
+
+    env = CarEnvironment(context)
+    env.reset()
+    rng = random.Random(0)
+
+    def step():
+        _, _, done = env.step(rng.choice(ACTION_SPACE))
+        if done:
+            env.reset()
+
+    return {"environment.step": measure(step, min_time, repeat)}
+
+
+def agent_benchmarks(min_time, repeat):
+    from agent import QLearningAgent
+
+    results = {}
+    rng = random.Random(0)
+    states = [
+        (rng.randrange(8),) + tuple(rng.randrange(5) for _ in range(8))
+        for _ in range(1000)
+    ]
+    for backend in ("dict", "dense"):
+        agent = QLearningAgent(ACTION_SPACE, epsilon=0.1, backend=backend, default_q_value=config.DEFAULT_Q_VALUE)
+        # Give the table a realistic number of entries before timing lookups
+        for state in states:
+            agent.update_q_value(state, rng.choice(ACTION_SPACE), rng.random(), rng.choice(states))
+        calls = iter(range(sys.maxsize))
+
+        def choose():
+            agent.choose_action(states[next(calls) % len(states)])
+
+        def update():
+            i = next(calls)
+            agent.update_q_value(states[i % len(states)], i % len(ACTION_SPACE), 1.0, states[(i + 1) % len(states)])
+
+        results[f"agent.{backend}.choose_action"] = measure(choose, min_time, repeat)
+        results[f"agent.{backend}.update_q_value"] = measure(update, min_time, repeat)
+    return results
+
+
+def run_episode(env, rng, max_steps):
+    """Play one seeded episode with random actions; returns (steps, car steps)."""
+    env.reset()
+    steps = car_steps = 0
+    while env.active_cars and steps < max_steps:
+        active = len(env.active_cars)
+        actions = rng.choice(ACTION_SPACE, size=active, p=[0.15, 0.15, 0.5, 0.1, 0.1]).tolist()
+        env.step(actions)
+        steps += 1
+        car_steps += active
+    return steps, car_steps
+
+
+def population_benchmarks(context, sizes, repeat, max_steps):
+    from environment import ParallelLearningCarEnvironment, PopulationCarEnvironment
+
+    results = {}
+    for name, cls in (("parallel", ParallelLearningCarEnvironment), ("population", PopulationCarEnvironment)):
+        for size in sizes:
+            env = cls(num_cars=size, context=context)
+            timings = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                steps, car_steps = run_episode(env, np.random.default_rng(i), max_steps)
+                timings.append((time.perf_counter() - start, steps, car_steps))
+            elapsed, steps, car_steps = sorted(timings)[len(timings) // 2]
+            results[f"episode.{name}.{size}"] = {
+                "per_call_us": elapsed / steps * 1e6,
+                "episode_seconds": elapsed,
+                "steps": steps,
+                "steps_per_second": steps / elapsed,
+                "car_steps_per_second": car_steps / elapsed,
+            }
+    return results
+
+
+def run_benchmarks(quick=False, groups=GROUPS):
+    """
+    Run the benchmarks of the given groups and build a JSON-serialisable report.
+    :param quick: Shorter timing rounds and smaller populations, for a fast sanity check.
+    """
+    from ai_game import get_context
+
+    init_pygame(headless=True)
+    context = get_context()
+    min_time, repeat = (0.05, 3) if quick else (0.2, 5)
+    sizes = QUICK_POPULATION_SIZES if quick else POPULATION_SIZES
+
+    results = {}
+    if "car" in groups:
+        results.update(car_benchmarks(context, min_time, repeat))
+    if "collision" in groups:
+        results.update(collision_benchmarks(context, sizes, min_time, repeat))
+    if "environment" in groups:
+        results.update(environment_benchmarks(context, min_time, repeat))
+    if "agent" in groups:
+        results.update(agent_benchmarks(min_time, repeat))
+    if "episode" in groups:
+        results.update(population_benchmarks(context, sizes, repeat, max_steps=500 if quick else 2000))
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.15):
+    """
+    Compare per-call latencies against a baseline report.
+    :return: List of (name, baseline us, current us, ratio, regressed) for benchmarks present in both.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["per_call_us"]
+        after = result["per_call_us"]
+        ratio = after / before
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def print_results(report):
+    for name, result in report["results"].items():
+        if "steps_per_second" in result:
+            print(f"{name:40s} {result['per_call_us']:12.1f} us/step {result['car_steps_per_second']:14.0f} car steps/s")
+        else:
+            print(f"{name:40s} {result['per_call_us']:12.2f} us/call {result['calls_per_second']:14.0f} calls/s")
+
+
+def print_comparison(rows, threshold):
+    for name, before, after, ratio, regressed in rows:
+        flag = "REGRESSION" if regressed else ("faster" if ratio < 1 - threshold else "")
+        print(f"{name:40s} {before:12.2f} -> {after:12.2f} us  x{ratio:5.2f}  {flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulation and learning hot paths headlessly.")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON report")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored JSON report")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="relative slowdown counted as a regression (0.15 = 15%%)")
+    parser.add_argument("--quick", action="store_true", help="shorter rounds and smaller populations")
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=GROUPS, help="benchmark groups to run")
+    args = parser.parse_args()
+
+    # Read the baseline up front: it may well be the file this run would otherwise overwrite
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run_benchmarks(quick=args.quick, groups=args.groups)
+    print_results(report)
+    if args.compare and os.path.abspath(args.compare) == os.path.abspath(args.output):
+        print(f"Not overwriting the baseline {args.output}; pass a different --output to keep this run")
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if baseline is not None:
+        rows = compare(report, baseline, args.threshold)
+        print_comparison(rows, args.threshold)
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,215 @@
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+from datetime import datetime
+import numpy as np
+from q_table import DenseQTable, STATE_BINS
+
+CHECKPOINT_VERSION = 2
+# Plain .npy files rather than an .npz archive, so loads can memory-map them
+ROWS_FILE = "q_rows.npy"
+VALUES_FILE = "q_row_values.npy"
+# Version 1 checkpoints stored the whole dense table
+LEGACY_VALUES_FILE = "q_values.npy"
+STATE_FILE = "training_state.json"
+REPLAY_FILE = "replay.npz"
+
+
+def checkpoint_path(directory="models", prefix="checkpoint"):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(directory, f"{prefix}_{timestamp}")
+
+
+def latest_checkpoint(directory="models", prefix="checkpoint"):
+    """Most recent checkpoint directory under `directory`, or None."""
+    if not os.path.isdir(directory):
+        return None
+    paths = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith(prefix + "_") and os.path.isfile(os.path.join(directory, name, STATE_FILE))
+    ]
+    return max(paths, key=lambda path: os.path.getmtime(os.path.join(path, STATE_FILE))) if paths else None
+
+
+def snapshot_agent(agent, episode, rewards):
+    """
+    Copy everything a checkpoint needs out of a QLearningAgent, so training can carry on
+    while the copy is written. Dense tables only copy the rows the agent has written; dict
+    tables are only copied here and converted on the writer. The replay buffer, if any,
+    is copied with its sampling state.
+    """
+    if agent.dense:
+        rows = agent.q_table.touched_rows()
+        q_table = (rows, agent.q_table.values[rows])
+    else:
+        q_table = dict(agent.q_table)
+    replay_arrays, replay_state = agent.replay.snapshot() if agent.replay is not None else (None, None)
+    return {
+        "q_table": q_table,
+        "replay": replay_arrays,
+        "state": {
+            "version": CHECKPOINT_VERSION,
+            "backend": "dense" if agent.dense else "dict",
+            "num_actions": len(agent.action_space),
+            "default_q_value": agent.default_q_value,
+            "epsilon": agent.epsilon,
+            "episode": episode,
+            "rewards": [float(reward) for reward in rewards],
+            "random_state": random.getstate(),
+            "replay": replay_state,
+            "replay_credit": agent.replay_credit,
+        },
+    }
+
+
+def dict_rows(q_table, num_actions, default_q_value):
+    """
+    (rows, values) of a {(state, action): value} table: the sorted DenseQTable rows it
+    has entries in and those rows in full, default_q_value where an action has no entry.
+    """
+    # Dict tables hold Python floats; keep them as float64 so a resumed run continues bit for bit
+    if not q_table:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, num_actions), dtype=np.float64)
+    keys = list(q_table)
+    states = np.array([key[0] for key in keys], dtype=np.int64).reshape(-1, len(STATE_BINS))
+    rows, positions = np.unique(np.ravel_multi_index(states.T, STATE_BINS), return_inverse=True)
+    values = np.full((len(rows), num_actions), default_q_value, dtype=np.float64)
+    values[positions, [key[1] for key in keys]] = [q_table[key] for key in keys]
+    return rows, values
+
+
+def write_checkpoint(snapshot, path):
+    """
+    Write a snapshot as `path`/q_rows.npy, `path`/q_row_values.npy and `path`/training_state.json.
+
+    Only the table's written rows are stored, as a (rows, values) pair, so a checkpoint
+    grows with what the agent has visited rather than with the state space.
+    The replay buffer, if any, goes to `path`/replay.npz. Files go to a temporary
+    directory that is renamed into place, so a checkpoint either exists completely or
+    not at all.
+    """
+    q_table = snapshot["q_table"]
+    state = snapshot["state"]
+    if isinstance(q_table, dict):
+        rows, values = dict_rows(q_table, state["num_actions"], state["default_q_value"])
+    else:
+        rows, values = q_table
+    state = dict(state, state_bins=list(STATE_BINS))
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, ROWS_FILE), rows)
+    np.save(os.path.join(tmp_path, VALUES_FILE), values)
+    if snapshot["replay"] is not None:
+        np.savez(os.path.join(tmp_path, REPLAY_FILE), **snapshot["replay"])
+    with open(os.path.join(tmp_path, STATE_FILE), "w") as f:
+        json.dump(state, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_checkpoint(path, mmap=True):
+    """
+    Read a checkpoint directory, expanding its stored rows into a full dense table.
+    :param mmap: Memory-map the stored Q-values read-only instead of reading them into
+        memory. A version 1 checkpoint holds the whole dense table and is used as is;
+        stored rows are copied from the mapping into the expanded table.
+    :return: (DenseQTable, training state dict)
+    """
+    with open(os.path.join(path, STATE_FILE)) as f:
+        state = json.load(f)
+    if state["version"] == 1:
+        values = np.load(os.path.join(path, LEGACY_VALUES_FILE), mmap_mode="r" if mmap else None)
+        table = DenseQTable(state["num_actions"], state["default_q_value"], state["state_bins"], values=values)
+        return table, state
+    if state["version"] != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {state['version']} in {path}")
+    mmap_mode = "r" if mmap else None
+    rows = np.load(os.path.join(path, ROWS_FILE), mmap_mode=mmap_mode)
+    row_values = np.load(os.path.join(path, VALUES_FILE), mmap_mode=mmap_mode)
+    num_states = int(np.prod(state["state_bins"]))
+    values = np.full((num_states, state["num_actions"]), state["default_q_value"], dtype=row_values.dtype)
+    values[rows] = row_values
+    touched = np.zeros(num_states, dtype=bool)
+    touched[rows] = True
+    table = DenseQTable(state["num_actions"], state["default_q_value"], state["state_bins"], values=values, touched=touched)
+    return table, state
+
+
+def restore_agent(agent, path):
+    """
+    Load a checkpoint into a QLearningAgent and return its training state.
+
+    Restores the Q-values, epsilon, the `random` module state and the replay buffer,
+    so training continues with the same action choices it would have made without
+    stopping. A checkpoint without a replay buffer leaves the agent's buffer empty.
+    """
+    table, state = load_checkpoint(path, mmap=False)
+    if agent.dense:
+        agent.q_table = table
+    else:
+        agent.q_table = table.to_dict()
+    agent.epsilon = state["epsilon"]
+    version, internal_state, gauss_next = state["random_state"]
+    random.setstate((version, tuple(internal_state), gauss_next))
+    if agent.replay is not None:
+        if state.get("replay") is None:
+            print(f"{path} has no replay buffer; resuming with an empty one, so training will not "
+                  f"continue exactly as it would have without stopping")
+        else:
+            with np.load(os.path.join(path, REPLAY_FILE)) as arrays:
+                agent.replay.restore(arrays, state["replay"])
+            agent.replay_credit = state["replay_credit"]
+    return state
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoints on a background thread.
+
+    save() only takes a snapshot of the agent and queues it; the thread does the
+    conversion and file I/O. close() waits for everything queued to be written.
+    """
+
+    def __init__(self, directory="models", keep=0):
+        """
+        :param keep: Number of periodic checkpoints (the default "checkpoint" prefix) to keep;
+            once a newer one is written, the oldest this writer wrote is deleted. 0 keeps all.
+        """
+        self.directory = directory
+        self.keep = keep
+        self.pending = queue.Queue()
+        self.written = []
+        self.periodic = []
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def save(self, agent, episode, rewards, prefix="checkpoint"):
+        path = checkpoint_path(self.directory, prefix)
+        self.pending.put((snapshot_agent(agent, episode, rewards), path, prefix))
+        return path
+
+    def run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            snapshot, path, prefix = item
+            try:
+                self.written.append(write_checkpoint(snapshot, path))
+            except OSError as e:
+                print(f"Failed to write checkpoint {path}: {e}")
+                continue
+            if prefix == "checkpoint" and self.keep:
+                self.periodic.append(path)
+                while len(self.periodic) > self.keep:
+                    shutil.rmtree(self.periodic.pop(0), ignore_errors=True)
+
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
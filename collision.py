@@ -0,0 +1,281 @@
+import argparse
+import math
+import numpy as np
+import pygame
+import config
+from sensors import distance_field, mask_to_array
+
+COLLISION_MODES = ("mask", "box")
+
+
+class CollisionResult:
+    """Everything physics, reward and termination need to know about one car pose."""
+
+    def __init__(self, hit_wall, at_finish):
+        self.hit_wall = hit_wall
+        self.at_finish = at_finish
+
+
+class CollisionChecker:
+    """
+    Answers the wall and finish-line questions for a car pose in a single pass.
+
+    Before any mask overlap, the car's bounding box is tested against a clearance field
+    (Chebyshev distance to the nearest border or grass pixel) and against the finish
+    line's rect, so cars in open track skip the pixel overlaps entirely. In "box" mode
+    the context's OrientedBoxCollider answers instead, without any mask.
+    """
+
+    def __init__(self, context, mode=None):
+        self.context = context
+        self.mode = mode or config.COLLISION_MODE
+        if self.mode not in COLLISION_MODES:
+            raise ValueError(f"Unknown collision mode {self.mode!r}, expected one of {COLLISION_MODES}")
+        if self.mode == "mask":
+            # Only query_masks reads the clearance field; box mode never builds it
+            clearance = distance_field(mask_to_array(context.track_border_mask) | mask_to_array(context.grass_mask))
+            self.clearance = clearance.tobytes()
+            self.height = clearance.shape[1]
+            self.width = clearance.shape[0]
+        self.finish_rect = pygame.Rect(context.finish_position, context.finish_mask.get_size())
+        self.mask_overlaps = 0
+        self.mask_overlaps_saved = 0
+
+    def query(self, car):
+        """
+        Collide the car's current rect and mask with the walls and the finish line.
+        :return: CollisionResult for the pose.
+        """
+        if self.mode == "box":
+            hit_wall, at_finish = self.context.box_collider.collide_one(car.x, car.y, car.angle)
+            # No mask overlap at all, so every overlap the old code did is saved
+            self.mask_overlaps_saved += legacy_overlaps(hit_wall, hit_wall)
+            return CollisionResult(hit_wall, at_finish)
+        return self.query_masks(car)
+
+    def count_finish_recheck(self):
+        """Count the finish-line overlap is_done used to repeat, on a step where it would have got that far."""
+        self.mask_overlaps_saved += 1
+
+    def query_masks(self, car):
+        """Pixel-exact query with the car's rotated sprite mask; needs a "mask" mode checker."""
+        rect = car.rect
+        overlaps = 0
+        center_x, center_y = rect.center
+        half_extent = max(center_x - rect.left, rect.right - 1 - center_x, center_y - rect.top, rect.bottom - 1 - center_y)
+        inside = 0 <= center_x < self.width and 0 <= center_y < self.height
+        hit_border = hit_grass = False
+        if not inside or self.clearance[center_x * self.height + center_y] <= half_extent:
+            overlaps += 1
+            hit_border = car.collide(self.context.track_border_mask) is not None
+            if not hit_border:
+                overlaps += 1
+                hit_grass = car.collide(self.context.grass_mask) is not None
+        hit_wall = hit_border or hit_grass
+
+        at_finish = False
+        if rect.colliderect(self.finish_rect):
+            overlaps += 1
+            at_finish = car.collide(self.context.finish_mask, *self.context.finish_position) is not None
+
+        self.mask_overlaps += overlaps
+        self.mask_overlaps_saved += legacy_overlaps(hit_border, hit_wall) - overlaps
+        return CollisionResult(hit_wall, at_finish)
+
+
+def legacy_overlaps(hit_border, hit_wall):
+    """Mask overlaps step and calculate_reward cost before collision results were shared."""
+    # A step checked the walls in both step and calculate_reward, then the finish
+    # line in calculate_reward unless a wall was hit. is_done's own finish check only
+    # ran past the stuck and reward limits, so the environments count it themselves
+    # (CollisionChecker.count_finish_recheck).
+    wall_overlaps = 1 if hit_border else 2
+    return 2 * wall_overlaps + (0 if hit_wall else 1)
+
+
+class OrientedBoxCollider:
+    """
+    Collides cars modelled as oriented rectangles with the track, any number of cars at once.
+
+    The rectangle is the bounding box of the unrotated car mask. Its corners and points
+    every `spacing` pixels along its edges are turned to each car's heading and looked up
+    in a precomputed grid of wall (border or grass) and finish-line pixels, so nothing
+    depends on the rotated sprite or its mask. Cars whose centre is further from every
+    wall and finish pixel than the box reaches skip the lookup. Points off the image
+    count as free, like the part of a mask overlap that falls outside the track masks.
+    """
+
+    WALL = 1
+    FINISH = 2
+
+    def __init__(self, context, spacing=2):
+        self.context = context
+        walls = mask_to_array(context.track_border_mask) | mask_to_array(context.grass_mask)
+        grid = np.where(walls, self.WALL, 0).astype(np.uint8)
+        finish = mask_to_array(context.finish_mask)
+        left, top = context.finish_position
+        right, bottom = min(left + finish.shape[0], grid.shape[0]), min(top + finish.shape[1], grid.shape[1])
+        grid[left:right, top:bottom] |= np.where(finish[:right - left, :bottom - top], self.FINISH, 0).astype(np.uint8)
+        self.width, self.height = grid.shape
+        self.clearance = distance_field(grid > 0)
+        # A free ring around the image, where off-image points are clipped to
+        self.grid = np.pad(grid, 1, constant_values=0)
+        self.cells = self.grid.tobytes()
+        self.clearance_bytes = self.clearance.tobytes()
+
+        image = context.car
+        box = pygame.mask.from_surface(image).get_bounding_rects()
+        box = box[0].unionall(box[1:])
+        # Box edges relative to the sprite centre, which rotation keeps in place
+        self.left = box.left - image.get_width() / 2
+        self.right = box.right - image.get_width() / 2
+        self.top = box.top - image.get_height() / 2
+        self.bottom = box.bottom - image.get_height() / 2
+        self.points = self.outline(spacing)
+        self.point_list = self.points.tolist()
+        # Chebyshev pixel distance the samples can reach from the centre pixel
+        self.reach = int(np.ceil(np.hypot(self.points[:, 0], self.points[:, 1]).max())) + 1
+
+    def outline(self, spacing):
+        """(k, 2) sample points on the box edges, corners included, inset half a pixel so they land on the car's own pixels."""
+        left, right, top, bottom = self.left + 0.5, self.right - 0.5, self.top + 0.5, self.bottom - 0.5
+        xs = np.linspace(left, right, max(2, int(np.ceil((right - left) / spacing)) + 1))
+        ys = np.linspace(top, bottom, max(2, int(np.ceil((bottom - top) / spacing)) + 1))
+        edges = [
+            np.stack([xs, np.full_like(xs, top)], axis=1),
+            np.stack([xs, np.full_like(xs, bottom)], axis=1),
+            np.stack([np.full_like(ys, left), ys], axis=1)[1:-1],
+            np.stack([np.full_like(ys, right), ys], axis=1)[1:-1],
+        ]
+        return np.concatenate(edges)
+
+    def corners(self, x, y, angle):
+        """(4, 2) screen positions of the box corners of one car, for drawing or debugging."""
+        local = np.array([[self.left, self.top], [self.right, self.top], [self.right, self.bottom], [self.left, self.bottom]])
+        world_x, world_y = self.transform(local, np.array([x]), np.array([y]), np.array([angle]))
+        return np.stack([world_x[0], world_y[0]], axis=1)
+
+    @staticmethod
+    def centers(x, y):
+        """Rects are centred on the position rounded half away from zero; +0.5 moves to that pixel's centre."""
+        return np.floor(np.abs(x) + 0.5) * np.sign(x) + 0.5, np.floor(np.abs(y) + 0.5) * np.sign(y) + 0.5
+
+    def transform(self, local, x, y, angle):
+        """Screen x and y, each (n, k), of `local` box points for n cars."""
+        radians = np.radians(angle)[:, None]
+        cos, sin = np.cos(radians), np.sin(radians)
+        center_x, center_y = self.centers(x, y)
+        # pygame.transform.rotate turns counter-clockwise on screen, where y points down
+        world_x = center_x[:, None] + local[:, 0] * cos + local[:, 1] * sin
+        world_y = center_y[:, None] - local[:, 0] * sin + local[:, 1] * cos
+        return world_x, world_y
+
+    def collide(self, x, y, angle):
+        """
+        Wall and finish-line hits for cars at the given poses.
+        :return: (hit_wall, at_finish) boolean arrays, one entry per car.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        angle = np.asarray(angle, dtype=np.float64)
+        center_x, center_y = self.centers(x, y)
+        center_x, center_y = center_x.astype(np.int64), center_y.astype(np.int64)
+        inside = (center_x >= 0) & (center_x < self.width) & (center_y >= 0) & (center_y < self.height)
+        near = ~inside
+        near[inside] = self.clearance[center_x[inside], center_y[inside]] <= self.reach
+
+        hit_wall = np.zeros(len(x), dtype=bool)
+        at_finish = np.zeros(len(x), dtype=bool)
+        if near.any():
+            world_x, world_y = self.transform(self.points, x[near], y[near], angle[near])
+            xs = np.clip(np.floor(world_x).astype(np.int64) + 1, 0, self.grid.shape[0] - 1)
+            ys = np.clip(np.floor(world_y).astype(np.int64) + 1, 0, self.grid.shape[1] - 1)
+            cells = self.grid[xs, ys]
+            hit_wall[near] = (cells & self.WALL).any(axis=1)
+            at_finish[near] = (cells & self.FINISH).any(axis=1)
+        return hit_wall, at_finish
+
+    def collide_one(self, x, y, angle):
+        """collide() for a single car in plain Python, which beats NumPy's per-call overhead."""
+        center_x = math.floor(abs(x) + 0.5) * (1 if x >= 0 else -1)
+        center_y = math.floor(abs(y) + 0.5) * (1 if y >= 0 else -1)
+        if 0 <= center_x < self.width and 0 <= center_y < self.height:
+            if self.clearance_bytes[center_x * self.height + center_y] > self.reach:
+                return False, False
+        radians = math.radians(angle)
+        cos, sin = math.cos(radians), math.sin(radians)
+        # Pixel centre, plus one for the free ring around the grid
+        center_x += 1.5
+        center_y += 1.5
+        columns, rows = self.grid.shape
+        cells = self.cells
+        found = 0
+        for local_x, local_y in self.point_list:
+            column = int(center_x + local_x * cos + local_y * sin)
+            row = int(center_y - local_x * sin + local_y * cos)
+            # Anything off the grid is free, like its ring
+            if 0 <= column < columns and 0 <= row < rows:
+                found |= cells[column * rows + row]
+        return bool(found & self.WALL), bool(found & self.FINISH)
+
+
+def sample_poses(context, count, seed=0):
+    """
+    Random poses for comparing collision modes: positions on the track but within half a
+    sprite of a wall, where the modes can disagree, and any heading.
+    """
+    rng = np.random.default_rng(seed)
+    field = context.box_collider.clearance
+    near = np.argwhere((field > 0) & (field <= max(context.car.get_size()) // 2))
+    picks = near[rng.integers(len(near), size=count)]
+    x = picks[:, 0] + rng.random(count) - 0.5
+    y = picks[:, 1] + rng.random(count) - 0.5
+    angle = rng.random(count) * 360
+    return x, y, angle
+
+
+def compare_modes(context, collider, x, y, angle):
+    """
+    Agreement of an OrientedBoxCollider with the pixel-exact mask mode over the given poses.
+    :return: Dict of pose count, agreement rates and disagreement counts for walls and the finish line.
+    """
+    from ai_game import Car
+
+    car = Car(6, 4, context)
+    checker = CollisionChecker(context, "mask")
+    mask_wall = np.zeros(len(x), dtype=bool)
+    mask_finish = np.zeros(len(x), dtype=bool)
+    for i in range(len(x)):
+        car.x, car.y, car.angle = float(x[i]), float(y[i]), float(angle[i])
+        result = checker.query_masks(car)
+        mask_wall[i], mask_finish[i] = result.hit_wall, result.at_finish
+    box_wall, box_finish = collider.collide(x, y, angle)
+
+    report = {"poses": len(x)}
+    for name, mask_hits, box_hits in (("wall", mask_wall, box_wall), ("finish", mask_finish, box_finish)):
+        report[f"{name}_agreement"] = float(np.mean(mask_hits == box_hits))
+        report[f"{name}_extra_hits"] = int(np.sum(box_hits & ~mask_hits))
+        report[f"{name}_missed_hits"] = int(np.sum(mask_hits & ~box_hits))
+        report[f"{name}_mask_hits"] = int(np.sum(mask_hits))
+    return report
+
+
+if __name__ == "__main__":
+    from ai_game import get_context
+    from game_utils import init_pygame
+
+    parser = argparse.ArgumentParser(description="Measure how often box collisions agree with the pixel-exact mask collisions.")
+    parser.add_argument("--poses", type=int, default=20000, help="random poses near the walls to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spacing", type=float, default=2, help="pixels between box edge samples")
+    args = parser.parse_args()
+
+    init_pygame(headless=True)
+    context = get_context()
+    collider = OrientedBoxCollider(context, args.spacing)
+    report = compare_modes(context, collider, *sample_poses(context, args.poses, args.seed))
+    print(f"{report['poses']} poses near the walls")
+    for name in ("wall", "finish"):
+        print(f"{name:7s} agreement {report[name + '_agreement']:.2%}  "
+              f"mask hits {report[name + '_mask_hits']}  "
+              f"extra box hits {report[name + '_extra_hits']}  missed by box {report[name + '_missed_hits']}")
@@ -3,9 +3,32 @@ LEARNING_RATE = 0.1
 DISCOUNT_FACTOR = 0.95
 EPSILON = 0.1
 NUM_EPISODES = 1000
+Q_TABLE_BACKEND = "dict"  # "dict" or "dense" (preallocated NumPy array, see q_table.py)
+DEFAULT_Q_VALUE = 4  # Initial Q-value of unseen state-action pairs
+REPLAY_CAPACITY = 0  # Transitions kept for experience replay (0 = learn online only); needs the dense backend
+REPLAY_RATIO = 4  # Replayed transitions per simulated step
+REPLAY_BATCH_SIZE = 64
+REPLAY_PRIORITIZED = False  # Sample by TD error instead of uniformly
+REPLAY_ALPHA = 0.6  # How strongly priorities skew sampling
+REPLAY_BETA = 0.4  # Strength of the importance-weight correction
 
 # Game parameters
 FPS = 120
 STUCK_TIMEOUT_STEPS = 50  # Number of steps before timeout
 SAVE_INTERVAL = 10
-MAX_NEGATIVE_REWARD = 1000
\ No newline at end of file
+KEEP_CHECKPOINTS = 3  # Periodic checkpoints kept on disk; older ones are deleted (0 = keep all)
+MAX_NEGATIVE_REWARD = 1000
+COLLISION_MODE = "mask"  # "mask" (pixel-exact sprite masks) or "box" (oriented rectangle, see collision.py)
+USE_SENSOR_TABLE = True  # Read ray distances from the table built by `python sensor_table.py` when present
+PROGRESS_REWARD = False  # Reward progress along the lap (see progress_map.py) instead of raw distance driven
+PROGRESS_BACKWARD_PENALTY = 10  # Multiplier on the progress lost by driving the wrong way
+
+# Rendering parameters
+HEADLESS = False  # Train on SDL's dummy video driver with no window, drawing or frame cap
+RENDER_EVERY_EPISODES = 0  # When headless, still draw every N-th episode in a window (0 = never)
+RENDER_EVERY_STEPS = 1  # Only draw every K-th step of a rendered episode
+EVENT_POLL_STEPS = 100  # With a window open, handle its events at least every N undrawn steps
+
+# Profiling parameters
+PROFILE_PHASES = False  # Time each training-loop phase and log per-episode percentiles
+PROFILE_PATH = "training_runs/phase_timings.jsonl"  # Rotated to <path>.1 past 10 MB
@@ -0,0 +1,204 @@
+import argparse
+import os
+import pickle
+import queue
+import random
+import time
+import multiprocessing as mp
+from datetime import datetime
+from multiprocessing import shared_memory
+import numpy as np
+import config
+from agent import QLearningAgent
+from q_table import DenseQTable, STATE_BINS
+
+ACTION_SPACE = [0, 1, 2, 3, 4]
+
+
+def attach_table(shm):
+    """DenseQTable whose values live in the given shared memory block."""
+    values = np.ndarray((int(np.prod(STATE_BINS)), len(ACTION_SPACE)), dtype=np.float32, buffer=shm.buf)
+    return DenseQTable(len(ACTION_SPACE), config.DEFAULT_Q_VALUE, values=values)
+
+
+def attach_dirty_rows(shm, num_actors):
+    """(num_actors, num_states) uint8 flags in the given shared memory block: rows the learner changed since each actor's last sync."""
+    return np.ndarray((num_actors, int(np.prod(STATE_BINS))), dtype=np.uint8, buffer=shm.buf)
+
+
+def run_actor(actor_id, shm_name, dirty_name, num_actors, messages, stop, num_envs, sync_interval, batch_size, seed):
+    """
+    Act in `num_envs` CarEnvironments with the shared policy and stream transitions to the learner.
+    :param sync_interval: Refresh a private copy of the Q-table every this many steps; 0 reads the shared table directly.
+        A sync only copies the rows the learner flagged for this actor in the `dirty_name` block.
+    """
+    from environment import CarEnvironment
+
+    random.seed(seed)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    shared_table = attach_table(shm)
+    dirty_shm = dirty = None
+    if sync_interval:
+        dirty_shm = shared_memory.SharedMemory(name=dirty_name)
+        dirty = attach_dirty_rows(dirty_shm, num_actors)[actor_id]
+    agent = QLearningAgent(
+        action_space=ACTION_SPACE,
+        epsilon=config.EPSILON,
+        backend="dense",
+        default_q_value=config.DEFAULT_Q_VALUE,
+    )
+    if sync_interval:
+        agent.q_table = DenseQTable(len(ACTION_SPACE), config.DEFAULT_Q_VALUE, values=shared_table.values.copy())
+    else:
+        agent.q_table = shared_table
+
+    envs = [CarEnvironment() for _ in range(num_envs)]
+    states = [env.reset() for env in envs]
+    episode_rewards = [0.0] * num_envs
+    episode_steps = [0] * num_envs
+    batch = []
+    step = 0
+    while not stop.is_set():
+        for i, env in enumerate(envs):
+            action = agent.choose_action(states[i])
+            next_state, reward, done = env.step(action)
+            batch.append((agent.q_table.state_index(states[i]), action, reward, agent.q_table.state_index(next_state)))
+            episode_rewards[i] += reward
+            episode_steps[i] += 1
+            if done:
+                messages.put(("episode", actor_id, episode_rewards[i], episode_steps[i]))
+                agent.epsilon = max(0.01, agent.epsilon * 0.995)
+                states[i] = env.reset()
+                episode_rewards[i], episode_steps[i] = 0.0, 0
+            else:
+                states[i] = next_state
+
+        if len(batch) >= batch_size:
+            rows, actions, rewards, next_rows = zip(*batch)
+            messages.put(("transitions", np.array(rows), np.array(actions), np.array(rewards, dtype=np.float32), np.array(next_rows)))
+            batch = []
+
+        step += 1
+        if sync_interval and step % sync_interval == 0:
+            # Scan a snapshot, as the learner keeps flagging rows, and clear the flags before
+            # copying: a row the learner rewrites meanwhile is flagged again
+            rows = np.flatnonzero(dirty.copy())
+            dirty[rows] = 0
+            agent.q_table.values[rows] = shared_table.values[rows]
+
+    del shared_table, agent, dirty
+    shm.close()
+    if dirty_shm is not None:
+        dirty_shm.close()
+
+
+def train(num_actors, num_envs=1, num_episodes=config.NUM_EPISODES, sync_interval=0, batch_size=256, seed=0):
+    """
+    Train one dense Q-table with `num_actors` actor processes and this process as the learner.
+
+    Actors only read the table; the learner is its single writer and applies each
+    batch of transitions as one vectorised update.
+
+    With `sync_interval`, every actor acts on a private copy of the whole table (62.5 MB
+    each) instead of the shared one. The learner flags each row it updates for every
+    actor, in a shared (actors x states) byte array, and a sync copies just the flagged
+    rows. Memory therefore grows by a table per actor, but sync traffic only grows with
+    the rows learned since the last sync.
+    """
+    table_size = int(np.prod(STATE_BINS)) * len(ACTION_SPACE) * np.dtype(np.float32).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=table_size)
+    table = attach_table(shm)
+    table.values.fill(config.DEFAULT_Q_VALUE)
+    dirty_shm = dirty = None
+    if sync_interval:
+        dirty_shm = shared_memory.SharedMemory(create=True, size=num_actors * int(np.prod(STATE_BINS)))
+        dirty = attach_dirty_rows(dirty_shm, num_actors)
+        dirty.fill(0)
+
+    messages = mp.Queue()
+    stop = mp.Event()
+    actors = [
+        mp.Process(
+            target=run_actor,
+            args=(actor_id, shm.name, dirty_shm.name if dirty_shm else None, num_actors, messages, stop, num_envs,
+                  sync_interval, batch_size, seed + actor_id),
+            daemon=True,
+        )
+        for actor_id in range(num_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    rewards = []
+    transitions = 0
+    start_time = time.perf_counter()
+    try:
+        while len(rewards) < num_episodes:
+            try:
+                message = messages.get(timeout=1)
+            except queue.Empty:
+                if not any(actor.is_alive() for actor in actors):
+                    raise RuntimeError("All actor processes exited")
+                continue
+            if message[0] == "transitions":
+                _, rows, actions, batch_rewards, next_rows = message
+                table.update(rows, actions, batch_rewards, next_rows, config.LEARNING_RATE, config.DISCOUNT_FACTOR)
+                if dirty is not None:
+                    dirty[:, rows] = 1
+                transitions += len(rows)
+            else:
+                _, actor_id, total_reward, steps = message
+                rewards.append(total_reward)
+                print(f"Episode {len(rewards)}, Actor {actor_id}, Steps: {steps}, Total Reward: {total_reward:.2f}")
+    finally:
+        stop.set()
+        # Keep draining so no actor blocks on a full pipe while shutting down
+        while any(actor.is_alive() for actor in actors):
+            try:
+                messages.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in actors:
+            actor.join()
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Learned from {transitions} transitions in {elapsed:.1f}s ({transitions / elapsed:.0f} steps/s)")
+
+    if not os.path.exists("models"):
+        os.makedirs("models")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    with open(f"models/q_table_final_{timestamp}.pkl", "wb") as f:
+        pickle.dump(table.to_dict(), f)
+
+    del table, dirty
+    shm.close()
+    shm.unlink()
+    if dirty_shm is not None:
+        dirty_shm.close()
+        dirty_shm.unlink()
+    return rewards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train one Q-table with parallel actor processes and a learner.")
+    parser.add_argument("--actors", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="number of actor processes")
+    parser.add_argument("--envs-per-actor", type=int, default=1,
+                        help="CarEnvironment copies stepped by each actor")
+    parser.add_argument("--episodes", type=int, default=config.NUM_EPISODES,
+                        help="stop after this many finished episodes across all actors")
+    parser.add_argument("--sync-interval", type=int, default=0,
+                        help="actor steps between Q-table syncs (0 = read the shared table directly); "
+                             "each actor then keeps a private 62.5 MB copy and syncs the rows learned since")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="transitions per message sent to the learner")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    train(
+        num_actors=args.actors,
+        num_envs=args.envs_per_actor,
+        num_episodes=args.episodes,
+        sync_interval=args.sync_interval,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
@@ -1,38 +1,39 @@
-from ai_game import (
-    Car,
-    TRACK,
-    TRACK_BORDER_MASK,
-    FINISH_MASK,
-    FINISH_POSITION,
-    WIN,
-    WIDTH,
-    HEIGHT,
-    GRASS_MASK
-)
+import numpy as np
+from ai_game import Car, get_context
+from population import CarPopulation, CarView
 from utils import discretize_state
 import config
 from game_utils import has_completed_track
 
 
 class CarEnvironment:
-    def __init__(self):
-        self.player_car = Car(6, 4)
+    def __init__(self, context=None):
+        self.context = context or get_context()
+        self.player_car = Car(6, 4, self.context)
         self.total_reward = 0
+        # CollisionResult of the latest step, for callers that tally crashes or finishes
+        self.last_collision = None
         self.reset()
 
     def reset(self):
         self.total_reward = 0
+        self.last_collision = None
         self.player_car.reset()
+        if config.PROGRESS_REWARD:
+            self.player_car.progress = self.player_car.track_progress()
         return self.get_state()
 
     def step(self, action):
         self.take_action(action)
-        if (self.player_car.collide(TRACK_BORDER_MASK) is not None) or (self.player_car.collide(GRASS_MASK) is not None):
+        # handle_collision only changes velocity, so this pose's result stays valid for reward and termination
+        collision = self.context.collision_checker.query(self.player_car)
+        self.last_collision = collision
+        if collision.hit_wall:
             self.player_car.handle_collision()
 
         new_state = self.get_state()
-        reward = self.calculate_reward()
-        done = self.is_done()
+        reward = self.calculate_reward(collision)
+        done = self.is_done(collision)
         return new_state, reward, done
 
 
@@ -50,25 +51,26 @@ class CarEnvironment:
         self.player_car.move()
 
     def get_state(self):
-        distances = self.player_car.get_distances_to_border(TRACK_BORDER_MASK)
+        distances = self.player_car.get_distances_to_border(self.context.track_border_mask)
         
         angle_discrete = discretize_state(self.player_car.angle, 0, 360, 8)
-        distances_discrete = [discretize_state(d, 0, max(TRACK.get_width(), TRACK.get_height()), 5) for d in distances]
+        distances_discrete = [discretize_state(d, 0, max(self.context.width, self.context.height), 5) for d in distances]
         
         state = (angle_discrete, *distances_discrete)
         return state
 
-    def calculate_reward(self):
+    def calculate_reward(self, collision=None):
         reward = 0
+        if collision is None:
+            collision = self.context.collision_checker.query(self.player_car)
 
-        if (self.player_car.collide(TRACK_BORDER_MASK) is not None) or (self.player_car.collide(GRASS_MASK) is not None):
+        if collision.hit_wall:
             reward = -10
             self.total_reward += reward
             return reward
 
-        finish_collision = self.player_car.collide(FINISH_MASK, *FINISH_POSITION)
-        if finish_collision is not None:
-            if has_completed_track(self.player_car.initial_angle, FINISH_POSITION, (self.player_car.x, self.player_car.y)):
+        if collision.at_finish:
+            if has_completed_track(self.player_car.initial_angle, self.context.finish_position, (self.player_car.x, self.player_car.y)):
                 reward += 100
                 self.total_reward += reward
                 return reward
@@ -77,24 +79,34 @@ class CarEnvironment:
                 self.total_reward += reward
                 return reward
 
-        distance_reward = self.player_car.distance_this_frame if self.player_car.velocity > 0 else -10*self.player_car.distance_this_frame
+        if config.PROGRESS_REWARD:
+            distance_reward, self.player_car.progress = self.context.progress_map.reward(
+                self.player_car.progress, self.player_car.track_progress(), config.PROGRESS_BACKWARD_PENALTY
+            )
+        else:
+            distance_reward = self.player_car.distance_this_frame if self.player_car.velocity > 0 else -10*self.player_car.distance_this_frame
         reward += distance_reward
 
         self.total_reward += reward
         return reward
 
-    def is_done(self):
+    def is_done(self, collision=None):
         if self.player_car.stuck_steps >= config.STUCK_TIMEOUT_STEPS or self.total_reward <= -config.MAX_NEGATIVE_REWARD:
             return True
-        if self.player_car.collide(FINISH_MASK, *FINISH_POSITION) is not None:
+        if collision is None:
+            collision = self.context.collision_checker.query(self.player_car)
+        else:
+            self.context.collision_checker.count_finish_recheck()
+        if collision.at_finish:
             return True
         return False
     
 
 class ParallelLearningCarEnvironment:
-    def __init__(self, num_cars=10):
+    def __init__(self, num_cars=10, context=None):
+        self.context = context or get_context()
         self.num_cars = num_cars
-        self.cars = [Car(6,4) for _ in range(self.num_cars)]
+        self.cars = [Car(6, 4, self.context) for _ in range(self.num_cars)]
         self.active_cars = list(range(self.num_cars))
         self.car_rewards = [0 for _ in range(self.num_cars)]
         self.reset()
@@ -104,25 +116,32 @@ class ParallelLearningCarEnvironment:
         self.car_rewards = [0 for _ in range(self.num_cars)]
         for car in self.cars:
             car.reset()
-        return [self.get_state(car) for car in self.cars]
+            if config.PROGRESS_REWARD:
+                car.progress = car.track_progress()
+        return self.get_states(self.cars)
     
     def step(self, actions):
-        states, rewards, done_states = [], [], []
+        rewards, done_states = [], []
+        collisions = {}
 
         for idx, action in zip(self.active_cars, actions):
             car = self.cars[idx]
             self.take_action(car, action)
 
-            if (car.collide(TRACK_BORDER_MASK) is not None) or (car.collide(GRASS_MASK) is not None):
+            collisions[idx] = self.context.collision_checker.query(car)
+            if collisions[idx].hit_wall:
                 car.handle_collision()
 
-            new_state = self.get_state(car)
-            reward = self.calculate_reward(car)
-            done = self.is_done(idx)
+        # Ray cast the whole active population in one batch
+        states = self.get_states([self.cars[idx] for idx in self.active_cars])
+
+        for idx in self.active_cars:
+            car = self.cars[idx]
+            reward = self.calculate_reward(car, collisions[idx])
+            done = self.is_done(idx, collisions[idx])
 
             self.car_rewards[idx] += reward
 
-            states.append(new_state)
             rewards.append(reward)
             done_states.append(done)
 
@@ -133,12 +152,20 @@ class ParallelLearningCarEnvironment:
         return states, rewards, done_states, population_done
     
     def get_state(self, car):
-        distances = car.get_distances_to_border(TRACK_BORDER_MASK)
-        
-        angle_discrete = discretize_state(car.angle, 0, 360, 8)
-        distances_discrete = [discretize_state(d, 0, max(TRACK.get_width(), TRACK.get_height()), 5) for d in distances]
+        return self.get_states([car])[0]
 
-        return (angle_discrete, *distances_discrete)
+    def get_states(self, cars):
+        if not cars:
+            return []
+        all_distances = self.context.border_sensor.cast([car.rect.center for car in cars]).tolist()
+        max_distance = max(self.context.width, self.context.height)
+
+        states = []
+        for car, distances in zip(cars, all_distances):
+            angle_discrete = discretize_state(car.angle, 0, 360, 8)
+            distances_discrete = [discretize_state(d, 0, max_distance, 5) for d in distances]
+            states.append((angle_discrete, *distances_discrete))
+        return states
     
     def take_action(self, car, action):
         if action == 0:  # Left
@@ -153,32 +180,84 @@ class ParallelLearningCarEnvironment:
             car.reduce_speed()
         car.move()
 
-    def calculate_reward(self, car):
+    def calculate_reward(self, car, collision=None):
         reward = 0
-        if (car.collide(TRACK_BORDER_MASK) is not None) or (car.collide(GRASS_MASK) is not None):
+        if collision is None:
+            collision = self.context.collision_checker.query(car)
+        if collision.hit_wall:
             reward = -10
             return reward
         
-        finish_collision = car.collide(FINISH_MASK, *FINISH_POSITION)
-        if finish_collision is not None:
-            if has_completed_track(car.initial_angle, FINISH_POSITION, (car.x, car.y)):
+        if collision.at_finish:
+            if has_completed_track(car.initial_angle, self.context.finish_position, (car.x, car.y)):
                 reward += 100
                 return reward
             else:
                 reward = -10
                 return reward
 
-        distance_reward = car.distance_this_frame if car.velocity > 0 else -10*car.distance_this_frame
+        if config.PROGRESS_REWARD:
+            distance_reward, car.progress = self.context.progress_map.reward(
+                car.progress, car.track_progress(), config.PROGRESS_BACKWARD_PENALTY
+            )
+        else:
+            distance_reward = car.distance_this_frame if car.velocity > 0 else -10*car.distance_this_frame
         reward += distance_reward
 
         return reward
     
-    def is_done(self, idx):
+    def is_done(self, idx, collision=None):
         if self.cars[idx].stuck_steps >= config.STUCK_TIMEOUT_STEPS or self.car_rewards[idx]<=-config.MAX_NEGATIVE_REWARD:
             return True
-        if self.cars[idx].collide(FINISH_MASK, *FINISH_POSITION) is not None:
+        if collision is None:
+            collision = self.context.collision_checker.query(self.cars[idx])
+        else:
+            self.context.collision_checker.count_finish_recheck()
+        if collision.at_finish:
             return True
         return False
 
     def get_best_car_index(self):
-        return max(range(self.num_cars), key=lambda i: self.car_rewards[i])
\ No newline at end of file
+        return max(range(self.num_cars), key=lambda i: self.car_rewards[i])
+
+
+class PopulationCarEnvironment:
+    """
+    ParallelLearningCarEnvironment's interface on top of the array-backed CarPopulation.
+
+    Steps the whole population in a handful of NumPy operations instead of a Python loop
+    over Car objects; `cars` holds lightweight views for drawing.
+    """
+
+    def __init__(self, num_cars=10, context=None):
+        self.context = context or get_context()
+        self.num_cars = num_cars
+        self.population = CarPopulation(num_cars, self.context)
+        self.cars = [CarView(self.population, i) for i in range(num_cars)]
+        self.reset()
+
+    @property
+    def active_cars(self):
+        return np.flatnonzero(self.population.active).tolist()
+
+    @property
+    def car_rewards(self):
+        return self.population.total_reward.tolist()
+
+    def reset(self):
+        self.population.reset()
+        return self.get_states(np.arange(self.num_cars))
+
+    def step(self, actions):
+        full_actions = np.zeros(self.num_cars, dtype=np.int64)
+        full_actions[self.population.active] = actions
+        idx, rewards, dones = self.population.step(full_actions)
+        states = self.get_states(idx)
+        population_done = not self.population.active.any()
+        return states, rewards.tolist(), dones.tolist(), population_done
+
+    def get_states(self, idx):
+        return [tuple(row) for row in self.population.observations(idx).tolist()]
+
+    def get_best_car_index(self):
+        return int(np.argmax(self.population.total_reward))
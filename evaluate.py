@@ -0,0 +1,234 @@
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import pickle
+import random
+import time
+from collections import Counter
+from datetime import datetime
+import numpy as np
+import config
+from agent import QLearningAgent
+from checkpoint import STATE_FILE, load_checkpoint
+from game_utils import has_completed_track, init_pygame
+from q_table import DenseQTable
+
+ACTION_SPACE = [0, 1, 2, 3, 4]
+# Greedy policies can circle forever without ever getting stuck or losing enough reward
+MAX_STEPS = 5000
+OUTCOMES = ("lap", "wrong_way", "stuck", "reward_limit", "step_limit")
+SORT_KEYS = {
+    "completion": lambda row: (-row["completion_rate"], row["best_lap_steps"] or math.inf, -row["mean_reward"]),
+    "reward": lambda row: -row["mean_reward"],
+    "lap": lambda row: row["best_lap_steps"] or math.inf,
+    "crashes": lambda row: row["mean_crashes"],
+}
+
+
+def is_checkpoint(path):
+    return os.path.isfile(os.path.join(path, STATE_FILE))
+
+
+def find_models(paths):
+    """
+    Expand paths into the models to evaluate: checkpoint directories and pickled Q-tables
+    are taken as they are, other directories are searched (not recursively) for both.
+    """
+    models = []
+    for path in paths:
+        if is_checkpoint(path) or os.path.isfile(path):
+            models.append(path)
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                child = os.path.join(path, name)
+                if is_checkpoint(child) or (name.endswith(".pkl") and os.path.isfile(child)):
+                    models.append(child)
+        else:
+            raise FileNotFoundError(f"No model at {path}")
+    return models
+
+
+def load_table(path):
+    """DenseQTable of a checkpoint directory or of a pickled dict or dense table."""
+    if is_checkpoint(path):
+        table, _ = load_checkpoint(path)
+        return table
+    with open(path, "rb") as f:
+        q_table = pickle.load(f)
+    if isinstance(q_table, DenseQTable):
+        return q_table
+    # float64 keeps the dict's values, so greedy choices match the trained agent's exactly
+    return DenseQTable.from_dict(q_table, len(ACTION_SPACE), config.DEFAULT_Q_VALUE, dtype=np.float64)
+
+
+def run_episode(env, agent, max_steps=MAX_STEPS):
+    """
+    Drive one episode with the agent's policy.
+    :return: Dict with the outcome (one of OUTCOMES), steps, total reward and wall crashes.
+    """
+    state = env.reset()
+    total_reward = 0
+    crashes = 0
+    touching = False
+    done = False
+    steps = 0
+    while not done and steps < max_steps:
+        action = agent.choose_action(state)
+        state, reward, done = env.step(action)
+        total_reward += reward
+        steps += 1
+        # A crash is each new contact with a wall, not every step spent scraping along it
+        hit_wall = env.last_collision.hit_wall
+        crashes += hit_wall and not touching
+        touching = hit_wall
+
+    car = env.player_car
+    if not done:
+        outcome = "step_limit"
+    elif env.last_collision.at_finish:
+        completed = has_completed_track(car.initial_angle, env.context.finish_position, (car.x, car.y))
+        outcome = "lap" if completed else "wrong_way"
+    elif car.stuck_steps >= config.STUCK_TIMEOUT_STEPS:
+        outcome = "stuck"
+    else:
+        outcome = "reward_limit"
+    return {"outcome": outcome, "steps": steps, "reward": float(total_reward), "crashes": int(crashes)}
+
+
+def summarize(path, episodes):
+    """Per-model statistics over its evaluated episodes."""
+    laps = [episode["steps"] for episode in episodes if episode["outcome"] == "lap"]
+    rewards = [episode["reward"] for episode in episodes]
+    crashes = [episode["crashes"] for episode in episodes]
+    outcomes = Counter(episode["outcome"] for episode in episodes)
+    return {
+        "model": path,
+        "episodes": len(episodes),
+        "completion_rate": len(laps) / len(episodes),
+        "best_lap_steps": min(laps) if laps else None,
+        "mean_lap_steps": float(np.mean(laps)) if laps else None,
+        "mean_reward": float(np.mean(rewards)),
+        "min_reward": float(np.min(rewards)),
+        "max_reward": float(np.max(rewards)),
+        "mean_crashes": float(np.mean(crashes)),
+        "total_crashes": int(np.sum(crashes)),
+        "outcomes": {outcome: outcomes.get(outcome, 0) for outcome in OUTCOMES},
+    }
+
+
+_env = None
+
+
+def init_worker(collision_mode):
+    config.COLLISION_MODE = collision_mode
+    init_pygame(headless=True)
+
+
+def evaluate_chunk(task):
+    """Pool task: run some episodes of one model; each worker keeps a single CarEnvironment."""
+    from environment import CarEnvironment
+
+    global _env
+    path, episodes, epsilon, seed, max_steps = task
+    if _env is None:
+        _env = CarEnvironment()
+    agent = QLearningAgent(ACTION_SPACE, epsilon=epsilon, backend="dense", default_q_value=config.DEFAULT_Q_VALUE)
+    agent.q_table = load_table(path)
+    results = []
+    for episode in episodes:
+        # Exploration depends only on the seed and episode number, not on how episodes were split up
+        random.seed(f"{seed}:{episode}")
+        results.append(run_episode(_env, agent, max_steps))
+    return path, episodes, results
+
+
+def evaluate(models, episodes=1, epsilon=0.0, seed=0, max_steps=MAX_STEPS, workers=None):
+    """
+    Evaluate every model over `episodes` episodes in a pool of `workers` processes.
+
+    The environment is deterministic, so with epsilon 0 every episode of a model is the
+    same and only one is run.
+    :return: One summarize() dict per model, in the order of `models`.
+    """
+    if epsilon == 0:
+        episodes = 1
+    workers = workers or os.cpu_count() or 1
+    # Split each model's episodes so that even a single model keeps every worker busy
+    splits = max(1, min(episodes, math.ceil(2 * workers / len(models))))
+    chunk = math.ceil(episodes / splits)
+    tasks = [
+        (path, list(range(start, min(start + chunk, episodes))), epsilon, seed, max_steps)
+        for path in models
+        for start in range(0, episodes, chunk)
+    ]
+
+    results = {path: [None] * episodes for path in models}
+    if workers == 1:
+        init_worker(config.COLLISION_MODE)
+        chunks = map(evaluate_chunk, tasks)
+        pool = None
+    else:
+        pool = mp.Pool(workers, initializer=init_worker, initargs=(config.COLLISION_MODE,))
+        chunks = pool.imap_unordered(evaluate_chunk, tasks)
+    try:
+        for path, chunk_episodes, chunk_results in chunks:
+            for episode, result in zip(chunk_episodes, chunk_results):
+                results[path][episode] = result
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return [summarize(path, results[path]) for path in models]
+
+
+def print_table(rows):
+    print(f"{'#':>3}  {'laps':>6}  {'best lap':>8}  {'mean lap':>8}  {'reward':>10}  {'crashes':>7}  model")
+    for rank, row in enumerate(rows, 1):
+        best_lap = f"{row['best_lap_steps']:8d}" if row["best_lap_steps"] is not None else f"{'-':>8}"
+        mean_lap = f"{row['mean_lap_steps']:8.1f}" if row["mean_lap_steps"] is not None else f"{'-':>8}"
+        print(f"{rank:3d}  {row['completion_rate']:6.1%}  {best_lap}  {mean_lap}  "
+              f"{row['mean_reward']:10.2f}  {row['mean_crashes']:7.2f}  {row['model']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank saved Q-tables by driving them headlessly in parallel.")
+    parser.add_argument("models", nargs="+",
+                        help="checkpoint directories, pickled Q-tables, or folders containing either")
+    parser.add_argument("--episodes", type=int, default=20,
+                        help="episodes per model when exploring (a greedy policy always drives the same episode)")
+    parser.add_argument("--epsilon", type=float, default=0.0, help="exploration rate (0 = greedy)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-steps", type=int, default=MAX_STEPS, help="end episodes that run longer than this")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="evaluation processes")
+    parser.add_argument("--sort", choices=SORT_KEYS, default="completion", help="ranking column")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    models = find_models(args.models)
+    if not models:
+        parser.error("no checkpoints or .pkl Q-tables found")
+    start = time.perf_counter()
+    rows = evaluate(models, args.episodes, args.epsilon, args.seed, args.max_steps, args.workers)
+    elapsed = time.perf_counter() - start
+    rows.sort(key=SORT_KEYS[args.sort])
+    print_table(rows)
+    print(f"Evaluated {len(models)} model(s) in {elapsed:.1f}s")
+
+    if args.json:
+        report = {
+            "meta": {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "episodes": rows[0]["episodes"],
+                "epsilon": args.epsilon,
+                "seed": args.seed,
+                "max_steps": args.max_steps,
+                "collision_mode": config.COLLISION_MODE,
+                "sort": args.sort,
+            },
+            "results": rows,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
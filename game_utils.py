@@ -1,4 +1,6 @@
+import os
 import pygame
+from physics import state_attribute
 
 def resize_images_to_largest(image_paths):
     images = [pygame.image.load(path) for path in image_paths]
@@ -28,6 +30,114 @@ def blit_rotate_center(win, image, top_left, angle):
     new_rect = rotated_image.get_rect(center=image.get_rect(topleft = top_left).center)
     win.blit(rotated_image, new_rect.topleft)
     
+class RotationCache:
+    """Rotated copies of a sprite and their collision masks, shared by every car using the sprite.
+
+    Angles are quantized to whole degrees, so the cache is filled lazily and never
+    holds more than 360 entries. Physics keeps the exact angle, so the sprite and its
+    mask can trail it by up to 0.5 degrees. Every car here starts at a multiple of 90
+    degrees and turns in whole-degree steps, so in practice the angle is always whole
+    and the sprite matches it exactly; fractional rotation speeds would bring in the
+    0.5 degree tolerance.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.entries = {}
+
+    def get(self, angle):
+        """Return the (rotated_image, mask) pair for an angle in degrees."""
+        key = round(angle) % 360
+        entry = self.entries.get(key)
+        if entry is None:
+            rotated_image = pygame.transform.rotate(self.image, key)
+            entry = (rotated_image, pygame.mask.from_surface(rotated_image))
+            self.entries[key] = entry
+        return entry
+
+class CarSprite:
+    """
+    pygame side of a car: its rotated sprite, mask and rect, derived from a physics.CarState.
+
+    Driving is delegated to a physics.CarPhysics. Nothing pygame-specific is stored per
+    car; sprites and masks come from the shared RotationCache.
+    """
+
+    def __init__(self, physics, state, rotations, start_position, start_angle):
+        self.physics = physics
+        self.state = state
+        self.rotations = rotations
+        self.START_POSITION = start_position
+        self.initial_angle = start_angle
+
+    x = state_attribute("x")
+    y = state_attribute("y")
+    angle = state_attribute("angle")
+    velocity = state_attribute("velocity")
+    previous_position = state_attribute("previous_position")
+    stuck_steps = state_attribute("stuck_steps")
+    distance_this_frame = state_attribute("distance_this_frame")
+    distance_traveled = state_attribute("distance_traveled")
+
+    @property
+    def rotated_image(self):
+        return self.rotations.get(self.state.angle)[0]
+
+    @property
+    def mask(self):
+        return self.rotations.get(self.state.angle)[1]
+
+    @property
+    def rect(self):
+        return self.rotated_image.get_rect(center=(self.state.x, self.state.y))
+
+    def rotate(self, left=False, right=False):
+        """Steer the car; the sprite and mask follow the new angle."""
+        self.physics.rotate(self.state, left, right)
+
+    def draw(self, win):
+        """Draw the rotated car image onto the window."""
+        win.blit(self.rotated_image, self.rect.topleft)
+
+    def move_forward(self):
+        """Accelerate the car forward."""
+        self.physics.move_forward(self.state)
+
+    def move_backward(self):
+        """Accelerate the car backward."""
+        self.physics.move_backward(self.state)
+
+    def move(self):
+        """Update the car's position based on its velocity and angle."""
+        self.physics.move(self.state)
+
+    def reduce_speed(self):
+        """Gradually reduce the car's speed when not accelerating."""
+        self.physics.reduce_speed(self.state)
+
+    def collide(self, mask, x=0, y=0):
+        """
+        Check for collision with another mask.
+        :param mask: The mask to check collision against.
+        :param x: X position of the other mask.
+        :param y: Y position of the other mask.
+        :return: Point of intersection or None.
+        """
+        rect = self.rect
+        return mask.overlap(self.mask, (int(rect.left - x), int(rect.top - y)))
+
+    def handle_collision(self):
+        """Handle a collision by slowing the car down."""
+        self.physics.handle_collision(self.state)
+
+    def bounce(self):
+        """Reverse the car's velocity."""
+        self.physics.bounce(self.state)
+
+    def reset(self):
+        """Reset the car to the starting position and state."""
+        self.physics.reset(self.state, self.START_POSITION, self.initial_angle)
+
 def has_completed_track(starting_angle, finish_position, current_car_position):
     if starting_angle==0:
         return finish_position[1] <= current_car_position[1]
@@ -36,4 +146,12 @@ def has_completed_track(starting_angle, finish_position, current_car_position):
     elif starting_angle==180:
         return finish_position[1] >= current_car_position[1]
     elif starting_angle==270:
-        return finish_position[0] >= current_car_position[0]
\ No newline at end of file
+        return finish_position[0] >= current_car_position[0]
+
+def init_pygame(headless=False):
+    """Initialise pygame, switching to SDL's dummy video driver when no window is wanted."""
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        # The display may already be up on the real driver from an earlier pygame.init()
+        pygame.display.quit()
+    pygame.init()
@@ -1,173 +1,75 @@
+import functools
 import pygame
-import math
-from game_utils import resize_images_to_largest, scale_image, has_completed_track
+from game_utils import resize_images_to_largest, scale_image, CarSprite, RotationCache, has_completed_track
+from physics import CarPhysics, CarState
+from track_bundle import load_track
+from render import SceneRenderer, TextCache, compose_background
 
 pygame.init()
 
-GRASS, TRACK, TRACK_BORDER = resize_images_to_largest(
-    ["assets/grass.jpg", "assets/bahrain_track.png", "assets/bahrain_track_border.png"]
-)
+TRACK_NAME = "bahrain"
+TRACK_SOURCES = ("assets/grass.jpg", "assets/bahrain_track.png", "assets/bahrain_track_border.png", "assets/finish.png")
+TRACK_METADATA = {"finish_position": (480, 720), "start_position": (520, 740), "start_angle": 270}
+GRASS, TRACK, TRACK_BORDER = resize_images_to_largest(list(TRACK_SOURCES[:3]))
+FINISH = pygame.image.load(TRACK_SOURCES[3])
 
-TRACK_BORDER_MASK = pygame.mask.from_surface(TRACK_BORDER)
-
-FINISH = pygame.image.load("assets/finish.png")
-FINISH_MASK = pygame.mask.from_surface(FINISH)
-FINISH_POSITION = (480, 720)
+TRACK_BUNDLE = load_track(TRACK_NAME, *TRACK_SOURCES, TRACK_METADATA)
+TRACK_BORDER_MASK = TRACK_BUNDLE.border_mask
+FINISH_MASK = TRACK_BUNDLE.finish_mask
+FINISH_POSITION = TRACK_BUNDLE.finish_position
+START_POSITION = TRACK_BUNDLE.start_position
+START_ANGLE = TRACK_BUNDLE.start_angle
 
 CAR = scale_image(pygame.image.load("assets/red-car.png"), 0.5)
+CAR_ROTATIONS = RotationCache(CAR)
 
-WIDTH, HEIGHT = TRACK.get_width(), TRACK.get_height()
+WIDTH, HEIGHT = TRACK_BUNDLE.width, TRACK_BUNDLE.height
 WIN = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Human Playable Game")
 
-TRACK_MASK = pygame.mask.from_surface(TRACK)
-GRASS_MASK = pygame.mask.from_surface(GRASS)
-
-for x in range(GRASS_MASK.get_size()[0]):
-    for y in range(GRASS_MASK.get_size()[1]):
-        if TRACK_MASK.get_at((x, y)):
-            GRASS_MASK.set_at((x, y), 0)
+TRACK_MASK = TRACK_BUNDLE.track_mask
+GRASS_MASK = TRACK_BUNDLE.grass_mask
 
-class Car:
+class Car(CarSprite):
     def __init__(self, max_velocity, rotation_velocity):
         self.original_image = CAR
         self.image = self.original_image
-        self.mask = pygame.mask.from_surface(self.image)
-        self.max_velocity = max_velocity
-        self.velocity = 0
-        self.rotation_velocity = rotation_velocity
-        self.initial_angle = 270
-        self.angle = self.initial_angle
-        self.START_POSITION = (520, 740)
-        self.x, self.y = self.START_POSITION
-        self.acceleration = 0.1
-        self.previous_position = self.START_POSITION
-        self.rotated_image = pygame.transform.rotate(self.image, self.angle)
-        self.rect = self.rotated_image.get_rect(center=(self.x, self.y))
-        self.distance_traveled = 0
-
-    def rotate(self, left=False, right=False):
-        """Rotate the car image and update the mask."""
-        if self.velocity != 0:
-            if self.velocity < 0:
-                if left:
-                    self.angle -= self.rotation_velocity
-                elif right:
-                    self.angle += self.rotation_velocity
-            else:
-                if left:
-                    self.angle += self.rotation_velocity
-                elif right:
-                    self.angle -= self.rotation_velocity
-
-            self.rotated_image = pygame.transform.rotate(self.original_image, self.angle)
-            self.rect = self.rotated_image.get_rect(center=(self.x, self.y))
-            self.mask = pygame.mask.from_surface(self.rotated_image)
-
-    def draw(self, win):
-        """Draw the rotated car image onto the window."""
-        win.blit(self.rotated_image, self.rect.topleft)
-
-    def move_forward(self):
-        """Accelerate the car forward."""
-        if self.velocity < 0:
-            self.velocity = min(self.velocity + self.acceleration * 2, 0)
-        else:
-            self.velocity = min(self.velocity + self.acceleration, self.max_velocity)
-        self.move()
-
-    def move_backward(self):
-        """Accelerate the car backward."""
-        if self.velocity > 0:
-            self.velocity = max(self.velocity - self.acceleration * 2, 0)
-        else:
-            self.velocity = max(self.velocity - self.acceleration, -self.max_velocity / 2)
-        self.move()
-
-    def move(self):
-        """Update the car's position based on its velocity and angle."""
-        radians = math.radians(self.angle)
-        vertical_velocity = math.cos(radians) * self.velocity
-        horizontal_velocity = math.sin(radians) * self.velocity
-
-        new_y = self.y - vertical_velocity
-        new_x = self.x - horizontal_velocity
-
-        self.previous_position = (self.x, self.y)
-        
-        distance_this_frame = math.sqrt((new_x - self.x)**2 + (new_y - self.y)**2)
-        self.distance_traveled += distance_this_frame if self.velocity > 0 else -distance_this_frame
-
-        self.y = new_y
-        self.x = new_x
-        self.rect.center = (self.x, self.y)
-
-    def reduce_speed(self):
-        """Gradually reduce the car's speed when not accelerating."""
-        if self.velocity > 0:
-            self.velocity = max(self.velocity - self.acceleration / 2, 0)
-        elif self.velocity < 0:
-            self.velocity = min(self.velocity + self.acceleration / 2, 0)
-        self.move()
-
-    def collide(self, mask, x=0, y=0):
-        """
-        Check for collision with another mask.
-        :param mask: The mask to check collision against.
-        :param x: X position of the other mask.
-        :param y: Y position of the other mask.
-        :return: Point of intersection or None.
-        """
-        offset_x = int(self.rect.left - x)
-        offset_y = int(self.rect.top - y)
-        point_of_intersection = mask.overlap(self.mask, (offset_x, offset_y))
-        return point_of_intersection
-
-    def handle_collision(self):
-        """Handle collision by reverting to previous position and adjusting velocity and angle."""
-        self.velocity *= 0.5
-
-        self.rotated_image = pygame.transform.rotate(self.original_image, self.angle)
-        self.rect = self.rotated_image.get_rect(center=(self.x, self.y))
-        self.mask = pygame.mask.from_surface(self.rotated_image)
-
-    def bounce(self):
-        """Reverse the car's velocity."""
-        self.velocity *= -1
-        self.move()
-
-    def reset(self):
-        """Reset the car to the starting position and state."""
-        self.x, self.y = self.START_POSITION
-        self.angle = 270
-        self.velocity = 0
-        self.distance_traveled = 0
-        self.rotated_image = pygame.transform.rotate(self.original_image, self.angle)
-        self.rect = self.rotated_image.get_rect(center=(self.x, self.y))
-        self.mask = pygame.mask.from_surface(self.rotated_image)
-
-def draw_info_panel(win, player_car):
+        # Human players can steer at any speed above standstill
+        super().__init__(
+            CarPhysics(max_velocity, rotation_velocity, min_velocity_for_rotation=0),
+            CarState(*START_POSITION, START_ANGLE),
+            CAR_ROTATIONS,
+            START_POSITION,
+            START_ANGLE,
+        )
+
+INFO_TEXT = TextCache(pygame.font.Font(None, 36))
+
+@functools.lru_cache(maxsize=None)
+def info_background(size):
+    """Translucent box behind the info text, built once per text size."""
+    background_surface = pygame.Surface(size, pygame.SRCALPHA)
+    pygame.draw.rect(background_surface, (0, 0, 0, 128), background_surface.get_rect())
+    return background_surface
+
+def draw_info_panel(renderer, player_car):
     """Draw information pane with distance traveled."""
-    font = pygame.font.Font(None, 36)
-    distance_text = font.render(f"Distance Traveled: {int(player_car.distance_traveled)}", True, (255, 255, 255))
+    distance_text = INFO_TEXT.render(f"Distance Traveled: {int(player_car.distance_traveled)}")
     text_rect = distance_text.get_rect()
     text_rect.topleft = (10, 10)
     
     background_rect = text_rect.copy()
     background_rect.inflate_ip(20, 20)
-    background_surface = pygame.Surface(background_rect.size, pygame.SRCALPHA)
-    pygame.draw.rect(background_surface, (0, 0, 0, 128), background_surface.get_rect())
-    win.blit(background_surface, background_rect)
+    renderer.blit(info_background(background_rect.size), background_rect.topleft)
     
-    win.blit(distance_text, text_rect)
+    renderer.blit(distance_text, text_rect.topleft)
 
-def draw(win, images, player_car):
-    """Draw all game elements onto the window."""
-    for image, position in images:
-        win.blit(image, position)
-    player_car.draw(win)
-    draw_info_panel(win, player_car)
-    pygame.display.update()
+def draw(renderer, player_car):
+    """Draw the car and info panel over the cached track and update only what changed."""
+    renderer.begin()
+    renderer.blit(player_car.rotated_image, player_car.rect.topleft)
+    draw_info_panel(renderer, player_car)
+    renderer.finish()
 
 def move_player(player_car):
     """Handle player input and move the car accordingly."""
@@ -202,12 +104,13 @@ def main():
         (FINISH, FINISH_POSITION),
         (TRACK_BORDER, (0, 0)),
     ]
+    renderer = SceneRenderer(WIN, compose_background((WIDTH, HEIGHT), images))
     player_car = Car(6, 4)
 
     while running:
         clock.tick(FPS)
 
-        draw(WIN, images, player_car)
+        draw(renderer, player_car)
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
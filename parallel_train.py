@@ -1,38 +1,77 @@
+import argparse
 import pygame
 import math
+import os
 import matplotlib.pyplot as plt
-from environment import ParallelLearningCarEnvironment
+from environment import ParallelLearningCarEnvironment, PopulationCarEnvironment
 from agent import ParallelQLearningAgent
 import config
-from ai_game import (
-    GRASS,
-    TRACK,
-    TRACK_BORDER,
-    TRACK_BORDER_MASK,
-    FINISH,
-    FINISH_POSITION,
-    WIDTH,
-    HEIGHT,
-)
-
-
-def train():
-    pygame.init()
-    NUM_CARS = 10
-    env = ParallelLearningCarEnvironment(num_cars=NUM_CARS)
+from utils import should_render
+from game_utils import init_pygame
+from sensors import SENSOR_ANGLES
+from profiling import make_phase_timer
+from render import HudPanel, SceneRenderer, compose_background, track_layers
+from viewer import RemoteViewer, car_snapshots
+from trajectory import TrajectoryRecorder
+
+
+def train(
+    headless=config.HEADLESS,
+    render_every_episodes=config.RENDER_EVERY_EPISODES,
+    render_every_steps=config.RENDER_EVERY_STEPS,
+    num_cars=10,
+    population=False,
+    profile_phases=config.PROFILE_PHASES,
+    viewer=False,
+    record=None,
+    record_poses=False,
+    seed=None,
+    on_episode=None,
+):
+    """
+    :param record: Path of a trajectory log to append every episode's actions to (see trajectory.py).
+    :param record_poses: Also log every car's pose after every step, so replays can verify them.
+    :param seed: Seed for exploration; recorded runs pick and log one when none is given.
+    :param on_episode: Called as on_episode(episode, best_reward) after every episode.
+    :return: Best reward of every episode.
+    """
+    if record and seed is None:
+        seed = int.from_bytes(os.urandom(4), "little")
+    remote = None
+    if viewer:
+        remote = RemoteViewer("Parallel RL Car Racing Game")
+        remote.attach()
+        headless = True
+    # Headless runs only need a real window if some episodes are still drawn
+    show_window = not headless or render_every_episodes > 0
+    init_pygame(headless=not show_window)
+    NUM_CARS = num_cars
+    if population:
+        env = PopulationCarEnvironment(num_cars=NUM_CARS)
+    else:
+        env = ParallelLearningCarEnvironment(num_cars=NUM_CARS)
+    context = env.context
     agent = ParallelQLearningAgent(
         action_space=[0, 1, 2, 3, 4],
         num_agents=NUM_CARS,
         learning_rate=config.LEARNING_RATE,
         discount_factor=config.DISCOUNT_FACTOR,
         epsilon=config.EPSILON,
+        seed=seed,
     )
 
     clock = pygame.time.Clock()
     font = pygame.font.Font(None, 24)
-    main_surface = pygame.display.set_mode((WIDTH + 200, HEIGHT))
-    pygame.display.set_caption("Parallel RL Car Racing Game")
-
+    if show_window:
+        main_surface = pygame.display.set_mode((context.width + 200, context.height))
+        pygame.display.set_caption("Parallel RL Car Racing Game")
+        # The border sits above the cars, so it is kept out of the cached background
+        background = compose_background((context.width, context.height), track_layers(context, border=False))
+        renderer = SceneRenderer(main_surface, background, overlay=context.track_border)
+        hud = HudPanel(main_surface, (context.width, 0, 200, context.height), font, 25)
+
+    timer = make_phase_timer(profile_phases, config.PROFILE_PATH)
+    recorder = TrajectoryRecorder(record, env, seed, record_poses) if record else None
     episode_rewards = []
     best_reward_ever = float("-inf")
     best_distance_ever = float("-inf")
@@ -42,12 +81,25 @@ def train():
         step = 0
         current_episode_best = float("-inf")
         current_episode_best_distance = float("-inf")
+        if recorder is not None:
+            recorder.begin_episode(episode + 1, env)
         while not population_done:
-            actions = agent.choose_actions(states)
+            timer.begin()
+            # States line up with the cars that were still active before this step
+            active_cars = list(env.active_cars)
+            actions = agent.choose_actions(states, active_cars)
+            timer.mark("choose_action")
             next_states, rewards, dones, population_done = env.step(actions)
+            if recorder is not None:
+                recorder.step_population(env, active_cars, actions)
+            timer.mark("env_step")
+            timer.count("car_steps", len(active_cars))
 
-            agent.update_q_values(states, actions, rewards, next_states)
+            agent.update_q_values(states, actions, rewards, next_states, active_cars)
+            timer.mark("q_update")
 
+            # Finished cars leave the batch until the whole population is done, which is
+            # why this loop does not use the fixed-shape, auto-resetting vector_env API
             states = [s for s, d in zip(next_states, dones) if not d]
 
             if env.car_rewards:
@@ -56,68 +108,79 @@ def train():
 
             current_episode_best_distance = max([car.distance_traveled for car in env.cars])
             best_distance_ever = max(best_distance_ever, current_episode_best_distance)
-
-            main_surface.fill((50, 50, 50))
-            game_surface = pygame.Surface((WIDTH, HEIGHT))
-
-            game_surface.blit(GRASS, (0, 0))
-            game_surface.blit(TRACK, (0, 0))
-            game_surface.blit(FINISH, FINISH_POSITION)
-
-            for i, car in enumerate(env.cars):
-                if i in env.active_cars:
-                    for angle in range(0, 360, 45):
-                        distance = car.ray_cast(TRACK_BORDER_MASK, angle)
+            timer.mark("bookkeeping")
+
+            if remote is not None and step % max(1, render_every_steps) == 0 and remote.wants_frame():
+                remote.publish({
+                    "cars": car_snapshots([env.cars[i] for i in env.active_cars], context),
+                    "hud": [
+                        f"Episode: {episode + 1}/{config.NUM_EPISODES}",
+                        f"Step: {step}",
+                        f"Active Cars: {len(env.active_cars)}",
+                        f"Epsilon: {agent.epsilon:.2f}",
+                        "",
+                        f"Current Episode:",
+                        f"Best Reward: {current_episode_best:.2f}",
+                        f"Best Distance: {current_episode_best_distance:.2f}",
+                        "",
+                        f"All Episodes:",
+                        f"Best Reward: {best_reward_ever:.2f}",
+                        f"Best Distance: {best_distance_ever:.2f}",
+                    ],
+                })
+                timer.mark("publish")
+
+            rendered = should_render(episode, step, headless, render_every_episodes, render_every_steps)
+            if rendered:
+                renderer.begin()
+                drawn_cars = [env.cars[i] for i in env.active_cars]
+                # One batched sensor query for every ray on screen instead of one call per ray
+                ray_lengths = context.border_sensor.cast([car.rect.center for car in drawn_cars], SENSOR_ANGLES).tolist()
+                for car, distances in zip(drawn_cars, ray_lengths):
+                    for angle, distance in zip(SENSOR_ANGLES, distances):
                         start_pos = (int(car.x), int(car.y))
                         end_x = car.x + distance * math.cos(math.radians(angle))
                         end_y = car.y + distance * math.sin(math.radians(angle))
                         end_pos = (int(end_x), int(end_y))
-                        pygame.draw.line(
-                            game_surface,
+                        renderer.line(
                             (192, 235, 166),
                             start_pos,
                             end_pos,
                             1,
                         )
-                    car.draw(game_surface)
-
-            game_surface.blit(TRACK_BORDER, (0, 0))
-            main_surface.blit(game_surface, (0, 0))
-
-            info_surface = pygame.Surface((200, HEIGHT))
-            info_surface.fill((30, 30, 30))
-
-            texts = [
-                f"Episode: {episode + 1}/{config.NUM_EPISODES}",
-                f"Step: {step}",
-                f"Active Cars: {len(env.active_cars)}",
-                f"Epsilon: {agent.epsilon:.2f}",
-                "",
-                f"Current Episode:",
-                f"Best Reward: {current_episode_best:.2f}",
-                f"Best Distance: {current_episode_best_distance:.2f}",
-                "",
-                f"All Episodes:",
-                f"Best Reward: {best_reward_ever:.2f}",
-                f"Best Distance: {best_distance_ever:.2f}",
-            ]
-
-            for i, text in enumerate(texts):
-                color = (255, 255, 255)
-                if "Best" in text:
-                    color = (0, 255, 0)
-                text_surface = font.render(text, True, color)
-                info_surface.blit(text_surface, (10, 10 + i * 25))
-
-            main_surface.blit(info_surface, (WIDTH, 0))
-
-            pygame.display.update()
-            clock.tick(config.FPS)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
-                    pygame.quit()
-                    return
+                    renderer.blit(car.rotated_image, car.rect.topleft)
+
+                texts = [
+                    f"Episode: {episode + 1}/{config.NUM_EPISODES}",
+                    f"Step: {step}",
+                    f"Active Cars: {len(env.active_cars)}",
+                    f"Epsilon: {agent.epsilon:.2f}",
+                    "",
+                    f"Current Episode:",
+                    f"Best Reward: {current_episode_best:.2f}",
+                    f"Best Distance: {current_episode_best_distance:.2f}",
+                    "",
+                    f"All Episodes:",
+                    f"Best Reward: {best_reward_ever:.2f}",
+                    f"Best Distance: {best_distance_ever:.2f}",
+                ]
+                hud_rects = hud.update([(text, (0, 255, 0) if "Best" in text else (255, 255, 255)) for text in texts])
+                renderer.finish(hud_rects)
+                timer.mark("render")
+                clock.tick(config.FPS)
+                timer.mark("clock_tick")
+
+            # A window stays responsive between drawn steps and episodes, and ESC and "s" always work
+            if show_window and (rendered or step % config.EVENT_POLL_STEPS == 0):
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                        if recorder is not None:
+                            recorder.close()
+                        if remote is not None:
+                            remote.close()
+                        pygame.quit()
+                        return episode_rewards
+                timer.mark("events")
 
             step += 1
 
@@ -125,14 +188,60 @@ def train():
         agent.clone_best_q_table(best_car_index)
 
         episode_rewards.append(current_episode_best)
-        print(
-            f"Episode {episode + 1}, Best Reward: {current_episode_best:.2f}, All-Time Best: {best_reward_ever:.2f}"
-        )
+        if on_episode is not None:
+            on_episode(episode + 1, current_episode_best)
+        if recorder is not None:
+            recorder.end_episode(current_episode_best)
+        timer.end_episode(episode + 1, steps=step, best_reward=current_episode_best)
+        summary = f"Episode {episode + 1}, Best Reward: {current_episode_best:.2f}, All-Time Best: {best_reward_ever:.2f}"
+        if not population:
+            # The population collides all cars in bulk and never goes through the CollisionChecker
+            summary += f", Mask Overlaps Saved: {context.collision_checker.mask_overlaps_saved}"
+        print(summary)
 
         agent.epsilon = max(0.01, agent.epsilon * 0.995)
-
+        if remote is not None:
+            remote.poll()
+
+    if recorder is not None:
+        recorder.close()
+    if remote is not None:
+        print(f"Viewer frames sent: {remote.sent}, dropped: {remote.dropped}")
+        remote.close()
     pygame.quit()
+    return episode_rewards
 
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description="Train a population of Q-learning cars.")
+    parser.add_argument("--headless", action="store_true", default=config.HEADLESS,
+                        help="run without a window, per-step drawing or FPS cap")
+    parser.add_argument("--render-every-episodes", type=int, default=config.RENDER_EVERY_EPISODES,
+                        help="when headless, still draw every N-th episode (0 = never)")
+    parser.add_argument("--render-every-steps", type=int, default=config.RENDER_EVERY_STEPS,
+                        help="only draw every K-th step of a rendered episode")
+    parser.add_argument("--num-cars", type=int, default=10)
+    parser.add_argument("--population", action="store_true",
+                        help="step all cars as NumPy arrays instead of one Car object each")
+    parser.add_argument("--profile-phases", action="store_true", default=config.PROFILE_PHASES,
+                        help=f"log per-phase step timings to {config.PROFILE_PATH}")
+    parser.add_argument("--viewer", action="store_true",
+                        help="draw in a separate process that drops frames instead of slowing training; "
+                             "send SIGUSR1 to reopen it after closing")
+    parser.add_argument("--record", metavar="LOG", help="append every episode's actions to a trajectory log")
+    parser.add_argument("--record-poses", action="store_true", help="also log car poses, so replays can check them")
+    parser.add_argument("--seed", type=int, help="seed for exploration (recorded runs pick one if not given)")
+    args = parser.parse_args()
+    train(
+        headless=args.headless,
+        render_every_episodes=args.render_every_episodes,
+        render_every_steps=args.render_every_steps,
+        num_cars=args.num_cars,
+        population=args.population,
+        profile_phases=args.profile_phases,
+        viewer=args.viewer,
+        record=args.record,
+        record_poses=args.record_poses,
+        seed=args.seed,
+    )
+
@@ -0,0 +1,145 @@
+import math
+
+
+def round_half_away(value):
+    """Round like pygame does when a Rect is placed from float coordinates."""
+    return int(math.floor(abs(value) + 0.5)) * (1 if value >= 0 else -1)
+
+
+def state_attribute(name):
+    """Property that reads and writes `name` on the owner's `state`, for adapters wrapping a CarState."""
+    return property(lambda self: getattr(self.state, name), lambda self, value: setattr(self.state, name, value))
+
+
+class CarState:
+    """
+    Everything that changes while a car drives, and nothing else.
+
+    A plain __slots__ record with no pygame objects, so it is cheap to create, copy and
+    pickle, and can be stepped by CarPhysics in processes that never load an image.
+    """
+
+    __slots__ = ("x", "y", "angle", "velocity", "previous_position", "stuck_steps",
+                 "distance_this_frame", "distance_traveled")
+
+    def __init__(self, x, y, angle):
+        self.x = x
+        self.y = y
+        self.angle = angle
+        self.velocity = 0
+        self.previous_position = (x, y)
+        self.stuck_steps = 0
+        self.distance_this_frame = 0
+        self.distance_traveled = 0
+
+    def copy(self):
+        state = CarState.__new__(CarState)
+        for name in CarState.__slots__:
+            setattr(state, name, getattr(self, name))
+        return state
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in CarState.__slots__)
+
+    def __setstate__(self, values):
+        for name, value in zip(CarState.__slots__, values):
+            setattr(self, name, value)
+
+    @property
+    def center(self):
+        """Integer centre of the car's rect, as pygame would place it."""
+        return round_half_away(self.x), round_half_away(self.y)
+
+
+class CarPhysics:
+    """
+    Driving rules shared by every car: acceleration, braking, coasting, steering and movement.
+
+    Methods update a CarState in place. The parameters are the only per-car
+    configuration; human_game allows steering at any non-zero speed, the AI cars
+    only from min_velocity_for_rotation up.
+    """
+
+    def __init__(self, max_velocity, rotation_velocity, acceleration=0.1, min_velocity_for_rotation=0.1):
+        self.max_velocity = max_velocity
+        self.rotation_velocity = rotation_velocity
+        self.acceleration = acceleration
+        self.min_velocity_for_rotation = min_velocity_for_rotation
+
+    def rotate(self, state, left=False, right=False):
+        """Steer; reversing swaps left and right. Returns whether the car was allowed to turn."""
+        velocity = state.velocity
+        if velocity == 0 or abs(velocity) < self.min_velocity_for_rotation:
+            return False
+        if velocity > 0:
+            if left:
+                state.angle += self.rotation_velocity
+            elif right:
+                state.angle -= self.rotation_velocity
+        else:
+            if left:
+                state.angle -= self.rotation_velocity
+            elif right:
+                state.angle += self.rotation_velocity
+        return True
+
+    def move_forward(self, state):
+        """Accelerate forward, braking twice as hard while still reversing, then move."""
+        if state.velocity < 0:
+            state.velocity = min(state.velocity + self.acceleration * 2, 0)
+        else:
+            state.velocity = min(state.velocity + self.acceleration, self.max_velocity)
+        self.move(state)
+
+    def move_backward(self, state):
+        """Brake, then reverse up to half the top speed, then move."""
+        if state.velocity > 0:
+            state.velocity = max(state.velocity - self.acceleration * 2, 0)
+        else:
+            state.velocity = max(state.velocity - self.acceleration, -self.max_velocity / 2)
+        self.move(state)
+
+    def reduce_speed(self, state):
+        """Coast towards standstill, then move."""
+        if state.velocity > 0:
+            state.velocity = max(state.velocity - self.acceleration / 2, 0)
+        elif state.velocity < 0:
+            state.velocity = min(state.velocity + self.acceleration / 2, 0)
+        self.move(state)
+
+    def move(self, state):
+        """Advance along the heading by the current velocity and update the odometer and stuck counter."""
+        radians = math.radians(state.angle)
+        vertical_velocity = math.cos(radians) * state.velocity
+        horizontal_velocity = math.sin(radians) * state.velocity
+
+        new_y = state.y - vertical_velocity
+        new_x = state.x - horizontal_velocity
+
+        if state.previous_position == (state.x, state.y):
+            state.stuck_steps += 1
+        else:
+            state.stuck_steps = 0
+        state.previous_position = (state.x, state.y)
+
+        state.distance_this_frame = math.sqrt((new_x - state.x) ** 2 + (new_y - state.y) ** 2)
+        state.distance_traveled += state.distance_this_frame if state.velocity > 0 else -state.distance_this_frame
+
+        state.y = new_y
+        state.x = new_x
+
+    def handle_collision(self, state):
+        """Slow down after hitting something; the car keeps its position and heading."""
+        state.velocity *= 0.5
+
+    def bounce(self, state):
+        """Reverse the velocity and move."""
+        state.velocity *= -1
+        self.move(state)
+
+    def reset(self, state, position, angle):
+        state.x, state.y = position
+        state.angle = angle
+        state.velocity = 0
+        state.stuck_steps = 0
+        state.distance_traveled = 0
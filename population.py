@@ -0,0 +1,277 @@
+import numpy as np
+import config
+from game_utils import has_completed_track
+from sensors import distance_field, mask_to_array
+
+# Cars that drift onto the grass can leave the image; overlaps there count as free space
+FOOTPRINT_MARGIN = 128
+
+
+def pygame_round(values):
+    """Round half away from zero, as pygame does when a Rect centre is set from floats."""
+    return (np.sign(values) * np.floor(np.abs(values) + 0.5)).astype(np.int64)
+
+
+class CarFootprints:
+    """
+    Set pixels of the rotated car mask at every whole-degree angle, as offsets from the rect's top-left.
+
+    Offset lists are padded to one length by repeating their first pixel, so colliding
+    many cars is a single gather into a boolean track array.
+    """
+
+    def __init__(self, rotations):
+        offsets, sizes = [], []
+        for angle in range(360):
+            image, mask = rotations.get(angle)
+            offsets.append(np.argwhere(mask_to_array(mask)))
+            sizes.append(image.get_size())
+        longest = max(len(pixels) for pixels in offsets)
+        self.offsets = np.stack([np.concatenate([pixels, np.repeat(pixels[:1], longest - len(pixels), axis=0)]) for pixels in offsets])
+        self.sizes = np.array(sizes)
+
+    def overlaps(self, occupied, left, top, keys, origin=(0, 0)):
+        """
+        Which cars overlap `occupied`, a boolean array padded by FOOTPRINT_MARGIN on every side.
+        :param origin: Position of the unpadded array's top-left in screen coordinates.
+        """
+        offsets = self.offsets[keys]
+        xs = left[:, None] - origin[0] + FOOTPRINT_MARGIN + offsets[:, :, 0]
+        ys = top[:, None] - origin[1] + FOOTPRINT_MARGIN + offsets[:, :, 1]
+        np.clip(xs, 0, occupied.shape[0] - 1, out=xs)
+        np.clip(ys, 0, occupied.shape[1] - 1, out=ys)
+        return occupied[xs, ys].any(axis=1)
+
+
+class CarPopulation:
+    """
+    Physics for a whole population of cars held as NumPy arrays, one entry per car.
+
+    Follows Car and ParallelLearningCarEnvironment step for step: actions, rotation,
+    the double move of accelerate/brake/coast actions, wall and finish collisions,
+    reward and termination, all applied to every active car at once.
+    """
+
+    def __init__(self, num_cars, context, max_velocity=6, rotation_velocity=4, collision_mode=None):
+        self.num_cars = num_cars
+        self.context = context
+        self.collision_mode = collision_mode or config.COLLISION_MODE
+        self.max_velocity = max_velocity
+        self.rotation_velocity = rotation_velocity
+        self.acceleration = 0.1
+        self.min_velocity_for_rotation = 0.1
+        self.initial_angle = context.start_angle
+
+        if self.collision_mode == "mask":
+            # Box mode collides through the context's OrientedBoxCollider and never needs the rotated sprites
+            self.footprints = CarFootprints(context.car_rotations)
+            blocked = mask_to_array(context.track_border_mask) | mask_to_array(context.grass_mask)
+            self.blocked = np.pad(blocked, FOOTPRINT_MARGIN, constant_values=False)
+            self.clearance = distance_field(blocked)
+            self.finish = np.pad(mask_to_array(context.finish_mask), FOOTPRINT_MARGIN, constant_values=False)
+        self.finish_left, self.finish_top = context.finish_position
+        self.finish_width, self.finish_height = context.finish_mask.get_size()
+
+        self.x = np.zeros(num_cars)
+        self.y = np.zeros(num_cars)
+        self.previous_x = np.zeros(num_cars)
+        self.previous_y = np.zeros(num_cars)
+        self.angle = np.zeros(num_cars)
+        self.velocity = np.zeros(num_cars)
+        self.stuck_steps = np.zeros(num_cars, dtype=np.int64)
+        self.distance_this_frame = np.zeros(num_cars)
+        self.distance_traveled = np.zeros(num_cars)
+        self.total_reward = np.zeros(num_cars)
+        # Lap progress as of each car's last progress reward (see progress_map.py)
+        self.progress = np.full(num_cars, -1.0)
+        self.active = np.ones(num_cars, dtype=bool)
+        self.previous_x[:], self.previous_y[:] = self.context.start_position
+        self.reset()
+
+    def reset(self):
+        # Like Car.reset, previous positions carry over from the last episode into the first stuck check
+        self.x[:], self.y[:] = self.context.start_position
+        self.angle[:] = self.initial_angle
+        self.velocity[:] = 0
+        self.stuck_steps[:] = 0
+        self.distance_this_frame[:] = 0
+        self.distance_traveled[:] = 0
+        self.total_reward[:] = 0
+        self.active[:] = True
+        if config.PROGRESS_REWARD:
+            center_x, center_y = pygame_round(self.x), pygame_round(self.y)
+            self.progress[:] = self.context.progress_map.lookup_many(center_x, center_y)
+
+    def rects(self, idx):
+        """Rect centre, left and top of the rotated sprite for the given cars, matching Car.rect (mask mode only)."""
+        center_x, center_y = pygame_round(self.x[idx]), pygame_round(self.y[idx])
+        keys = np.rint(self.angle[idx]).astype(np.int64) % 360
+        width, height = self.footprints.sizes[keys].T
+        return center_x, center_y, center_x - width // 2, center_y - height // 2, keys
+
+    def rotate(self, idx, direction):
+        """Turn the given cars left (direction 1) or right (-1) if they move fast enough, reversed when backing up."""
+        velocity = self.velocity[idx]
+        turning = np.abs(velocity) >= self.min_velocity_for_rotation
+        sign = np.where(velocity > 0, direction, -direction)
+        self.angle[idx] += np.where(turning, sign * self.rotation_velocity, 0)
+
+    def move(self, idx):
+        """Vectorised Car.move for the given cars."""
+        radians = np.radians(self.angle[idx])
+        velocity = self.velocity[idx]
+        x, y = self.x[idx], self.y[idx]
+        new_y = y - np.cos(radians) * velocity
+        new_x = x - np.sin(radians) * velocity
+
+        stuck = (self.previous_x[idx] == x) & (self.previous_y[idx] == y)
+        self.stuck_steps[idx] = np.where(stuck, self.stuck_steps[idx] + 1, 0)
+        self.previous_x[idx], self.previous_y[idx] = x, y
+
+        distance = np.sqrt((new_x - x) ** 2 + (new_y - y) ** 2)
+        self.distance_this_frame[idx] = distance
+        self.distance_traveled[idx] += np.where(velocity > 0, distance, -distance)
+        self.x[idx], self.y[idx] = new_x, new_y
+
+    def take_actions(self, idx, actions):
+        """Vectorised ParallelLearningCarEnvironment.take_action."""
+        velocity = self.velocity[idx]
+        acceleration = self.acceleration
+        forward = np.where(velocity < 0, np.minimum(velocity + acceleration * 2, 0), np.minimum(velocity + acceleration, self.max_velocity))
+        backward = np.where(velocity > 0, np.maximum(velocity - acceleration * 2, 0), np.maximum(velocity - acceleration, -self.max_velocity / 2))
+        coast = np.where(velocity > 0, np.maximum(velocity - acceleration / 2, 0), np.where(velocity < 0, np.minimum(velocity + acceleration / 2, 0), velocity))
+        self.velocity[idx] = np.select([actions == 2, actions == 3, actions >= 4], [forward, backward, coast], velocity)
+
+        self.rotate(idx[actions == 0], 1)
+        self.rotate(idx[actions == 1], -1)
+        # move_forward, move_backward and reduce_speed move once themselves before take_action's own move
+        self.move(idx[actions >= 2])
+        self.move(idx)
+
+    def collide(self, idx):
+        """Wall and finish-line collisions for the given cars, as (hit_wall, at_finish) boolean arrays."""
+        if self.collision_mode == "box":
+            return self.context.box_collider.collide(self.x[idx], self.y[idx], self.angle[idx])
+        center_x, center_y, left, top, keys = self.rects(idx)
+        half_extent = np.maximum(center_x - left, center_y - top)
+        inside = (center_x >= 0) & (center_x < self.clearance.shape[0]) & (center_y >= 0) & (center_y < self.clearance.shape[1])
+        clear = np.zeros(len(idx), dtype=bool)
+        clear[inside] = self.clearance[center_x[inside], center_y[inside]] > half_extent[inside]
+
+        hit_wall = np.zeros(len(idx), dtype=bool)
+        near = ~clear
+        hit_wall[near] = self.footprints.overlaps(self.blocked, left[near], top[near], keys[near])
+
+        width, height = self.footprints.sizes[keys].T
+        near_finish = (
+            (left < self.finish_left + self.finish_width) & (left + width > self.finish_left)
+            & (top < self.finish_top + self.finish_height) & (top + height > self.finish_top)
+        )
+        at_finish = np.zeros(len(idx), dtype=bool)
+        at_finish[near_finish] = self.footprints.overlaps(
+            self.finish, left[near_finish], top[near_finish], keys[near_finish], (self.finish_left, self.finish_top)
+        )
+        return hit_wall, at_finish
+
+    def step(self, actions):
+        """
+        Advance every active car by one action.
+        :param actions: One action per car; entries of inactive cars are ignored.
+        :return: Indices of the cars that were stepped, their rewards and their done flags.
+        """
+        idx = np.flatnonzero(self.active)
+        actions = np.asarray(actions)[idx]
+        self.take_actions(idx, actions)
+
+        hit_wall, at_finish = self.collide(idx)
+        # Car.handle_collision only slows the car down; its pose is unchanged
+        self.velocity[idx[hit_wall]] *= 0.5
+
+        completed = has_completed_track(self.initial_angle, self.context.finish_position, (self.x[idx], self.y[idx]))
+        velocity = self.velocity[idx]
+        distance = self.distance_this_frame[idx]
+        if config.PROGRESS_REWARD:
+            rewards = self.progress_rewards(idx, ~hit_wall & ~at_finish)
+        else:
+            rewards = np.where(velocity > 0, distance, -10 * distance)
+        rewards = np.where(at_finish, np.where(completed, 100, -10), rewards)
+        rewards = np.where(hit_wall, -10, rewards)
+
+        # Like is_done, termination looks at the reward total before this step's reward
+        dones = (
+            (self.stuck_steps[idx] >= config.STUCK_TIMEOUT_STEPS)
+            | (self.total_reward[idx] <= -config.MAX_NEGATIVE_REWARD)
+            | at_finish
+        )
+        self.total_reward[idx] += rewards
+        self.active[idx[dones]] = False
+        return idx, rewards, dones
+
+    def progress_rewards(self, idx, rewarded):
+        """
+        ProgressMap.reward for the given cars; as in calculate_reward, only `rewarded`
+        cars (those not at a wall or the finish) update their progress.
+        """
+        previous = self.progress[idx]
+        current = self.context.progress_map.lookup_many(pygame_round(self.x[idx]), pygame_round(self.y[idx]))
+        gained = current - previous
+        rewards = np.where(gained >= 0, gained, gained * config.PROGRESS_BACKWARD_PENALTY)
+        on_track = (previous >= 0) & (current >= 0)
+        rewards = np.where(on_track, rewards, 0.0)
+        self.progress[idx] = np.where(rewarded & (current >= 0), current, previous)
+        return rewards
+
+    def observations(self, idx):
+        """Discretised (angle, 8 ray distances) observation rows for the given cars, as in get_state."""
+        center_x, center_y = pygame_round(self.x[idx]), pygame_round(self.y[idx])
+        distances = self.context.border_sensor.cast(np.stack([center_x, center_y], axis=1))
+        max_distance = max(self.context.width, self.context.height)
+        observations = np.empty((len(idx), 1 + distances.shape[1]), dtype=np.int64)
+        observations[:, 0] = np.clip(np.trunc(self.angle[idx] / (360 / 8)), 0, 7)
+        observations[:, 1:] = np.clip(np.trunc(distances / (max_distance / 5)), 0, 4)
+        return observations
+
+
+class CarView:
+    """Read-only stand-in for a Car backed by one row of a CarPopulation, for drawing and HUDs."""
+
+    def __init__(self, population, index):
+        self.population = population
+        self.index = index
+
+    @property
+    def x(self):
+        return float(self.population.x[self.index])
+
+    @property
+    def y(self):
+        return float(self.population.y[self.index])
+
+    @property
+    def angle(self):
+        return float(self.population.angle[self.index])
+
+    @property
+    def velocity(self):
+        return float(self.population.velocity[self.index])
+
+    @property
+    def distance_traveled(self):
+        return float(self.population.distance_traveled[self.index])
+
+    @property
+    def rotated_image(self):
+        image, _ = self.population.context.car_rotations.get(self.angle)
+        return image
+
+    @property
+    def rect(self):
+        return self.rotated_image.get_rect(center=(self.x, self.y))
+
+    def draw(self, win):
+        win.blit(self.rotated_image, self.rect.topleft)
+
+    def ray_cast(self, mask, angle):
+        """Border distance along `angle`; populations only ever sense the track border, so `mask` is ignored."""
+        lengths = self.population.context.border_sensor.cast([self.rect.center], [angle])
+        return int(lengths[0, 0])
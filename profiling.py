@@ -0,0 +1,87 @@
+import json
+import os
+import time
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class PhaseTimer:
+    """
+    Splits each training step into named phases and writes per-episode statistics as JSON lines.
+
+    Call begin() at the top of a step, then mark(phase) after each phase: the time since
+    the previous mark is added to that phase. Marking a phase more than once in a step
+    adds up. end_episode() summarises every phase as count, total and percentiles in
+    milliseconds and appends one line to `path`, rotating the file to `path`.1 once it
+    grows past `max_bytes`.
+    """
+
+    enabled = True
+
+    def __init__(self, path, max_bytes=10_000_000, clock=time.perf_counter):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.durations = {}
+        self.counters = {}
+        self.last = clock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def begin(self):
+        self.last = self.clock()
+
+    def mark(self, phase):
+        now = self.clock()
+        self.durations.setdefault(phase, []).append(now - self.last)
+        self.last = now
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        phases = {}
+        for phase, durations in self.durations.items():
+            durations = np.asarray(durations) * 1000
+            stats = {"count": len(durations), "total_ms": float(durations.sum())}
+            for percentile, value in zip(PERCENTILES, np.percentile(durations, PERCENTILES)):
+                stats[f"p{percentile}_ms"] = float(value)
+            stats["max_ms"] = float(durations.max())
+            phases[phase] = stats
+        return phases
+
+    def end_episode(self, episode, **extra):
+        """Write this episode's line and start collecting the next one."""
+        record = {"episode": episode, "time": time.time(), "phases": self.summary(), "counters": self.counters}
+        record.update(extra)
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            os.replace(self.path, self.path + ".1")
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        self.durations = {}
+        self.counters = {}
+        return record
+
+
+class NullPhaseTimer:
+    """Stand-in used when phase timing is off; every call returns immediately."""
+
+    enabled = False
+
+    def begin(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def end_episode(self, episode, **extra):
+        return None
+
+
+def make_phase_timer(enabled, path):
+    return PhaseTimer(path) if enabled else NullPhaseTimer()
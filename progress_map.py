@@ -0,0 +1,202 @@
+import hashlib
+import heapq
+import math
+import os
+import numpy as np
+from sensor_table import CACHE_DIR
+from sensors import mask_to_array
+
+MAP_VERSION = 1
+# Direction a car at each start angle drives off in, as (dx, dy); see physics.CarPhysics.move
+START_DIRECTIONS = {0: (0, -1), 90: (-1, 0), 180: (0, 1), 270: (1, 0)}
+NEIGHBOURS = [(dx, dy, math.hypot(dx, dy)) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+def drivable_pixels(context):
+    """(width, height) boolean array of the pixels a car's centre can be on."""
+    blocked = mask_to_array(context.track_border_mask) | mask_to_array(context.grass_mask)
+    return mask_to_array(context.track_mask) & ~blocked
+
+
+def progress_map_path(context):
+    """Cache file for a track's progress map, named after a hash of everything that affects its contents."""
+    digest = hashlib.sha1()
+    digest.update(f"{MAP_VERSION}:{context.finish_position}:{context.finish_mask.get_size()}:{context.start_angle}".encode())
+    drivable = drivable_pixels(context)
+    digest.update(f"{drivable.shape}".encode())
+    digest.update(np.packbits(drivable).tobytes())
+    return os.path.join(CACHE_DIR, f"progress_{context.name}_{digest.hexdigest()[:12]}.npy")
+
+
+def finish_barrier(drivable, finish_position, finish_size, start_angle):
+    """
+    Drivable pixels of the finish line's strip across the track.
+
+    The finish image need not span the whole road, so its rect is grown sideways
+    along the strip until it meets the track border.
+    :return: (barrier, before, after): the barrier and the drivable pixels bordering it
+        on the side cars start from (after) and the side they finish from (before).
+    """
+    left, top = finish_position
+    width, height = finish_size
+    dx, dy = START_DIRECTIONS[start_angle]
+    barrier = np.zeros_like(drivable)
+    barrier[left:left + width, top:top + height] = drivable[left:left + width, top:top + height]
+    strip = np.zeros_like(drivable)
+    if dx:
+        strip[left:left + width, :] = drivable[left:left + width, :]
+    else:
+        strip[:, top:top + height] = drivable[:, top:top + height]
+    while True:
+        grown = barrier.copy()
+        grown[1:, :] |= barrier[:-1, :]
+        grown[:-1, :] |= barrier[1:, :]
+        grown[:, 1:] |= barrier[:, :-1]
+        grown[:, :-1] |= barrier[:, 1:]
+        grown &= strip
+        if np.array_equal(grown, barrier):
+            break
+        barrier = grown
+
+    def bordering(sx, sy):
+        shifted = np.zeros_like(barrier)
+        shifted[max(sx, 0):barrier.shape[0] + min(sx, 0), max(sy, 0):barrier.shape[1] + min(sy, 0)] = \
+            barrier[max(-sx, 0):barrier.shape[0] + min(-sx, 0), max(-sy, 0):barrier.shape[1] + min(-sy, 0)]
+        return shifted & drivable & ~barrier
+
+    return barrier, bordering(-dx, -dy), bordering(dx, dy)
+
+
+def geodesic_distance(passable, seeds):
+    """
+    Shortest 8-connected path length from the seed pixels to every passable pixel.
+    :return: (width, height) float64 array, inf where no path exists.
+    """
+    width, height = passable.shape
+    distance = np.full(width * height, np.inf)
+    open_pixels = passable.ravel().tolist()
+    offsets = [(dx * height + dy, dx, dy, cost) for dx, dy, cost in NEIGHBOURS]
+    queue = []
+    for index in np.flatnonzero(seeds.ravel()).tolist():
+        distance[index] = 0.0
+        queue.append((0.0, index))
+    heapq.heapify(queue)
+    done = bytearray(width * height)
+    while queue:
+        current, index = heapq.heappop(queue)
+        if done[index]:
+            continue
+        done[index] = 1
+        x, y = divmod(index, height)
+        for offset, dx, dy, cost in offsets:
+            if not (0 <= x + dx < width and 0 <= y + dy < height):
+                continue
+            neighbour = index + offset
+            if not open_pixels[neighbour] or done[neighbour]:
+                continue
+            candidate = current + cost
+            if candidate < distance[neighbour]:
+                distance[neighbour] = candidate
+                heapq.heappush(queue, (candidate, neighbour))
+    return distance.reshape(width, height)
+
+
+def compute_progress(context):
+    """
+    Arc length along the track, in pixels, from the start side of the finish line to every drivable pixel.
+
+    The finish line is made a wall, so shortest paths from the start side have to go
+    round the lap in the driving direction. Raw path lengths hug the inside of every
+    bend, so each pixel's distance from the start side (d_start) is blended with its
+    distance back from the finish side (d_finish) as lap * d_start / (d_start + d_finish),
+    which keeps equal-progress lines square across the road.
+    :return: (width, height) float32 array, -1 where the car's centre cannot be or the
+        track is not reachable.
+    """
+    drivable = drivable_pixels(context)
+    barrier, before, after = finish_barrier(
+        drivable, context.finish_position, context.finish_mask.get_size(), context.start_angle
+    )
+    passable = drivable & ~barrier
+    from_start = geodesic_distance(passable, after)
+    to_finish = geodesic_distance(passable, before)
+    lap_length = from_start[before].min()
+    reachable = np.isfinite(from_start) & np.isfinite(to_finish)
+    progress = np.full(drivable.shape, -1, dtype=np.float32)
+    total = from_start[reachable] + to_finish[reachable]
+    progress[reachable] = lap_length * from_start[reachable] / np.maximum(total, 1e-9)
+    return progress
+
+
+def build_progress_map(context, path):
+    """Compute a track's progress map and store it as a .npy file, written to a temporary name first."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.save(f, compute_progress(context))
+    os.replace(temp_path, path)
+
+
+def load_progress_map(context):
+    """The context's memory-mapped ProgressMap, built first if this track has none cached yet."""
+    path = progress_map_path(context)
+    if not os.path.exists(path):
+        print(f"Building the progress map for {context.name}, once, into {path}")
+        build_progress_map(context, path)
+    return ProgressMap(np.load(path, mmap_mode="r"))
+
+
+class ProgressMap:
+    """
+    How far along the lap every pixel of the track is, for progress rewards.
+
+    Progress and wrong-way driving then cost one array read per car and step: a
+    car's progress is the map's value at its centre, and driving the wrong way is
+    any step that lowers it.
+    """
+
+    def __init__(self, values):
+        # A plain ndarray view of the memory map reads single pixels about three times faster
+        self.values = np.asarray(values)
+        self.width, self.height = values.shape
+        self.lap_length = float(values.max())
+
+    def lookup(self, x, y):
+        """Arc length at integer pixel (x, y), -1 off the track."""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return float(self.values[x, y])
+        return -1.0
+
+    def lookup_many(self, x, y):
+        """lookup for arrays of integer pixels."""
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        progress = np.full(len(x), -1.0)
+        progress[inside] = self.values[x[inside], y[inside]]
+        return progress
+
+    @staticmethod
+    def reward(previous, current, backward_penalty):
+        """
+        Reward for moving from arc length `previous` to `current`, and the arc length to remember.
+
+        Progress counts one point per pixel and lost progress `backward_penalty` points;
+        a step that starts or ends off the track earns nothing and keeps the last known
+        progress.
+        """
+        if current < 0:
+            return 0.0, previous
+        if previous < 0:
+            return 0.0, current
+        gained = current - previous
+        return (gained if gained >= 0 else gained * backward_penalty), current
+
+
+if __name__ == "__main__":
+    from ai_game import get_context
+
+    context = get_context()
+    path = progress_map_path(context)
+    build_progress_map(context, path)
+    progress = np.load(path)
+    print(f"Wrote {path}: lap length {progress.max():.0f} px, "
+          f"{(progress >= 0).sum()} of {(drivable_pixels(context)).sum()} drivable pixels reachable")
@@ -0,0 +1,120 @@
+import numpy as np
+
+# One angle bin and eight ray-distance bins, as produced by the environments' get_state
+STATE_BINS = (8,) + (5,) * 8
+
+
+class DenseQTable:
+    """
+    Q-values for every state of a bounded discrete state space in one preallocated float32 array.
+
+    States are tuples of bin indices and map to rows through a mixed-radix encoding, so a
+    lookup is integer arithmetic plus an array index instead of hashing tuples. It also
+    answers `get((state, action), default)` like the dict tables it replaces.
+    """
+
+    def __init__(self, num_actions, default_value=4.0, state_bins=STATE_BINS, values=None, touched=None):
+        """
+        :param values: Existing (num_states, num_actions) float32 array to wrap, e.g. a view of
+            shared memory. A new array filled with default_value is allocated when omitted.
+        :param touched: Boolean array flagging the rows of `values` that may differ from
+            default_value. New tables track it from the start; for wrapped values without it,
+            touched_rows() scans the whole array instead.
+        """
+        self.num_actions = num_actions
+        self.default_value = default_value
+        self.state_bins = tuple(state_bins)
+        self.num_states = int(np.prod(self.state_bins))
+        if values is None:
+            values = np.full((self.num_states, num_actions), default_value, dtype=np.float32)
+            touched = np.zeros(self.num_states, dtype=bool)
+        self.values = values
+        self.touched = touched
+
+    def mark(self, indices):
+        """Flag rows as written; every write to `values` goes through here or the methods below."""
+        if self.touched is not None:
+            self.touched[indices] = True
+
+    def touched_rows(self):
+        """Sorted rows that may differ from default_value, e.g. for sparse checkpoints."""
+        if self.touched is None:
+            return np.flatnonzero((self.values != self.default_value).any(axis=1))
+        return np.flatnonzero(self.touched)
+
+    def state_index(self, state):
+        """Row of a single state tuple."""
+        index = 0
+        for value, bins in zip(state, self.state_bins):
+            index = index * bins + value
+        return index
+
+    def state_indices(self, states):
+        """Rows of a batch of state tuples (or of an (n, len(state_bins)) array)."""
+        states = np.asarray(states, dtype=np.int64).reshape(-1, len(self.state_bins))
+        return np.ravel_multi_index(states.T, self.state_bins)
+
+    def get(self, key, default=None):
+        """Dict-style read; unseen entries already hold default_value, so `default` is unused."""
+        state, action = key
+        return float(self.values[self.state_index(state), action])
+
+    def __setitem__(self, key, value):
+        state, action = key
+        index = self.state_index(state)
+        self.values[index, action] = value
+        self.mark(index)
+
+    def best_action(self, state):
+        return int(self.values[self.state_index(state)].argmax())
+
+    def best_actions(self, indices):
+        """Greedy action for every row in `indices`; ties go to the lowest action like np.argmax."""
+        return self.values[indices].argmax(axis=1)
+
+    def update(self, indices, actions, rewards, next_indices, learning_rate, discount_factor, dones=None, weights=None):
+        """
+        Vectorised one-step Q-learning update for a batch of transitions.
+
+        All targets are computed from the values before the batch; if the same
+        (state, action) appears more than once, the last transition wins.
+        :param weights: Per-transition step size multipliers, e.g. importance weights from prioritised replay.
+        :return: The TD errors of the batch.
+        """
+        next_max = self.values[next_indices].max(axis=1)
+        if dones is not None:
+            next_max = np.where(dones, 0.0, next_max)
+        current = self.values[indices, actions]
+        target = np.asarray(rewards, dtype=np.float32) + discount_factor * next_max
+        td_errors = target - current
+        step = learning_rate * td_errors if weights is None else learning_rate * weights * td_errors
+        self.values[indices, actions] = current + step
+        self.mark(indices)
+        return td_errors
+
+    def to_dict(self):
+        """Every entry that differs from the default, in the {(state, action): value} dict format."""
+        candidates = self.touched_rows()
+        positions, actions = np.nonzero(self.values[candidates] != self.default_value)
+        rows = candidates[positions]
+        states = np.stack(np.unravel_index(rows, self.state_bins), axis=1)
+        return {
+            (tuple(int(v) for v in state), int(action)): float(self.values[row, action])
+            for state, row, action in zip(states, rows, actions)
+        }
+
+    @classmethod
+    def from_dict(cls, q_table, num_actions, default_value=4.0, state_bins=STATE_BINS, dtype=np.float32):
+        """
+        Build a dense table from a pickled {(state, action): value} dict table.
+        :param dtype: np.float64 keeps the dict's values exactly, e.g. to pick the same greedy actions.
+        """
+        values = np.full((int(np.prod(state_bins)), num_actions), default_value, dtype=dtype)
+        table = cls(num_actions, default_value, state_bins, values=values, touched=np.zeros(len(values), dtype=bool))
+        if q_table:
+            keys = list(q_table)
+            indices = table.state_indices([state for state, _ in keys])
+            actions = np.array([action for _, action in keys])
+            table.values[indices, actions] = np.array([q_table[key] for key in keys], dtype=dtype)
+            table.mark(indices)
+        return table
@@ -0,0 +1,195 @@
+import functools
+import pygame
+from utils import draw_actions
+
+
+def compose_background(size, layers, fill=None):
+    """
+    Flatten static layers into one surface, blitted once per frame instead of layer by layer.
+    :param layers: (surface, position) pairs, bottom first.
+    """
+    background = pygame.Surface(size)
+    if fill is not None:
+        background.fill(fill)
+    for surface, position in layers:
+        background.blit(surface, position)
+    # Match the display's pixel format so later blits need no conversion
+    return background.convert() if pygame.display.get_surface() is not None else background
+
+
+def track_layers(context, border=True):
+    """Static layers of the track in drawing order; leave the border out to draw it above the cars."""
+    layers = [(context.grass, (0, 0)), (context.track, (0, 0)), (context.finish, context.finish_position)]
+    if border:
+        layers.append((context.track_border, (0, 0)))
+    return layers
+
+
+@functools.lru_cache(maxsize=None)
+def action_keys(action):
+    """draw_actions surface for an action, built once per action."""
+    return draw_actions(None, action)
+
+
+def merge_rects(rects):
+    """Replace overlapping rectangles by their bounding boxes until none overlap."""
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        while True:
+            hits = rect.collidelistall(merged)
+            if not hits:
+                break
+            rect.unionall_ip([merged[i] for i in hits])
+            for i in reversed(hits):
+                del merged[i]
+        merged.append(rect)
+    return merged
+
+
+class TextCache:
+    """Rendered text surfaces keyed by (text, color), so unchanged HUD strings are not rendered again."""
+
+    def __init__(self, font, max_entries=1024):
+        self.font = font
+        self.max_entries = max_entries
+        self.surfaces = {}
+
+    def render(self, text, color=(255, 255, 255)):
+        key = (text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            if len(self.surfaces) >= self.max_entries:
+                # Counters change every frame; start over rather than track recency
+                self.surfaces.clear()
+            surface = self.font.render(text, True, color)
+            self.surfaces[key] = surface
+        return surface
+
+
+class SceneRenderer:
+    """
+    Draws moving sprites over a cached background and updates only the screen areas that changed.
+
+    Between begin() and finish(), blit() and line() record sprites and the area each one
+    covers. finish() restores the background under this frame's and last frame's areas,
+    draws the sprites and the optional overlay layer (e.g. a track border meant to sit
+    above the cars), and passes just those rectangles to pygame.display.update. When the
+    areas add up to more than `full_redraw_fraction` of the scene, the whole scene is
+    redrawn and updated at once instead, which is cheaper than many large overlapping blits.
+    """
+
+    def __init__(self, window, background, overlay=None, full_redraw_fraction=0.5):
+        self.window = window
+        self.background = background
+        if overlay is not None and pygame.display.get_surface() is not None:
+            # Blending an unconverted per-pixel-alpha image over the whole scene costs ~25x more
+            overlay = overlay.convert_alpha()
+        self.overlay = overlay
+        self.scene_rect = background.get_rect()
+        self.full_redraw_area = self.scene_rect.width * self.scene_rect.height * full_redraw_fraction
+        self.previous_rects = None
+        self.rects = []
+        self.operations = []
+
+    def reset(self):
+        """Force a full redraw on the next frame, e.g. after something else drew over the window."""
+        self.previous_rects = None
+
+    def begin(self):
+        self.rects = []
+        self.operations = []
+
+    def blit(self, image, position):
+        self.operations.append((self.window.blit, (image, position)))
+        self.rects.append(image.get_rect(topleft=position))
+
+    def line(self, color, start, end, width=1):
+        self.operations.append((pygame.draw.line, (self.window, color, start, end, width)))
+        left, right = sorted((int(start[0]), int(end[0])))
+        top, bottom = sorted((int(start[1]), int(end[1])))
+        self.rects.append(pygame.Rect(left - width, top - width, right - left + 2 * width + 1, bottom - top + 2 * width + 1))
+
+    def finish(self, extra_rects=()):
+        """Draw the recorded frame and push the changed areas (plus `extra_rects`) to the display."""
+        rects = [rect.clip(self.scene_rect) for rect in self.rects]
+        full = self.previous_rects is None
+        if not full:
+            dirty = [rect for rect in self.previous_rects + rects if rect.width and rect.height]
+            full = sum(rect.width * rect.height for rect in dirty) > self.full_redraw_area
+        if full:
+            dirty = [self.scene_rect]
+        else:
+            dirty = merge_rects(dirty)
+
+        # Sprites must not spill into whatever shares the window with the scene, like a HUD
+        self.window.set_clip(self.scene_rect)
+        for rect in dirty:
+            self.window.blit(self.background, rect, rect)
+        for draw, args in self.operations:
+            draw(*args)
+        if self.overlay is not None:
+            # Areas are disjoint, so a translucent overlay is never blended twice
+            for rect in dirty:
+                self.window.blit(self.overlay, rect, rect)
+        self.window.set_clip(None)
+
+        self.previous_rects = rects
+        pygame.display.update(dirty + list(extra_rects))
+
+
+class HudPanel:
+    """
+    A fixed panel of text lines and images that only redraws entries whose content changed.
+
+    update() returns the rectangles it redrew, for SceneRenderer.finish's extra_rects.
+    """
+
+    def __init__(self, window, rect, font, line_height, fill=(30, 30, 30), padding=10):
+        self.window = window
+        self.rect = pygame.Rect(rect)
+        self.text = TextCache(font)
+        self.line_height = line_height
+        self.fill = fill
+        self.padding = padding
+        self.lines = None
+        self.images = {}
+
+    def reset(self):
+        self.lines = None
+        self.images = {}
+
+    def update(self, lines, images=()):
+        """
+        :param lines: (text, color) pairs, one per row.
+        :param images: (surface, position) pairs relative to the panel; surfaces are compared by identity.
+        """
+        dirty = []
+        redraw_all = self.lines is None
+        if redraw_all:
+            self.window.fill(self.fill, self.rect)
+            dirty.append(self.rect)
+            self.lines = []
+            self.images = {}
+        for i in range(max(len(lines), len(self.lines))):
+            line = lines[i] if i < len(lines) else None
+            if not redraw_all and i < len(self.lines) and self.lines[i] == line:
+                continue
+            row = pygame.Rect(self.rect.left, self.rect.top + self.padding + i * self.line_height,
+                              self.rect.width, self.line_height)
+            self.window.fill(self.fill, row)
+            if line is not None and line[0]:
+                text, color = line
+                self.window.blit(self.text.render(text, color), (row.left + self.padding, row.top))
+            dirty.append(row)
+        self.lines = list(lines)
+
+        for surface, position in images:
+            if not redraw_all and self.images.get(position) is surface:
+                continue
+            area = surface.get_rect(topleft=(self.rect.left + position[0], self.rect.top + position[1]))
+            self.window.fill(self.fill, area)
+            self.window.blit(surface, area)
+            self.images[position] = surface
+            dirty.append(area)
+        return dirty
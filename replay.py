@@ -0,0 +1,192 @@
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Fixed-capacity ring buffer of (state row, action, reward, next state row, done) transitions.
+
+    All storage is preallocated NumPy arrays; once full, each new transition overwrites
+    the oldest one, so memory stays at `capacity` entries however long training runs.
+    States are stored as DenseQTable row indices. sample() draws uniformly.
+    """
+
+    def __init__(self, capacity, seed=None):
+        self.capacity = capacity
+        self.states = np.zeros(capacity, dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros(capacity, dtype=np.int64)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done):
+        """Store one transition and return the slot it was written to."""
+        slot = self.position
+        self.states[slot] = state
+        self.actions[slot] = action
+        self.rewards[slot] = reward
+        self.next_states[slot] = next_state
+        self.dones[slot] = done
+        self.position = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return slot
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """Store a batch of transitions in order; returns their slots."""
+        slots = (self.position + np.arange(len(states))) % self.capacity
+        self.states[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.next_states[slots] = next_states
+        self.dones[slots] = dones
+        self.position = int((self.position + len(states)) % self.capacity)
+        self.size = min(self.size + len(states), self.capacity)
+        return slots
+
+    def sample(self, batch_size):
+        """
+        Draw `batch_size` stored transitions uniformly, with replacement.
+        :return: (slots, states, actions, rewards, next_states, dones, weights); weights are all one.
+        """
+        slots = self.rng.integers(self.size, size=batch_size)
+        return self.gather(slots) + (np.ones(batch_size, dtype=np.float32),)
+
+    def gather(self, slots):
+        return (
+            slots,
+            self.states[slots],
+            self.actions[slots],
+            self.rewards[slots],
+            self.next_states[slots],
+            self.dones[slots],
+        )
+
+    def update_priorities(self, slots, td_errors):
+        """Uniform sampling ignores priorities."""
+
+    def snapshot(self):
+        """
+        Copy the buffer's contents and sampling state, for checkpoints.
+        :return: (arrays, state): a dict of NumPy arrays and a JSON-serialisable dict.
+        """
+        arrays = {
+            "states": self.states[:self.size].copy(),
+            "actions": self.actions[:self.size].copy(),
+            "rewards": self.rewards[:self.size].copy(),
+            "next_states": self.next_states[:self.size].copy(),
+            "dones": self.dones[:self.size].copy(),
+        }
+        state = {
+            "prioritized": False,
+            "capacity": self.capacity,
+            "position": self.position,
+            "size": self.size,
+            "rng": self.rng.bit_generator.state,
+        }
+        return arrays, state
+
+    def restore(self, arrays, state):
+        """Load a snapshot() into this buffer, which must have the same kind and capacity."""
+        if state["prioritized"] != isinstance(self, PrioritizedReplayBuffer) or state["capacity"] != self.capacity:
+            raise ValueError(
+                f"Cannot restore a {'prioritised' if state['prioritized'] else 'uniform'} replay buffer of "
+                f"capacity {state['capacity']} into a {type(self).__name__} of capacity {self.capacity}"
+            )
+        size = state["size"]
+        self.states[:size] = arrays["states"]
+        self.actions[:size] = arrays["actions"]
+        self.rewards[:size] = arrays["rewards"]
+        self.next_states[:size] = arrays["next_states"]
+        self.dones[:size] = arrays["dones"]
+        self.position = state["position"]
+        self.size = size
+        self.rng.bit_generator.state = state["rng"]
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer that samples transitions in proportion to |TD error| ** alpha.
+
+    Priorities live in an array-backed sum tree, so sampling and priority updates are
+    O(batch * log capacity) NumPy operations. New transitions get the highest priority
+    seen so far, so each is replayed at least about once. Samples come with importance
+    weights (N * P(i)) ** -beta, normalised by their maximum, to correct the update bias.
+    """
+
+    def __init__(self, capacity, alpha=0.6, beta=0.4, epsilon=1e-3, seed=None):
+        super().__init__(capacity, seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        # tree[1] is the root; leaves start at tree[self.leaves]
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    def set_priorities(self, slots, priorities):
+        nodes = np.asarray(slots) + self.leaves
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def add(self, state, action, reward, next_state, done):
+        slot = super().add(state, action, reward, next_state, done)
+        self.set_priorities([slot], self.max_priority)
+        return slot
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        slots = super().add_batch(states, actions, rewards, next_states, dones)
+        self.set_priorities(slots, self.max_priority)
+        return slots
+
+    def sample(self, batch_size):
+        # One draw per equal slice of the total priority mass, then walk down the tree
+        total = self.tree[1]
+        targets = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+        nodes = np.ones(batch_size, dtype=np.int64)
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            go_right = targets >= self.tree[left]
+            targets = np.where(go_right, targets - self.tree[left], targets)
+            nodes = np.where(go_right, left + 1, left)
+        # Rounding can land on an empty leaf past the stored transitions
+        slots = np.minimum(nodes - self.leaves, self.size - 1)
+
+        probabilities = self.tree[slots + self.leaves] / total
+        weights = (self.size * np.maximum(probabilities, 1e-12)) ** -self.beta
+        weights /= weights.max()
+        return self.gather(slots) + (weights.astype(np.float32),)
+
+    def update_priorities(self, slots, td_errors):
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.set_priorities(slots, priorities)
+
+    def snapshot(self):
+        arrays, state = super().snapshot()
+        arrays["tree"] = self.tree.copy()
+        state.update(prioritized=True, max_priority=self.max_priority)
+        return arrays, state
+
+    def restore(self, arrays, state):
+        super().restore(arrays, state)
+        self.tree[:] = arrays["tree"]
+        self.max_priority = state["max_priority"]
+
+
+def make_replay_buffer(capacity, prioritized=False, alpha=0.6, beta=0.4, seed=None):
+    """Buffer for QLearningAgent's `replay` argument, or None when capacity is 0."""
+    if capacity <= 0:
+        return None
+    if prioritized:
+        return PrioritizedReplayBuffer(capacity, alpha, beta, seed=seed)
+    return ReplayBuffer(capacity, seed)
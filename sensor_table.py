@@ -0,0 +1,88 @@
+import hashlib
+import os
+import numpy as np
+from sensors import SENSOR_ANGLES
+
+CACHE_DIR = "cache"
+TABLE_VERSION = 1
+
+
+def sensor_table_path(sensor, name, angles=SENSOR_ANGLES):
+    """Cache file for a sensor's lookup table, named after a hash of everything that affects its contents."""
+    digest = hashlib.sha1()
+    digest.update(f"{TABLE_VERSION}:{sensor.max_length}:{tuple(angles)}:{sensor.occupied.shape}".encode())
+    digest.update(np.packbits(sensor.occupied).tobytes())
+    return os.path.join(CACHE_DIR, f"sensor_table_{name}_{digest.hexdigest()[:12]}.npy")
+
+
+def build_sensor_table(sensor, path, angles=SENSOR_ANGLES, chunk_size=65536):
+    """
+    Cast every angle from every pixel of the track and store the lengths as a (width, height, rays) uint16 .npy file.
+    :param sensor: RaySensor for the mask the table is built for.
+    :param path: Destination file; written to a temporary name first so readers never see a partial table.
+    :param chunk_size: Number of origins cast per batch.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    table = np.lib.format.open_memmap(
+        temp_path, mode="w+", dtype=np.uint16, shape=(sensor.width, sensor.height, len(angles))
+    )
+    xs, ys = np.meshgrid(np.arange(sensor.width), np.arange(sensor.height), indexing="ij")
+    origins = np.stack([xs.ravel(), ys.ravel()], axis=1)
+    flat_table = table.reshape(-1, len(angles))
+    for start in range(0, len(origins), chunk_size):
+        flat_table[start:start + chunk_size] = sensor.cast(origins[start:start + chunk_size], angles)
+    table.flush()
+    del flat_table, table
+    os.replace(temp_path, path)
+
+
+def load_sensor_table(sensor, name, angles=SENSOR_ANGLES):
+    """Wrap a sensor in its memory-mapped lookup table if one has been built, otherwise return the sensor itself."""
+    path = sensor_table_path(sensor, name, angles)
+    if not os.path.exists(path):
+        return sensor
+    return SensorTable(sensor, np.load(path, mmap_mode="r"), angles)
+
+
+class SensorTable:
+    """
+    RaySensor results precomputed for every integer origin.
+
+    The table is memory-mapped read-only, so every process that loads it shares the same
+    pages. Reads for the table's fan of angles are a single array index; other angles and
+    origins off the image are delegated to the underlying sensor.
+    """
+
+    def __init__(self, sensor, table, angles=SENSOR_ANGLES):
+        self.sensor = sensor
+        self.table = table
+        self.angles = tuple(angles)
+        self.max_length = sensor.max_length
+
+    def cast(self, origins, angles=SENSOR_ANGLES):
+        """Same contract as RaySensor.cast."""
+        origins = np.asarray(origins).reshape(-1, 2)
+        if tuple(angles) != self.angles or not np.issubdtype(origins.dtype, np.integer):
+            return self.sensor.cast(origins, angles)
+        x, y = origins[:, 0], origins[:, 1]
+        inside = (x >= 0) & (x < self.sensor.width) & (y >= 0) & (y < self.sensor.height)
+        if inside.all():
+            return self.table[x, y].astype(np.int64)
+        lengths = np.empty((len(origins), len(self.angles)), dtype=np.int64)
+        lengths[inside] = self.table[x[inside], y[inside]]
+        lengths[~inside] = self.sensor.cast(origins[~inside], angles)
+        return lengths
+
+    def trace(self, x, y, cos, sin, length=1):
+        return self.sensor.trace(x, y, cos, sin, length)
+
+
+if __name__ == "__main__":
+    from ai_game import get_context
+
+    context = get_context()
+    sensor = getattr(context.border_sensor, "sensor", context.border_sensor)
+    path = sensor_table_path(sensor, context.name)
+    build_sensor_table(sensor, path)
+    print(f"Wrote {path}")
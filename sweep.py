@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+import config
+
+TRAINERS = ("train", "parallel_train")
+RESULT_FILE = "result.json"
+REWARDS_FILE = "rewards.jsonl"
+
+
+def load_spec(path):
+    """
+    Read a sweep spec, a JSON object such as
+
+        {"mode": "random", "samples": 20, "seeds": [0, 1], "trainer": "train",
+         "params": {"LEARNING_RATE": {"low": 0.01, "high": 0.5, "log": true},
+                    "DISCOUNT_FACTOR": [0.9, 0.95, 0.99]},
+         "fixed": {"NUM_EPISODES": 300, "Q_TABLE_BACKEND": "dense"},
+         "train_kwargs": {}}
+
+    "params" and "fixed" name config.py settings. Grid mode takes every combination of
+    the listed values; random mode draws `samples` configurations, picking from lists and
+    drawing uniformly (or log-uniformly, or as integers with "int") from ranges.
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    spec.setdefault("mode", "grid")
+    spec.setdefault("seeds", [0])
+    spec.setdefault("trainer", "train")
+    spec.setdefault("fixed", {})
+    spec.setdefault("train_kwargs", {})
+    if spec["mode"] not in ("grid", "random"):
+        raise ValueError(f"Unknown sweep mode {spec['mode']!r}")
+    if spec["trainer"] not in TRAINERS:
+        raise ValueError(f"Unknown trainer {spec['trainer']!r}, expected one of {TRAINERS}")
+    for name in list(spec["params"]) + list(spec["fixed"]):
+        if not name.isupper() or not hasattr(config, name):
+            raise ValueError(f"{name} is not a setting in config.py")
+    return spec
+
+
+def sample_value(rng, choices):
+    if isinstance(choices, list):
+        return choices[rng.integers(len(choices))]
+    low, high = choices["low"], choices["high"]
+    if choices.get("log"):
+        value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+    else:
+        value = float(rng.uniform(low, high))
+    return int(round(value)) if choices.get("int") else value
+
+
+def configurations(spec):
+    """Every configuration of the sweep as a dict of config overrides, fixed settings included."""
+    params = spec["params"]
+    if spec["mode"] == "grid":
+        for name, choices in params.items():
+            if not isinstance(choices, list):
+                raise ValueError(f"Grid sweeps need a list of values for {name}")
+        combinations = itertools.product(*params.values())
+        varied = [dict(zip(params, values)) for values in combinations]
+    else:
+        rng = np.random.default_rng(spec.get("sample_seed", 0))
+        varied = [{name: sample_value(rng, choices) for name, choices in params.items()}
+                  for _ in range(spec["samples"])]
+    return [dict(spec["fixed"], **overrides) for overrides in varied]
+
+
+def make_jobs(spec, output):
+    """One job per configuration and seed, each with its own directory under `output`."""
+    jobs = []
+    for config_id, overrides in enumerate(configurations(spec)):
+        for seed in spec["seeds"]:
+            job_id = len(jobs)
+            jobs.append({
+                "job": job_id,
+                "config_id": config_id,
+                "overrides": overrides,
+                "seed": seed,
+                "trainer": spec["trainer"],
+                "train_kwargs": spec["train_kwargs"],
+                "directory": os.path.join(output, f"job_{job_id:04d}"),
+            })
+    return jobs
+
+
+def score_rewards(rewards, window):
+    """Mean reward of the last `window` episodes, the number configurations are ranked by."""
+    if not rewards:
+        return float("-inf")
+    return float(np.mean(rewards[-window:]))
+
+
+def run_job(job, window):
+    """
+    Pool task: apply the job's config overrides, train headlessly and record the outcome.
+
+    Every episode's reward is appended to rewards.jsonl as it finishes and the trainer's
+    output goes to train.log, both in the job directory. Only the final checkpoint is
+    kept, and phase timings (PROFILE_PHASES) go to the job directory too. Each job gets a
+    fresh process (maxtasksperchild=1), so overrides never leak into the next job.
+    """
+    directory = job["directory"]
+    os.makedirs(directory, exist_ok=True)
+    for name, value in job["overrides"].items():
+        setattr(config, name, value)
+    config.PROFILE_PATH = os.path.join(directory, "phase_timings.jsonl")
+    with open(os.path.join(directory, "config.json"), "w") as f:
+        json.dump(job, f, indent=2)
+
+    start = time.perf_counter()
+    with open(os.path.join(directory, REWARDS_FILE), "w") as curve, \
+            open(os.path.join(directory, "train.log"), "w") as log, contextlib.redirect_stdout(log):
+        def on_episode(episode, reward):
+            curve.write(json.dumps({"episode": episode, "reward": float(reward), "time": time.perf_counter() - start}) + "\n")
+            curve.flush()
+
+        if job["trainer"] == "train":
+            import train
+            # The reward curve is what gets scored; periodic checkpoints would only fill the disk
+            train_kwargs = {"save_interval": None, **job["train_kwargs"]}
+            rewards = train.train(headless=True, seed=job["seed"], models_dir=os.path.join(directory, "models"),
+                                  on_episode=on_episode, **train_kwargs)
+        else:
+            import parallel_train
+            rewards = parallel_train.train(headless=True, seed=job["seed"], on_episode=on_episode, **job["train_kwargs"])
+
+    result = {
+        "job": job["job"],
+        "config_id": job["config_id"],
+        "overrides": job["overrides"],
+        "seed": job["seed"],
+        "episodes": len(rewards),
+        "score": score_rewards(rewards, window),
+        "best_reward": float(max(rewards)) if rewards else None,
+        "seconds": time.perf_counter() - start,
+    }
+    with open(os.path.join(directory, RESULT_FILE), "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+def finished_result(job, window):
+    """Result of a job finished by an earlier run, rescored from its reward curve in case `window` changed."""
+    path = os.path.join(job["directory"], RESULT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        result = json.load(f)
+    with open(os.path.join(job["directory"], REWARDS_FILE)) as f:
+        rewards = [json.loads(line)["reward"] for line in f]
+    result["score"] = score_rewards(rewards, window)
+    return result
+
+
+def rank_configurations(results):
+    """Average each configuration's score over its seeds; best first."""
+    by_config = {}
+    for result in results:
+        by_config.setdefault(result["config_id"], []).append(result)
+    ranking = []
+    for config_id, runs in by_config.items():
+        scores = [run["score"] for run in runs]
+        ranking.append({
+            "config_id": config_id,
+            "overrides": runs[0]["overrides"],
+            "mean_score": float(np.mean(scores)),
+            "std_score": float(np.std(scores)),
+            "seeds": sorted(run["seed"] for run in runs),
+            "jobs": sorted(run["job"] for run in runs),
+        })
+    ranking.sort(key=lambda row: -row["mean_score"])
+    return ranking
+
+
+def run_sweep(spec, output, workers=None, window=20):
+    """
+    Run every job of the sweep that has not finished yet in `output`, `workers` at a time.
+    :return: Configurations ranked by score, best first.
+    """
+    jobs = make_jobs(spec, output)
+    results = []
+    pending = []
+    for job in jobs:
+        result = finished_result(job, window)
+        if result is None:
+            pending.append(job)
+        else:
+            results.append(result)
+    if results:
+        print(f"{len(results)} of {len(jobs)} jobs already finished in {output}")
+
+    workers = min(workers or os.cpu_count() or 1, max(1, len(pending)))
+    if pending:
+        with mp.Pool(workers, maxtasksperchild=1) as pool:
+            for result in pool.imap_unordered(_run_job, [(job, window) for job in pending]):
+                results.append(result)
+                print(f"[{len(results)}/{len(jobs)}] job {result['job']} config {result['config_id']} "
+                      f"seed {result['seed']}: score {result['score']:.2f} in {result['seconds']:.0f}s")
+
+    ranking = rank_configurations(results)
+    with open(os.path.join(output, "summary.json"), "w") as f:
+        json.dump({"spec": spec, "window": window, "ranking": ranking, "jobs": sorted(results, key=lambda r: r["job"])},
+                  f, indent=2)
+    if ranking:
+        with open(os.path.join(output, "best.json"), "w") as f:
+            json.dump(ranking[0]["overrides"], f, indent=2)
+    return ranking
+
+
+def _run_job(args):
+    return run_job(*args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a grid or random hyperparameter sweep of headless training jobs.")
+    parser.add_argument("spec", help="JSON sweep spec (see load_spec)")
+    parser.add_argument("--output", help="sweep directory (default: sweeps/<spec name>); rerun to finish an interrupted sweep")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="training processes run at once")
+    parser.add_argument("--window", type=int, default=20, help="score jobs by the mean reward of their last N episodes")
+    parser.add_argument("--dry-run", action="store_true", help="list the jobs without running them")
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    output = args.output or os.path.join("sweeps", os.path.splitext(os.path.basename(args.spec))[0])
+    if args.dry_run:
+        for job in make_jobs(spec, output):
+            print(f"job {job['job']:4d}  config {job['config_id']:4d}  seed {job['seed']}  {job['overrides']}")
+        raise SystemExit
+    os.makedirs(output, exist_ok=True)
+    ranking = run_sweep(spec, output, args.workers, args.window)
+    for rank, row in enumerate(ranking[:10], 1):
+        print(f"{rank:3d}  score {row['mean_score']:10.2f} ± {row['std_score']:7.2f}  {row['overrides']}")
+    if ranking:
+        print(f"Best configuration written to {os.path.join(output, 'best.json')}")
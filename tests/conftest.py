@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules live at the top of the repository and pygame must not need a display
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
@@ -0,0 +1,62 @@
+import json
+import os
+import random
+import numpy as np
+import pytest
+from agent import QLearningAgent
+from checkpoint import (
+    LEGACY_VALUES_FILE, ROWS_FILE, STATE_FILE, VALUES_FILE, load_checkpoint, restore_agent, snapshot_agent,
+    write_checkpoint,
+)
+from q_table import STATE_BINS
+
+
+def trained_agent(backend, seed=0):
+    random.seed(seed)
+    agent = QLearningAgent([0, 1, 2, 3, 4], epsilon=0.3, backend=backend)
+    rng = np.random.default_rng(seed)
+    for _ in range(200):
+        state, next_state = (tuple(int(rng.integers(bins)) for bins in STATE_BINS) for _ in range(2))
+        agent.update_q_value(state, agent.choose_action(state), float(rng.normal()), next_state)
+    return agent
+
+
+@pytest.mark.parametrize("backend", ["dense", "dict"])
+def test_round_trip_stores_only_touched_rows(tmp_path, backend):
+    agent = trained_agent(backend)
+    path = write_checkpoint(snapshot_agent(agent, 3, [1.0, 2.0, 3.0]), str(tmp_path / "checkpoint"))
+    table, state = load_checkpoint(path)
+    assert state["episode"] == 3 and state["rewards"] == [1.0, 2.0, 3.0]
+    if backend == "dense":
+        np.testing.assert_array_equal(table.values, agent.q_table.values)
+        np.testing.assert_array_equal(table.touched_rows(), agent.q_table.touched_rows())
+    else:
+        assert table.to_dict() == agent.q_table
+    # Rows and values are plain .npy files that load memory-mapped
+    rows = np.load(os.path.join(path, ROWS_FILE), mmap_mode="r")
+    assert isinstance(rows, np.memmap)
+    assert len(rows) == len(table.touched_rows()) < table.num_states
+
+
+@pytest.mark.parametrize("backend", ["dense", "dict"])
+def test_resumed_agent_makes_the_same_choices(tmp_path, backend):
+    agent = trained_agent(backend)
+    path = write_checkpoint(snapshot_agent(agent, 1, [0.0]), str(tmp_path / "checkpoint"))
+    expected = [agent.choose_action((i % 8,) + (i % 5,) * 8) for i in range(100)]
+
+    resumed = QLearningAgent([0, 1, 2, 3, 4], epsilon=0.9, backend=backend)
+    random.seed(123)
+    restore_agent(resumed, path)
+    assert resumed.epsilon == agent.epsilon
+    assert [resumed.choose_action((i % 8,) + (i % 5,) * 8) for i in range(100)] == expected
+
+
+def test_loads_version_1_checkpoints(tmp_path):
+    values = np.random.default_rng(0).random((24, 2), dtype=np.float32)
+    np.save(tmp_path / LEGACY_VALUES_FILE, values)
+    state = {"version": 1, "num_actions": 2, "default_q_value": 4.0, "state_bins": [3, 4, 2]}
+    with open(tmp_path / STATE_FILE, "w") as f:
+        json.dump(state, f)
+    table, _ = load_checkpoint(str(tmp_path))
+    np.testing.assert_array_equal(table.values, values)
+    assert not os.path.exists(tmp_path / VALUES_FILE)
@@ -0,0 +1,87 @@
+import copy
+import numpy as np
+import pytest
+from agent import ParallelQLearningAgent
+
+ACTIONS = [0, 1, 2, 3, 4]
+STATES = [(angle, distance) for angle in range(4) for distance in range(3)]
+
+
+class ReferenceAgents:
+    """The population as plain per-agent tables: {state: (Q-values, visited)} each, deep-copied on clone."""
+
+    def __init__(self, num_agents):
+        self.tables = [{} for _ in range(num_agents)]
+
+    def row(self, agent_id, state):
+        return self.tables[agent_id].setdefault(state, [np.zeros(len(ACTIONS), dtype=np.float32), False])
+
+    def update(self, agent, states, actions, rewards, next_states, agent_ids):
+        for state, action, reward, next_state, agent_id in zip(states, actions, rewards, next_states, agent_ids):
+            row, next_row = self.row(agent_id, state), self.row(agent_id, next_state)
+            row[1] = next_row[1] = True
+            current = row[0][action]
+            target = np.float32(reward) + agent.discount_factor * next_row[0].max()
+            row[0][action] = current + agent.learning_rate * (target - current)
+
+    def clone(self, best_index):
+        self.tables = [copy.deepcopy(self.tables[best_index]) for _ in self.tables]
+
+
+def run_population(agent, reference, rng, episodes=4, steps=30):
+    for _ in range(episodes):
+        for _ in range(steps):
+            agent_ids = np.flatnonzero(rng.random(agent.num_agents) < 0.7)
+            states = [STATES[i] for i in rng.integers(len(STATES), size=len(agent_ids))]
+            next_states = [STATES[i] for i in rng.integers(len(STATES), size=len(agent_ids))]
+            actions = rng.integers(len(ACTIONS), size=len(agent_ids)).tolist()
+            rewards = rng.normal(size=len(agent_ids)).tolist()
+            agent.update_q_values(states, actions, rewards, next_states, agent_ids)
+            reference.update(agent, states, actions, rewards, next_states, agent_ids)
+        best = int(rng.integers(agent.num_agents))
+        agent.clone_best_q_table(best)
+        reference.clone(best)
+
+
+def assert_same_tables(agent, reference):
+    for agent_id, table in enumerate(reference.tables):
+        values, visited = agent.agent_table(agent_id)
+        for state, row in agent.state_ids.items():
+            expected_values, expected_visited = table.get(state, (np.zeros(len(ACTIONS)), False))
+            np.testing.assert_allclose(values[row], expected_values, rtol=1e-6)
+            assert visited[row] == expected_visited
+
+
+@pytest.mark.parametrize("episodes", [1, 4])
+def test_copy_on_write_matches_per_agent_tables(episodes):
+    rng = np.random.default_rng(0)
+    # A tiny initial capacity makes the base and delta buffers grow along the way
+    agent = ParallelQLearningAgent(ACTIONS, num_agents=6, epsilon=0.0, initial_capacity=2, seed=0)
+    reference = ReferenceAgents(6)
+    run_population(agent, reference, rng, episodes)
+    assert_same_tables(agent, reference)
+
+
+def test_overlays_stay_private_until_cloned():
+    rng = np.random.default_rng(1)
+    agent = ParallelQLearningAgent(ACTIONS, num_agents=5, epsilon=0.0, seed=0)
+    reference = ReferenceAgents(5)
+    run_population(agent, reference, rng, episodes=2)
+    # Half an episode without cloning: every agent still has its own overlay
+    for _ in range(10):
+        agent_ids = np.arange(5)
+        states = [STATES[i] for i in rng.integers(len(STATES), size=5)]
+        actions = rng.integers(len(ACTIONS), size=5).tolist()
+        rewards = rng.normal(size=5).tolist()
+        agent.update_q_values(states, actions, rewards, states[::-1], agent_ids)
+        reference.update(agent, states, actions, rewards, states[::-1], agent_ids)
+    assert_same_tables(agent, reference)
+
+    # Greedy choices read each agent's own overlay
+    for state in STATES:
+        states = [state] * 5
+        choices = agent.choose_actions(states, np.arange(5))
+        for agent_id, choice in enumerate(choices):
+            values, visited = reference.tables[agent_id].get(state, (None, False))
+            if visited:
+                assert choice == int(values.argmax())
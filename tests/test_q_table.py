@@ -0,0 +1,38 @@
+import itertools
+import numpy as np
+from q_table import DenseQTable, STATE_BINS
+
+
+def test_state_index_is_mixed_radix():
+    table = DenseQTable(2, state_bins=(3, 4, 2))
+    expected = 0
+    for state in itertools.product(range(3), range(4), range(2)):
+        assert table.state_index(state) == expected
+        expected += 1
+    assert expected == table.num_states
+
+
+def test_state_indices_match_state_index():
+    table = DenseQTable(5)
+    rng = np.random.default_rng(0)
+    states = np.stack([rng.integers(bins, size=200) for bins in STATE_BINS], axis=1)
+    rows = table.state_indices(states)
+    assert rows.tolist() == [table.state_index(tuple(state)) for state in states.tolist()]
+    assert rows.tolist() == np.ravel_multi_index(states.T, STATE_BINS).tolist()
+    assert table.state_index((7,) + (4,) * 8) == table.num_states - 1
+
+
+def test_dict_round_trip_and_touched_rows():
+    q_table = {((1, 2, 0), 1): 0.5, ((2, 3, 1), 0): -1.25, ((1, 2, 0), 0): 3.0}
+    table = DenseQTable.from_dict(q_table, 2, default_value=4.0, state_bins=(3, 4, 2))
+    assert table.to_dict() == q_table
+    assert table.touched_rows().tolist() == sorted({table.state_index((1, 2, 0)), table.state_index((2, 3, 1))})
+    assert table.get(((0, 0, 0), 1)) == 4.0
+
+
+def test_update_writes_and_marks_rows():
+    table = DenseQTable(2, default_value=0.0, state_bins=(3, 4, 2))
+    td_errors = table.update(np.array([5]), np.array([1]), np.array([2.0]), np.array([6]), 0.5, 0.9)
+    assert td_errors.tolist() == [2.0]
+    assert table.values[5].tolist() == [0.0, 1.0]
+    assert table.touched_rows().tolist() == [5]
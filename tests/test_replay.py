@@ -0,0 +1,50 @@
+import numpy as np
+from replay import PrioritizedReplayBuffer, ReplayBuffer
+
+
+def filled(buffer, count):
+    rng = np.random.default_rng(1)
+    buffer.add_batch(np.arange(count), rng.integers(5, size=count), rng.normal(size=count),
+                     np.arange(count) + 1, np.zeros(count, dtype=bool))
+    return buffer
+
+
+def test_sum_tree_sampling_follows_priorities():
+    buffer = filled(PrioritizedReplayBuffer(6, alpha=1.0, epsilon=0.0, seed=0), 6)
+    td_errors = np.array([1.0, 2.0, 3.0, 4.0, 0.0, 10.0])
+    buffer.update_priorities(np.arange(6), td_errors)
+    assert buffer.tree[1] == td_errors.sum()
+
+    counts = np.zeros(6)
+    for _ in range(2000):
+        slots = buffer.sample(64)[0]
+        counts += np.bincount(slots, minlength=6)
+    frequencies = counts / counts.sum()
+    np.testing.assert_allclose(frequencies, td_errors / td_errors.sum(), atol=0.01)
+    assert counts[4] == 0
+
+
+def test_importance_weights():
+    buffer = filled(PrioritizedReplayBuffer(4, alpha=1.0, beta=1.0, epsilon=0.0, seed=0), 4)
+    buffer.update_priorities(np.arange(4), np.array([1.0, 1.0, 1.0, 5.0]))
+    slots, *_, weights = buffer.sample(256)
+    # (N * P(i)) ** -1 normalised by the largest, which belongs to the rarest transitions
+    np.testing.assert_allclose(weights, np.where(slots == 3, 0.2, 1.0), rtol=1e-6)
+
+
+def test_ring_buffer_overwrites_oldest():
+    buffer = filled(ReplayBuffer(4, seed=0), 6)
+    assert len(buffer) == 4 and buffer.position == 2
+    assert sorted(buffer.states.tolist()) == [2, 3, 4, 5]
+
+
+def test_snapshot_restores_contents_and_sampling():
+    for make in (lambda seed: ReplayBuffer(8, seed=seed), lambda seed: PrioritizedReplayBuffer(8, seed=seed)):
+        buffer = filled(make(0), 5)
+        buffer.update_priorities(np.arange(5), np.arange(5.0))
+        buffer.sample(3)
+        arrays, state = buffer.snapshot()
+        restored = make(1)
+        restored.restore(arrays, state)
+        for expected, actual in zip(buffer.sample(16), restored.sample(16)):
+            np.testing.assert_array_equal(expected, actual)
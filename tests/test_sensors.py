@@ -0,0 +1,78 @@
+import math
+import numpy as np
+import pygame
+import pytest
+from sensor_table import SensorTable, build_sensor_table
+from sensors import SENSOR_ANGLES, RaySensor, mask_to_array
+
+
+def random_mask(width, height, density, framed, seed=0):
+    rng = np.random.default_rng(seed)
+    occupied = rng.random((width, height)) < density
+    if framed:
+        occupied[[0, -1], :] = True
+        occupied[:, [0, -1]] = True
+    mask = pygame.mask.Mask((width, height))
+    for x, y in zip(*np.nonzero(occupied)):
+        mask.set_at((int(x), int(y)), 1)
+    return mask
+
+
+def pixel_march(mask, x, y, angle, max_length):
+    """Car.ray_cast's unit-step march, stopping at the image edge like RaySensor."""
+    length = 0
+    while length < max_length:
+        length += 1
+        target_x = int(x + length * math.cos(math.radians(angle)))
+        target_y = int(y + length * math.sin(math.radians(angle)))
+        if not (0 <= target_x < mask.get_size()[0] and 0 <= target_y < mask.get_size()[1]):
+            return length
+        if mask.get_at((target_x, target_y)):
+            return length
+    return max_length
+
+
+def marched(mask, origins, max_length):
+    return np.array([[pixel_march(mask, x, y, angle, max_length) for angle in SENSOR_ANGLES] for x, y in origins])
+
+
+@pytest.mark.parametrize("framed", [True, False])
+@pytest.mark.parametrize("use_distance_field", [True, False])
+def test_cast_matches_pixel_march(framed, use_distance_field):
+    mask = random_mask(90, 60, 0.01, framed)
+    sensor = RaySensor(mask, 90, use_distance_field)
+    rng = np.random.default_rng(1)
+    # Enough rays for the vectorised loop as well as the scalar tail, from fractional origins too
+    origins = np.column_stack([rng.uniform(0, 90, 150), rng.uniform(0, 60, 150)])
+    expected = marched(mask, origins.tolist(), 90)
+    np.testing.assert_array_equal(sensor.cast(origins), expected)
+    for (x, y), row in zip(origins.tolist()[:20], expected):
+        cos, sin = sensor.directions(SENSOR_ANGLES)
+        assert [sensor.trace(x, y, c, s) for c, s in zip(cos.tolist(), sin.tolist())] == row.tolist()
+
+
+def test_sensor_table_matches_sensor(tmp_path):
+    mask = random_mask(40, 30, 0.03, framed=False)
+    sensor = RaySensor(mask, 40)
+    path = str(tmp_path / "sensor_table.npy")
+    build_sensor_table(sensor, path, chunk_size=500)
+    table = SensorTable(RaySensor(mask, 40), np.load(path, mmap_mode="r"))
+
+    xs, ys = np.meshgrid(np.arange(40), np.arange(30), indexing="ij")
+    origins = np.stack([xs.ravel(), ys.ravel()], axis=1)
+    expected = marched(mask, origins.tolist(), 40)
+    np.testing.assert_array_equal(table.cast(origins), expected)
+    # The table answers every integer origin on the image without building a distance field
+    assert "field" not in vars(table.sensor)
+    # Origins off the image and fractional ones go to the sensor
+    outside = np.array([[-3, 5], [45, 10], [12, 31]])
+    np.testing.assert_array_equal(table.cast(outside), marched(mask, outside.tolist(), 40))
+    fractional = np.array([[3.5, 7.25], [20.9, 1.1]])
+    np.testing.assert_array_equal(table.cast(fractional), marched(mask, fractional.tolist(), 40))
+
+
+def test_mask_to_array():
+    mask = random_mask(12, 7, 0.3, framed=False)
+    occupied = mask_to_array(mask)
+    assert occupied.shape == (12, 7)
+    assert occupied.tolist() == [[bool(mask.get_at((x, y))) for y in range(7)] for x in range(12)]
@@ -0,0 +1,122 @@
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+import pygame
+from game_utils import resize_images_to_largest
+from sensors import mask_to_array
+
+CACHE_DIR = "cache"
+BUNDLE_VERSION = 1
+MASK_NAMES = ("border", "grass", "track", "finish")
+
+
+def array_to_mask(array):
+    """Build a pygame mask from a (width, height) boolean array."""
+    surface = pygame.Surface(array.shape, pygame.SRCALPHA)
+    alpha = pygame.surfarray.pixels_alpha(surface)
+    alpha[...] = np.where(array, 255, 0)
+    del alpha  # Unlock the surface
+    return pygame.mask.from_surface(surface)
+
+
+def bundle_hash(sources, metadata):
+    """Hash of the bundle format, every source image's bytes and the track metadata."""
+    digest = hashlib.sha1(f"{BUNDLE_VERSION}".encode())
+    for path in sources:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    digest.update(json.dumps(metadata, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def bundle_path(name, digest):
+    return os.path.join(CACHE_DIR, f"track_{name}_{digest[:12]}.npz")
+
+
+class TrackBundle:
+    """Collision masks and metadata of one track, either compiled from its images or loaded from the cache."""
+
+    def __init__(self, masks, metadata):
+        self.border_mask = masks["border"]
+        self.grass_mask = masks["grass"]
+        self.track_mask = masks["track"]
+        self.finish_mask = masks["finish"]
+        self.width, self.height = metadata["size"]
+        self.finish_position = tuple(metadata["finish_position"])
+        self.start_position = tuple(metadata["start_position"])
+        self.start_angle = metadata["start_angle"]
+
+
+def compile_track(name, grass_path, track_path, border_path, finish_path, metadata):
+    """
+    Build the track masks from the source images and write them to a bit-packed .npz bundle.
+    :param metadata: JSON-serialisable dict with finish_position, start_position and start_angle.
+    :return: The compiled TrackBundle.
+    """
+    sources = (grass_path, track_path, border_path, finish_path)
+    metadata = dict(metadata, name=name, version=BUNDLE_VERSION)
+    path = bundle_path(name, bundle_hash(sources, metadata))
+
+    grass, track, border = resize_images_to_largest([grass_path, track_path, border_path])
+    track_mask = pygame.mask.from_surface(track)
+    grass_mask = pygame.mask.from_surface(grass)
+    grass_mask.erase(track_mask, (0, 0))
+    masks = {
+        "border": pygame.mask.from_surface(border),
+        "grass": grass_mask,
+        "track": track_mask,
+        "finish": pygame.mask.from_surface(pygame.image.load(finish_path)),
+    }
+    metadata["size"] = track.get_size()
+
+    arrays = {}
+    for mask_name, mask in masks.items():
+        array = mask_to_array(mask)
+        arrays[mask_name] = np.packbits(array)
+        arrays[f"{mask_name}_shape"] = np.array(array.shape)
+    arrays["metadata"] = np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Bundles compiled from older sources are never read again. Other processes may be
+    # compiling this same bundle right now, so only other hashes go, and one already
+    # removed by someone else is fine.
+    for stale_path in glob.glob(os.path.join(CACHE_DIR, f"track_{name}_*.npz")):
+        if stale_path != path:
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                pass
+    # Written through a file object so np.savez adds no ".npz" and the glob above never matches it
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temp_path, path)
+    return TrackBundle(masks, metadata)
+
+
+def load_track(name, grass_path, track_path, border_path, finish_path, metadata):
+    """Load a compiled track bundle, recompiling it when any source image or the metadata has changed."""
+    sources = (grass_path, track_path, border_path, finish_path)
+    path = bundle_path(name, bundle_hash(sources, dict(metadata, name=name, version=BUNDLE_VERSION)))
+    try:
+        bundle = np.load(path)
+    except FileNotFoundError:
+        return compile_track(name, *sources, metadata)
+
+    with bundle:
+        metadata = json.loads(bundle["metadata"].tobytes())
+        masks = {}
+        for mask_name in MASK_NAMES:
+            shape = tuple(bundle[f"{mask_name}_shape"])
+            array = np.unpackbits(bundle[mask_name], count=shape[0] * shape[1]).reshape(shape)
+            masks[mask_name] = array_to_mask(array.astype(bool))
+    return TrackBundle(masks, metadata)
+
+
+if __name__ == "__main__":
+    from ai_game import TRACK_NAME, TRACK_SOURCES, TRACK_METADATA
+
+    bundle = compile_track(TRACK_NAME, *TRACK_SOURCES, TRACK_METADATA)
+    print(f"Compiled {TRACK_NAME}: {bundle.width}x{bundle.height}")
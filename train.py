@@ -1,135 +1,256 @@
+import argparse
 import pygame
 import math
 import os
+import random
 import matplotlib.pyplot as plt
 from datetime import datetime
 from environment import CarEnvironment
 from agent import QLearningAgent
+from checkpoint import CheckpointWriter, latest_checkpoint, restore_agent
+from replay import make_replay_buffer
 import config
-import pickle
-from utils import draw_actions
-from ai_game import (
-    GRASS,
-    TRACK,
-    TRACK_BORDER,
-    TRACK_BORDER_MASK,
-    FINISH,
-    FINISH_POSITION,
-    WIDTH,
-    HEIGHT,
-)
-
-
-def train():
-    pygame.init()
+from utils import should_render
+from render import HudPanel, SceneRenderer, action_keys, compose_background, track_layers
+from game_utils import init_pygame
+from profiling import make_phase_timer
+from viewer import RemoteViewer, car_snapshots
+from trajectory import TrajectoryRecorder
+
+
+def train(
+    headless=config.HEADLESS,
+    render_every_episodes=config.RENDER_EVERY_EPISODES,
+    render_every_steps=config.RENDER_EVERY_STEPS,
+    resume=None,
+    profile_phases=config.PROFILE_PHASES,
+    viewer=False,
+    record=None,
+    record_poses=False,
+    seed=None,
+    models_dir="models",
+    on_episode=None,
+    save_interval=config.SAVE_INTERVAL,
+):
+    """
+    :param resume: Checkpoint directory to continue from, or "latest" for the newest one in models_dir.
+    :param profile_phases: Log how long each phase of a step takes to config.PROFILE_PATH.
+    :param viewer: Draw in a separate viewer process fed with snapshots instead of on this thread.
+    :param record: Path of a trajectory log to append every episode's actions to (see trajectory.py).
+    :param record_poses: Also log the car pose after every step, so replays can verify them.
+    :param seed: Seed for exploration; recorded runs pick and log one when none is given.
+    :param models_dir: Where checkpoints are written.
+    :param on_episode: Called as on_episode(episode, total_reward) after every episode.
+    :param save_interval: Write a checkpoint every this many episodes; None or 0 only writes the final one.
+    :return: Total reward of every episode.
+    """
+    if record and seed is None:
+        seed = int.from_bytes(os.urandom(4), "little")
+    if seed is not None:
+        random.seed(seed)
+    remote = None
+    if viewer:
+        remote = RemoteViewer("RL Car Racing Game")
+        remote.attach()
+        headless = True
+    # Headless runs only need a real window if some episodes are still drawn
+    show_window = not headless or render_every_episodes > 0
+    init_pygame(headless=not show_window)
     env = CarEnvironment()
+    context = env.context
     agent = QLearningAgent(
         action_space=[0, 1, 2, 3, 4],
         learning_rate=config.LEARNING_RATE,
         discount_factor=config.DISCOUNT_FACTOR,
         epsilon=config.EPSILON,
+        backend=config.Q_TABLE_BACKEND,
+        default_q_value=config.DEFAULT_Q_VALUE,
+        replay=make_replay_buffer(
+            config.REPLAY_CAPACITY, config.REPLAY_PRIORITIZED, config.REPLAY_ALPHA, config.REPLAY_BETA, seed
+        ),
+        replay_ratio=config.REPLAY_RATIO,
+        replay_batch_size=config.REPLAY_BATCH_SIZE,
     )
 
     clock = pygame.time.Clock()
     font = pygame.font.Font(None, 24)
-    main_surface = pygame.display.set_mode((WIDTH + 200, HEIGHT))
-    pygame.display.set_caption("RL Car Racing Game")
-    if not os.path.exists("models"):
-        os.makedirs("models")
+    if show_window:
+        main_surface = pygame.display.set_mode((context.width + 200, context.height))
+        pygame.display.set_caption("RL Car Racing Game")
+        renderer = SceneRenderer(main_surface, compose_background((context.width, context.height), track_layers(context)))
+        hud = HudPanel(main_surface, (context.width, 0, 200, context.height), font, 30)
+    if not os.path.exists(models_dir):
+        os.makedirs(models_dir)
     if not os.path.exists("training_runs"):
         os.makedirs("training_runs")
 
     rewards = []
+    start_episode = 0
+    if resume == "latest":
+        resume = latest_checkpoint(models_dir)
+    if resume:
+        training_state = restore_agent(agent, resume)
+        start_episode = training_state["episode"]
+        rewards = training_state["rewards"]
+        print(f"Resuming from {resume} after episode {start_episode}")
+    checkpoints = CheckpointWriter(models_dir, keep=config.KEEP_CHECKPOINTS)
+    timer = make_phase_timer(profile_phases, config.PROFILE_PATH)
+    recorder = TrajectoryRecorder(record, env, seed, record_poses) if record else None
 
-    for episode in range(config.NUM_EPISODES):
+    for episode in range(start_episode, config.NUM_EPISODES):
         state = env.reset()
         total_reward = 0
         done = False
         step = 0
+        if recorder is not None:
+            recorder.begin_episode(episode + 1, env)
 
         while not done:
+            timer.begin()
             action = agent.choose_action(state)
+            timer.mark("choose_action")
             next_state, reward, done = env.step(action)
+            if recorder is not None:
+                recorder.step(env, action)
+            timer.mark("env_step")
             agent.update_q_value(state, action, reward, next_state)
+            agent.remember(state, action, reward, next_state, done)
+            timer.mark("q_update")
             state = next_state
             total_reward += reward
 
+            if remote is not None and step % max(1, render_every_steps) == 0 and remote.wants_frame():
+                remote.publish({
+                    "cars": car_snapshots([env.player_car], context),
+                    "hud": [
+                        f"Episode: {episode + 1}",
+                        f"Step: {step}",
+                        f"Total Reward: {total_reward:.2f}",
+                        f"Epsilon: {agent.epsilon:.2f}",
+                        f"Distance Traveled: {env.player_car.distance_traveled:.2f}",
+                        f"Velocity: {env.player_car.velocity:.2f}",
+                        f"Angle: {(env.player_car.angle%360):.2f}",
+                    ],
+                    "action": action,
+                })
+                timer.mark("publish")
 
-            main_surface.fill((50, 50, 50))
-            game_surface = pygame.Surface((WIDTH, HEIGHT))
-            game_surface.blit(GRASS, (0, 0))
-            game_surface.blit(TRACK, (0, 0))
-            game_surface.blit(FINISH, FINISH_POSITION)
-            game_surface.blit(TRACK_BORDER, (0, 0))
-            env.player_car.draw(game_surface)
-
-            for angle in range(0, 360, 45):
-                distance = env.player_car.ray_cast(TRACK_BORDER_MASK, angle)
-                end_x = env.player_car.x + distance * math.cos(math.radians(angle))
-                end_y = env.player_car.y + distance * math.sin(math.radians(angle))
-                pygame.draw.line(
-                    game_surface,
-                    (192, 235, 166),
-                    (int(env.player_car.x), int(env.player_car.y)),
-                    (int(end_x), int(end_y)),
-                    1,
+            rendered = should_render(episode, step, headless, render_every_episodes, render_every_steps)
+            if rendered:
+                renderer.begin()
+                renderer.blit(env.player_car.rotated_image, env.player_car.rect.topleft)
+                for angle in range(0, 360, 45):
+                    distance = env.player_car.ray_cast(context.track_border_mask, angle)
+                    end_x = env.player_car.x + distance * math.cos(math.radians(angle))
+                    end_y = env.player_car.y + distance * math.sin(math.radians(angle))
+                    renderer.line(
+                        (192, 235, 166),
+                        (int(env.player_car.x), int(env.player_car.y)),
+                        (int(end_x), int(end_y)),
+                        1,
+                    )
+
+                texts = [
+                    f"Episode: {episode + 1}",
+                    f"Step: {step}",
+                    f"Total Reward: {total_reward:.2f}",
+                    f"Epsilon: {agent.epsilon:.2f}",
+                    f"Distance Traveled: {env.player_car.distance_traveled:.2f}",
+                    f"Velocity: {env.player_car.velocity:.2f}",
+                    f"Angle: {(env.player_car.angle%360):.2f}",
+                ]
+                hud_rects = hud.update(
+                    [(text, (255, 255, 255)) for text in texts],
+                    [(action_keys(action), (20, context.height - 180))],
                 )
+                renderer.finish(hud_rects)
+                timer.mark("render")
+                clock.tick(config.FPS)
+                timer.mark("clock_tick")
 
-            main_surface.blit(game_surface, (0, 0))
-
-            info_surface = pygame.Surface((200, HEIGHT))
-            info_surface.fill((30, 30, 30))
-
-            texts = [
-                f"Episode: {episode + 1}",
-                f"Step: {step}",
-                f"Total Reward: {total_reward:.2f}",
-                f"Epsilon: {agent.epsilon:.2f}",
-                f"Distance Traveled: {env.player_car.distance_traveled:.2f}",
-                f"Velocity: {env.player_car.velocity:.2f}",
-                f"Angle: {(env.player_car.angle%360):.2f}",
-            ]
-
-            for i, text in enumerate(texts):
-                text_surface = font.render(text, True, (255, 255, 255))
-                info_surface.blit(text_surface, (10, 10 + i * 30))
-
-            action_surface = draw_actions(info_surface, action)
-            info_surface.blit(action_surface, (20, HEIGHT - 180))
-            main_surface.blit(info_surface, (WIDTH, 0))
-
-            pygame.display.update()
-            clock.tick(config.FPS)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    plt.figure(figsize=(12, 6))
-                    plt.figure()
-                    plt.plot(range(len(rewards)), rewards, linestyle="--", marker="o")
-                    plt.xlabel("Episode")
-                    plt.ylabel("Total Reward")
-                    plt.title("Episode vs Reward")
-                    plt.grid(True)
-                    plt.savefig(f"training_runs/training_run_{timestamp}.png")
-                    pygame.quit()
-                    return
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    with open(f"models/q_table_intermediate_{timestamp}.pkl", "wb") as f:
-                        pickle.dump(agent.q_table, f)
+            # A window stays responsive between drawn steps and episodes, and ESC and "s" always work
+            if show_window and (rendered or step % config.EVENT_POLL_STEPS == 0):
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                        plt.figure(figsize=(12, 6))
+                        plt.figure()
+                        plt.plot(range(len(rewards)), rewards, linestyle="--", marker="o")
+                        plt.xlabel("Episode")
+                        plt.ylabel("Total Reward")
+                        plt.title("Episode vs Reward")
+                        plt.grid(True)
+                        plt.savefig(f"training_runs/training_run_{timestamp}.png")
+                        checkpoints.close()
+                        if recorder is not None:
+                            recorder.close()
+                        if remote is not None:
+                            remote.close()
+                        pygame.quit()
+                        return rewards
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
+                        # Resuming from a mid-episode save restarts the current episode
+                        path = checkpoints.save(agent, episode, rewards, prefix="checkpoint_intermediate")
+                        print(f"Saving checkpoint to {path}")
+                timer.mark("events")
 
             step += 1
 
         rewards.append(total_reward)
-        print(f"Episode {episode + 1}, Total Reward: {total_reward}")
+        if on_episode is not None:
+            on_episode(episode + 1, total_reward)
+        if recorder is not None:
+            recorder.end_episode(total_reward)
+        timer.end_episode(episode + 1, steps=step, total_reward=total_reward)
+        print(
+            f"Episode {episode + 1}, Total Reward: {total_reward}, "
+            f"Mask Overlaps Saved: {context.collision_checker.mask_overlaps_saved}"
+        )
         agent.epsilon = max(0.01, agent.epsilon * 0.995)
+        if save_interval and (episode + 1) % save_interval == 0:
+            checkpoints.save(agent, episode + 1, rewards)
+        if remote is not None:
+            remote.poll()
 
-    with open(f"models/q_table_final_{timestamp}.pkl", "wb") as f:
-        pickle.dump(agent.q_table, f)
+    checkpoints.save(agent, config.NUM_EPISODES, rewards, prefix="checkpoint_final")
+    checkpoints.close()
+    if recorder is not None:
+        recorder.close()
+    if remote is not None:
+        print(f"Viewer frames sent: {remote.sent}, dropped: {remote.dropped}")
+        remote.close()
 
     pygame.quit()
+    return rewards
 
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description="Train a single Q-learning car.")
+    parser.add_argument("--headless", action="store_true", default=config.HEADLESS,
+                        help="run without a window, per-step drawing or FPS cap")
+    parser.add_argument("--render-every-episodes", type=int, default=config.RENDER_EVERY_EPISODES,
+                        help="when headless, still draw every N-th episode (0 = never)")
+    parser.add_argument("--render-every-steps", type=int, default=config.RENDER_EVERY_STEPS,
+                        help="only draw every K-th step of a rendered episode")
+    parser.add_argument("--resume", metavar="CHECKPOINT",
+                        help="continue training from a checkpoint directory, or 'latest'")
+    parser.add_argument("--profile-phases", action="store_true", default=config.PROFILE_PHASES,
+                        help=f"log per-phase step timings to {config.PROFILE_PATH}")
+    parser.add_argument("--viewer", action="store_true",
+                        help="draw in a separate process that drops frames instead of slowing training; "
+                             "send SIGUSR1 to reopen it after closing")
+    parser.add_argument("--record", metavar="LOG", help="append every episode's actions to a trajectory log")
+    parser.add_argument("--record-poses", action="store_true", help="also log car poses, so replays can check them")
+    parser.add_argument("--seed", type=int, help="seed for exploration (recorded runs pick one if not given)")
+    args = parser.parse_args()
+    train(
+        headless=args.headless,
+        render_every_episodes=args.render_every_episodes,
+        render_every_steps=args.render_every_steps,
+        resume=args.resume,
+        profile_phases=args.profile_phases,
+        viewer=args.viewer,
+        record=args.record,
+        record_poses=args.record_poses,
+        seed=args.seed,
+    )
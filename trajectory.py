@@ -0,0 +1,357 @@
+import argparse
+import json
+import os
+import struct
+import time
+from array import array
+import numpy as np
+import config
+
+MAGIC = b"CARTRAJ1"
+# episode, steps, num_cars, flags, episode reward
+EPISODE_HEADER = struct.Struct("<IIIBd")
+HAS_POSES = 1
+INCOMPLETE = 2
+HAS_STARTS = 4
+# Action of a car that was no longer driving at that step
+NO_ACTION = 255
+ENVIRONMENTS = ("single", "parallel", "population")
+# Config settings that change how an episode plays out, recorded in the header (in lower
+# case) so replays can restore them, with the values logs that predate them were run with
+RECORDED_SETTINGS = {
+    "COLLISION_MODE": "mask",
+    "PROGRESS_REWARD": False,
+    "PROGRESS_BACKWARD_PENALTY": 10,
+    "STUCK_TIMEOUT_STEPS": 50,
+    "MAX_NEGATIVE_REWARD": 1000,
+}
+
+
+def environment_kind(env):
+    """How a replay has to rebuild `env`: "single", "parallel" or "population"."""
+    if hasattr(env, "population"):
+        return "population"
+    if hasattr(env, "player_car"):
+        return "single"
+    return "parallel"
+
+
+def car_poses(env):
+    """(num_cars, 3) float64 array of every car's x, y and angle."""
+    if hasattr(env, "population"):
+        population = env.population
+        return np.stack([population.x, population.y, population.angle], axis=1)
+    cars = [env.player_car] if hasattr(env, "player_car") else env.cars
+    return np.array([(car.x, car.y, car.angle) for car in cars], dtype=np.float64)
+
+
+def previous_positions(env):
+    """
+    (num_cars, 2) float64 array of the position every car's next stuck check compares against.
+
+    Resets keep it from the previous episode, so a replay of a single episode has to
+    restore it to count stuck steps the way the recorded run did.
+    """
+    if hasattr(env, "population"):
+        population = env.population
+        return np.stack([population.previous_x, population.previous_y], axis=1)
+    cars = [env.player_car] if hasattr(env, "player_car") else env.cars
+    return np.array([car.previous_position for car in cars], dtype=np.float64)
+
+
+def restore_previous_positions(env, positions):
+    if hasattr(env, "population"):
+        env.population.previous_x[:], env.population.previous_y[:] = positions[:, 0], positions[:, 1]
+        return
+    cars = [env.player_car] if hasattr(env, "player_car") else env.cars
+    for car, (x, y) in zip(cars, positions.tolist()):
+        car.previous_position = (x, y)
+
+
+def read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{f.name} is not a trajectory log")
+    (length,) = struct.unpack("<I", f.read(4))
+    return json.loads(f.read(length).decode("utf-8"))
+
+
+def recorded_settings(header):
+    """The RECORDED_SETTINGS a log was written with, as {config name: value}."""
+    return {name: header.get(name.lower(), default) for name, default in RECORDED_SETTINGS.items()}
+
+
+def apply_settings(header):
+    """Set the config values a log was recorded with, so its episodes replay the same way."""
+    for name, value in recorded_settings(header).items():
+        setattr(config, name, value)
+
+
+class TrajectoryRecorder:
+    """
+    Streams every episode's actions, and optionally car poses, into an append-only binary log.
+
+    The log starts with a JSON header describing the run (environment, car count,
+    RECORDED_SETTINGS, seed); each finished episode is then appended as one chunk: a
+    fixed-size header followed by a (steps, num_cars) uint8 action array and, with
+    `poses`, a (steps, num_cars, 3) float64 array of x, y and angle after each step.
+    Steps only append to in-memory arrays; the file is written once per episode, so
+    recording costs next to nothing on the training hot path. An existing log of the
+    same kind of run is appended to, e.g. after resuming from a checkpoint.
+    Every chunk also stores each car's previous position at the start of the episode
+    (see previous_positions), so any episode can be replayed on its own.
+    """
+
+    def __init__(self, path, env, seed=None, poses=False):
+        self.path = path
+        self.poses = poses
+        self.num_cars = 1 if hasattr(env, "player_car") else env.num_cars
+        header = {
+            "environment": environment_kind(env),
+            "num_cars": self.num_cars,
+            **{name.lower(): getattr(config, name) for name in RECORDED_SETTINGS},
+            "track": env.context.name,
+            "seed": seed,
+            "created": time.time(),
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                existing = read_header(f)
+            if (existing["environment"], existing["num_cars"]) != (header["environment"], header["num_cars"]):
+                raise ValueError(f"{path} records a different kind of run; pick another path")
+            if recorded_settings(existing) != recorded_settings(header):
+                raise ValueError(f"{path} was recorded with different settings; pick another path")
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+            encoded = json.dumps(header).encode("utf-8")
+            self.file.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+            self.file.flush()
+        self.episode = None
+        self.starts = None
+        self.actions = bytearray()
+        self.pose_values = array("d")
+
+    def begin_episode(self, episode, env):
+        """Start recording an episode, after env.reset()."""
+        self.episode = episode
+        self.starts = previous_positions(env)
+        self.actions = bytearray()
+        self.pose_values = array("d")
+
+    def step(self, env, action):
+        """Record the single car's action, after env.step(action)."""
+        self.actions.append(action)
+        if self.poses:
+            car = env.player_car
+            self.pose_values.extend((car.x, car.y, car.angle))
+
+    def step_population(self, env, active_cars, actions):
+        """Record one step of a parallel environment; `active_cars` are the cars `actions` were chosen for."""
+        row = bytearray([NO_ACTION]) * self.num_cars
+        for idx, action in zip(active_cars, actions):
+            row[idx] = action
+        self.actions += row
+        if self.poses:
+            self.pose_values.extend(car_poses(env).ravel())
+
+    def end_episode(self, reward=0.0, complete=True):
+        """Append the episode's chunk and flush it, so a crash loses at most the episode in progress."""
+        if self.episode is None:
+            return
+        steps = len(self.actions) // self.num_cars
+        flags = HAS_STARTS | (HAS_POSES if self.poses else 0) | (0 if complete else INCOMPLETE)
+        self.file.write(EPISODE_HEADER.pack(self.episode, steps, self.num_cars, flags, reward))
+        self.file.write(self.starts.tobytes())
+        self.file.write(self.actions)
+        if self.poses:
+            self.pose_values.tofile(self.file)
+        self.file.flush()
+        self.episode = None
+
+    def close(self):
+        """Close the log, keeping a started episode as an incomplete chunk."""
+        if self.episode is not None and self.actions:
+            self.end_episode(complete=False)
+        self.file.close()
+
+
+class TrajectoryLog:
+    """Read access to a log written by TrajectoryRecorder; episodes are indexed on open and loaded on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = {}
+        with open(path, "rb") as f:
+            self.header = read_header(f)
+            while True:
+                raw = f.read(EPISODE_HEADER.size)
+                if len(raw) < EPISODE_HEADER.size:
+                    break
+                episode, steps, num_cars, flags, reward = EPISODE_HEADER.unpack(raw)
+                size = steps * num_cars * (1 + (24 if flags & HAS_POSES else 0))
+                size += num_cars * 16 if flags & HAS_STARTS else 0
+                offset = f.tell()
+                if offset + size > os.fstat(f.fileno()).st_size:
+                    # Truncated by a crash mid-write
+                    break
+                # A resumed run records episodes again from its checkpoint; the latest take wins
+                self.chunks[episode] = (offset, steps, num_cars, flags, reward)
+                f.seek(size, os.SEEK_CUR)
+
+    @property
+    def episodes(self):
+        return sorted(self.chunks)
+
+    def info(self, episode):
+        _, steps, num_cars, flags, reward = self.chunks[episode]
+        return {"steps": steps, "num_cars": num_cars, "poses": bool(flags & HAS_POSES),
+                "complete": not flags & INCOMPLETE, "reward": reward}
+
+    def load(self, episode):
+        """
+        :return: (actions, poses, starts) of an episode: a (steps, num_cars) uint8 array with
+            NO_ACTION for cars that had stopped, a (steps, num_cars, 3) array or None, and the
+            cars' (num_cars, 2) previous positions at the start or None in older logs.
+        """
+        offset, steps, num_cars, flags, _ = self.chunks[episode]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            starts = None
+            if flags & HAS_STARTS:
+                starts = np.fromfile(f, dtype=np.float64, count=num_cars * 2).reshape(num_cars, 2)
+            actions = np.fromfile(f, dtype=np.uint8, count=steps * num_cars).reshape(steps, num_cars)
+            poses = None
+            if flags & HAS_POSES:
+                poses = np.fromfile(f, dtype=np.float64, count=steps * num_cars * 3).reshape(steps, num_cars, 3)
+        return actions, poses, starts
+
+
+def make_environment(header):
+    from environment import CarEnvironment, ParallelLearningCarEnvironment, PopulationCarEnvironment
+
+    if header["environment"] == "single":
+        return CarEnvironment()
+    if header["environment"] == "population":
+        return PopulationCarEnvironment(num_cars=header["num_cars"])
+    return ParallelLearningCarEnvironment(num_cars=header["num_cars"])
+
+
+class ReplayMismatch(Exception):
+    """A re-simulated episode left the recorded trajectory."""
+
+
+def replay_episode(env, actions, poses=None, on_step=None, starts=None):
+    """
+    Re-simulate one recorded episode from the environment's reset.
+    :param on_step: Called as on_step(step, step_actions) after each step, e.g. to draw it.
+    :param starts: The cars' recorded previous positions at the start of the episode. Without
+        them only a replay that follows the recorded episodes in order counts stuck steps right.
+    :return: Number of steps replayed.
+    :raises ReplayMismatch: When a pose differs from the recorded one, the set of driving
+        cars does not match the recorded actions, or a single car's episode ends early.
+    """
+    env.reset()
+    if starts is not None:
+        restore_previous_positions(env, starts)
+    single = hasattr(env, "player_car")
+    for step, row in enumerate(actions):
+        if single:
+            _, _, done = env.step(int(row[0]))
+            if done and step < len(actions) - 1:
+                raise ReplayMismatch(f"step {step}: the episode ended here, the log has {len(actions)} steps")
+        else:
+            recorded = np.flatnonzero(row != NO_ACTION).tolist()
+            if recorded != list(env.active_cars):
+                raise ReplayMismatch(f"step {step}: cars {recorded} were driving in the log, {list(env.active_cars)} now")
+            env.step(row[recorded].tolist())
+        if poses is not None:
+            current = car_poses(env)
+            if not np.array_equal(current, poses[step]):
+                car = int(np.flatnonzero((current != poses[step]).any(axis=1))[0])
+                raise ReplayMismatch(
+                    f"step {step}: car {car} is at {current[car].tolist()}, the log has {poses[step][car].tolist()}"
+                )
+        if on_step is not None:
+            on_step(step, row)
+    return len(actions)
+
+
+def windowed_replay(env, speed):
+    """on_step callback drawing every step in a window, at `speed` times the training frame rate (0 = no cap)."""
+    import pygame
+    from render import HudPanel, SceneRenderer, compose_background, track_layers
+    from viewer import car_snapshots, draw_snapshot
+
+    context = env.context
+    window = pygame.display.set_mode((context.width + 200, context.height))
+    pygame.display.set_caption("Trajectory Replay")
+    background = compose_background((context.width, context.height), track_layers(context, border=False))
+    renderer = SceneRenderer(window, background, overlay=context.track_border)
+    hud = HudPanel(window, (context.width, 0, 200, context.height), pygame.font.Font(None, 24), 25)
+    clock = pygame.time.Clock()
+    cars = [env.player_car] if hasattr(env, "player_car") else env.cars
+
+    def on_step(step, row):
+        driving = [car for car, action in zip(cars, row) if action != NO_ACTION]
+        snapshot = {
+            "cars": car_snapshots(driving, context),
+            "hud": [f"Step: {step}", f"Cars: {len(driving)}", f"Speed: x{speed:g}" if speed else "Speed: max"],
+            "action": int(row[0]) if len(cars) == 1 else None,
+        }
+        draw_snapshot(renderer, hud, context.car_rotations, snapshot)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                raise KeyboardInterrupt
+        if speed:
+            clock.tick(config.FPS * speed)
+
+    return on_step
+
+
+if __name__ == "__main__":
+    from game_utils import init_pygame
+
+    parser = argparse.ArgumentParser(description="List, verify or watch the episodes of a trajectory log.")
+    parser.add_argument("log", help="file written with train.py/parallel_train.py --record")
+    parser.add_argument("--episode", type=int, action="append",
+                        help="episode number to replay (repeatable; default: every episode)")
+    parser.add_argument("--list", action="store_true", help="only list the recorded episodes")
+    parser.add_argument("--render", action="store_true", help="draw the replay in a window")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="with --render, multiple of the training frame rate (0 = as fast as possible)")
+    args = parser.parse_args()
+
+    log = TrajectoryLog(args.log)
+    print(f"{args.log}: {log.header['environment']} run, {log.header['num_cars']} car(s), "
+          f"seed {log.header['seed']}, collision mode {log.header['collision_mode']}")
+    if args.list:
+        for episode in log.episodes:
+            info = log.info(episode)
+            print(f"episode {episode:6d}  steps {info['steps']:6d}  reward {info['reward']:10.2f}"
+                  f"{'  poses' if info['poses'] else ''}{'' if info['complete'] else '  incomplete'}")
+        raise SystemExit
+
+    # Collisions and rewards must be worked out the way they were while recording
+    apply_settings(log.header)
+    init_pygame(headless=not args.render)
+    env = make_environment(log.header)
+    on_step = windowed_replay(env, args.speed) if args.render else None
+    failures = 0
+    for episode in args.episode or log.episodes:
+        actions, poses, starts = log.load(episode)
+        start = time.perf_counter()
+        try:
+            steps = replay_episode(env, actions, poses, on_step, starts)
+        except ReplayMismatch as error:
+            failures += 1
+            print(f"episode {episode}: MISMATCH at {error}")
+            continue
+        except KeyboardInterrupt:
+            break
+        elapsed = time.perf_counter() - start
+        checked = "poses match" if poses is not None else "no poses recorded"
+        print(f"episode {episode}: {steps} steps in {elapsed:.2f}s ({steps / max(elapsed, 1e-9):.0f} steps/s), {checked}")
+    raise SystemExit(1 if failures else 0)
@@ -4,6 +4,12 @@ def discretize_state(value, min_value, max_value, num_bins):
     bin_size = (max_value - min_value) / num_bins
     return min(num_bins - 1, max(0, int((value - min_value) / bin_size)))
 
+def should_render(episode, step, headless, render_every_episodes, render_every_steps):
+    """Decide whether a training step is drawn (and frame-capped) or simulated as fast as possible."""
+    if headless and (render_every_episodes <= 0 or episode % render_every_episodes != 0):
+        return False
+    return step % max(1, render_every_steps) == 0
+
 def draw_actions(surface, action):
     key_surface = pygame.Surface((160, 160))
     key_surface.set_alpha(128)
@@ -0,0 +1,149 @@
+import multiprocessing as mp
+import numpy as np
+from q_table import STATE_BINS
+
+OBSERVATION_SIZE = len(STATE_BINS)
+
+
+def step_envs(envs, actions, observations, final_observations, rewards, dones):
+    """
+    Step every environment, resetting the ones that finish, and write the results in place.
+
+    `final_observations` receives the state each environment actually reached, which for a
+    finished environment is its terminal state, while `observations` already holds the
+    first state of its next episode.
+    """
+    for i, (env, action) in enumerate(zip(envs, actions)):
+        state, reward, done = env.step(int(action))
+        final_observations[i] = state
+        if done:
+            state = env.reset()
+        observations[i] = state
+        rewards[i] = reward
+        dones[i] = done
+
+
+def reset_envs(envs, observations):
+    for i, env in enumerate(envs):
+        observations[i] = env.reset()
+
+
+class SyncVectorEnv:
+    """
+    `num_envs` CarEnvironments stepped in this process behind a fixed-shape batch interface.
+
+    reset() returns an (num_envs, OBSERVATION_SIZE) int array; step(actions) returns the next
+    observations, rewards and dones as arrays of that length. Finished environments are
+    reset automatically, and the states they finished in are kept in final_observations.
+
+    Only independent single-car CarEnvironments are covered. The multi-car environments
+    used by parallel_train.py are out of scope: their cars share one episode, finished
+    cars drop out of the batch instead of resetting, and a new episode clones the best
+    car, so they do not fit a fixed-shape auto-resetting batch.
+    """
+
+    def __init__(self, num_envs, context=None):
+        from environment import CarEnvironment
+
+        self.num_envs = num_envs
+        self.envs = [CarEnvironment(context) for _ in range(num_envs)]
+        self.observations = np.zeros((num_envs, OBSERVATION_SIZE), dtype=np.int64)
+        self.final_observations = np.zeros((num_envs, OBSERVATION_SIZE), dtype=np.int64)
+        self.rewards = np.zeros(num_envs, dtype=np.float64)
+        self.dones = np.zeros(num_envs, dtype=bool)
+
+    def reset(self):
+        reset_envs(self.envs, self.observations)
+        return self.observations.copy()
+
+    def step(self, actions):
+        step_envs(self.envs, actions, self.observations, self.final_observations, self.rewards, self.dones)
+        return self.observations.copy(), self.rewards.copy(), self.dones.copy()
+
+    def close(self):
+        pass
+
+
+def run_worker(conn, start, end, observations, final_observations, rewards, dones):
+    """Own environments [start, end) of a SubprocVectorEnv and step them on request."""
+    from environment import CarEnvironment
+
+    envs = [CarEnvironment() for _ in range(start, end)]
+    observations = np.frombuffer(observations, dtype=np.int64).reshape(-1, OBSERVATION_SIZE)[start:end]
+    final_observations = np.frombuffer(final_observations, dtype=np.int64).reshape(-1, OBSERVATION_SIZE)[start:end]
+    rewards = np.frombuffer(rewards, dtype=np.float64)[start:end]
+    dones = np.frombuffer(dones, dtype=np.bool_)[start:end]
+    while True:
+        command, actions = conn.recv()
+        if command == "step":
+            step_envs(envs, actions, observations, final_observations, rewards, dones)
+        elif command == "reset":
+            reset_envs(envs, observations)
+        elif command == "close":
+            break
+        conn.send(None)
+    conn.close()
+
+
+class SubprocVectorEnv:
+    """
+    Same interface as SyncVectorEnv with the environments split across worker processes.
+
+    Workers write observations, rewards and dones straight into shared-memory arrays, so
+    only the actions and a completion signal go through the pipes.
+    """
+
+    def __init__(self, num_envs, num_workers=None):
+        self.num_envs = num_envs
+        num_workers = min(num_envs, num_workers or mp.cpu_count())
+        shared_observations = mp.RawArray("q", num_envs * OBSERVATION_SIZE)
+        shared_final_observations = mp.RawArray("q", num_envs * OBSERVATION_SIZE)
+        shared_rewards = mp.RawArray("d", num_envs)
+        shared_dones = mp.RawArray("b", num_envs)
+        self.observations = np.frombuffer(shared_observations, dtype=np.int64).reshape(num_envs, OBSERVATION_SIZE)
+        self.final_observations = np.frombuffer(shared_final_observations, dtype=np.int64).reshape(num_envs, OBSERVATION_SIZE)
+        self.rewards = np.frombuffer(shared_rewards, dtype=np.float64)
+        self.dones = np.frombuffer(shared_dones, dtype=np.bool_)
+
+        bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+        self.slices = list(zip(bounds[:-1], bounds[1:]))
+        self.connections = []
+        self.workers = []
+        for start, end in self.slices:
+            parent_conn, child_conn = mp.Pipe()
+            worker = mp.Process(
+                target=run_worker,
+                args=(child_conn, start, end, shared_observations, shared_final_observations, shared_rewards, shared_dones),
+                daemon=True,
+            )
+            worker.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.workers.append(worker)
+
+    def send_all(self, command, actions=None):
+        for conn, (start, end) in zip(self.connections, self.slices):
+            conn.send((command, None if actions is None else actions[start:end]))
+        for conn in self.connections:
+            conn.recv()
+
+    def reset(self):
+        self.send_all("reset")
+        return self.observations.copy()
+
+    def step(self, actions):
+        self.send_all("step", np.asarray(actions))
+        return self.observations.copy(), self.rewards.copy(), self.dones.copy()
+
+    def close(self):
+        for conn in self.connections:
+            conn.send(("close", None))
+        for worker in self.workers:
+            worker.join()
+
+
+def make_vector_env(num_envs, backend="sync"):
+    """Build a vector environment with the "sync" (in-process) or "subproc" backend."""
+    if backend == "subproc":
+        return SubprocVectorEnv(num_envs)
+    return SyncVectorEnv(num_envs)
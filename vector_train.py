@@ -0,0 +1,58 @@
+import argparse
+import os
+import pickle
+from datetime import datetime
+import numpy as np
+import config
+from q_table import DenseQTable
+from vector_env import make_vector_env
+
+ACTION_SPACE = [0, 1, 2, 3, 4]
+
+
+def train(num_envs=8, backend="sync", num_episodes=config.NUM_EPISODES, seed=0):
+    """Train one dense Q-table on a batch of auto-resetting environments, whatever the backend."""
+    env = make_vector_env(num_envs, backend)
+    table = DenseQTable(len(ACTION_SPACE), config.DEFAULT_Q_VALUE)
+    rng = np.random.default_rng(seed)
+    epsilon = config.EPSILON
+
+    rewards = []
+    episode_rewards = np.zeros(num_envs)
+    observations = env.reset()
+    try:
+        while len(rewards) < num_episodes:
+            rows = table.state_indices(observations)
+            actions = table.best_actions(rows)
+            explore = rng.random(num_envs) < epsilon
+            actions[explore] = rng.integers(len(ACTION_SPACE), size=explore.sum())
+
+            observations, step_rewards, dones = env.step(actions)
+            next_rows = table.state_indices(env.final_observations)
+            table.update(rows, actions, step_rewards, next_rows, config.LEARNING_RATE, config.DISCOUNT_FACTOR)
+
+            episode_rewards += step_rewards
+            for i in np.flatnonzero(dones):
+                rewards.append(episode_rewards[i])
+                print(f"Episode {len(rewards)}, Env {i}, Total Reward: {episode_rewards[i]:.2f}")
+                epsilon = max(0.01, epsilon * 0.995)
+            episode_rewards[dones] = 0
+    finally:
+        env.close()
+
+    if not os.path.exists("models"):
+        os.makedirs("models")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    with open(f"models/q_table_final_{timestamp}.pkl", "wb") as f:
+        pickle.dump(table.to_dict(), f)
+    return rewards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a Q-table on a vectorised environment.")
+    parser.add_argument("--num-envs", type=int, default=8)
+    parser.add_argument("--backend", choices=["sync", "subproc"], default="sync")
+    parser.add_argument("--episodes", type=int, default=config.NUM_EPISODES)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    train(num_envs=args.num_envs, backend=args.backend, num_episodes=args.episodes, seed=args.seed)
@@ -0,0 +1,149 @@
+import math
+import multiprocessing as mp
+import os
+import queue
+import signal
+import pygame
+import config
+from render import HudPanel, SceneRenderer, action_keys, compose_background, track_layers
+
+RAY_ANGLES = range(0, 360, 45)
+RAY_COLOR = (192, 235, 166)
+
+
+def car_snapshots(cars, context):
+    """Pose of each car plus its eight border distances, as drawn by the viewer."""
+    rays = context.border_sensor.cast([car.rect.center for car in cars], RAY_ANGLES).tolist()
+    return [(car.x, car.y, car.angle, car_rays) for car, car_rays in zip(cars, rays)]
+
+
+def draw_snapshot(renderer, hud, rotations, snapshot):
+    """Draw one snapshot: cars with their rays over the cached track, and the HUD panel on the right."""
+    renderer.begin()
+    for x, y, angle, rays in snapshot["cars"]:
+        for ray_angle, distance in zip(RAY_ANGLES, rays):
+            end_x = x + distance * math.cos(math.radians(ray_angle))
+            end_y = y + distance * math.sin(math.radians(ray_angle))
+            renderer.line(RAY_COLOR, (int(x), int(y)), (int(end_x), int(end_y)), 1)
+        image, _ = rotations.get(angle)
+        renderer.blit(image, image.get_rect(center=(x, y)).topleft)
+
+    images = []
+    if snapshot.get("action") is not None:
+        images.append((action_keys(snapshot["action"]), (20, hud.rect.height - 180)))
+    lines = [(text, (0, 255, 0) if "Best" in text else (255, 255, 255)) for text in snapshot["hud"]]
+    renderer.finish(hud.update(lines, images))
+
+
+def run_viewer(snapshots, title, video_driver):
+    """Viewer process: show the newest snapshot each frame until the window is closed."""
+    from ai_game import get_context
+
+    # A training run with no window of its own may have switched its driver to "dummy"
+    if video_driver is None:
+        os.environ.pop("SDL_VIDEODRIVER", None)
+    else:
+        os.environ["SDL_VIDEODRIVER"] = video_driver
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pygame.init()
+    context = get_context()
+    window = pygame.display.set_mode((context.width + 200, context.height))
+    pygame.display.set_caption(title)
+    font = pygame.font.Font(None, 24)
+    clock = pygame.time.Clock()
+    background = compose_background((context.width, context.height), track_layers(context, border=False))
+    renderer = SceneRenderer(window, background, overlay=context.track_border)
+    hud = HudPanel(window, (context.width, 0, 200, context.height), font, 25)
+
+    snapshot = None
+    while True:
+        # Skip straight to the newest snapshot; anything older is already stale
+        try:
+            while True:
+                snapshot = snapshots.get_nowait()
+        except queue.Empty:
+            pass
+        if snapshot is not None:
+            draw_snapshot(renderer, hud, context.car_rotations, snapshot)
+            snapshot = None
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                pygame.quit()
+                return
+        clock.tick(config.FPS)
+
+
+class RemoteViewer:
+    """
+    Training-side handle on a viewer running in its own process.
+
+    Snapshots go through a small bounded queue with put_nowait, so when the viewer
+    falls behind, frames are dropped instead of the learner waiting. Closing the
+    viewer window only ends the viewer; attach() starts a new one, and on POSIX
+    sending the training process SIGUSR1 asks for that at the next episode.
+    """
+
+    def __init__(self, title="RL Car Racing Game", max_queued=2):
+        self.title = title
+        self.max_queued = max_queued
+        # Remember the driver before training switches this process to "dummy"
+        self.video_driver = os.environ.get("SDL_VIDEODRIVER")
+        self.context = mp.get_context("spawn")
+        self.process = None
+        self.snapshots = None
+        self.sent = 0
+        self.dropped = 0
+        self.attach_requested = False
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.request_attach)
+
+    def request_attach(self, signum=None, frame=None):
+        self.attach_requested = True
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def attach(self):
+        if self.alive:
+            return
+        self.snapshots = self.context.Queue(maxsize=self.max_queued)
+        self.process = self.context.Process(
+            target=run_viewer, args=(self.snapshots, self.title, self.video_driver), daemon=True
+        )
+        self.process.start()
+
+    def poll(self):
+        """Start a viewer if one was requested since the last call."""
+        if self.attach_requested:
+            self.attach_requested = False
+            self.attach()
+
+    def wants_frame(self):
+        """Whether a snapshot would be shown; lets callers skip building ones that would be dropped."""
+        if not self.alive:
+            return False
+        if self.snapshots.full():
+            self.dropped += 1
+            return False
+        return True
+
+    def publish(self, snapshot):
+        if not self.alive:
+            return False
+        try:
+            self.snapshots.put_nowait(snapshot)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.sent += 1
+        return True
+
+    def close(self):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.snapshots.cancel_join_thread()
+        self.process = None